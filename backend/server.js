@@ -3,6 +3,7 @@ require('dotenv').config();
 const express = require('express');
 const http = require('http');
 const axios = require('axios');
+const crypto = require('crypto');
 const cors = require('cors');
 const mongoose = require('mongoose');
 const { Server } = require('socket.io');
@@ -33,6 +34,8 @@ const io = new Server(server, {
 
 const PORT = process.env.PORT || 5001;
 const PY_API = process.env.PY_API || 'http://localhost:8000/analyze';
+// Snapshots slower than this log the AI server's Server-Timing breakdown
+const SLOW_SNAPSHOT_MS = parseInt(process.env.SLOW_SNAPSHOT_MS, 10) || 2000;
 const MONGO_URI = process.env.MONGO_URI || '';
 
 /* ---------- MongoDB Model ---------- */
@@ -470,8 +473,18 @@ async function processSnapshot(data, socket) {
   processing.set(studentId, true);
   try {
     // Optimized timeout for better balance (20s for higher quality images)
-    const resp = await axios.post(PY_API, { image, studentId, name, classId }, { timeout: 20000 });
+    const requestId = crypto.randomUUID();
+    const sentAt = Date.now();
+    const resp = await axios.post(PY_API, { image, studentId, name, classId }, {
+      timeout: 20000,
+      headers: { 'X-Request-ID': requestId }
+    });
     const result = resp.data || {};
+    const elapsedMs = Date.now() - sentAt;
+    if (elapsedMs > SLOW_SNAPSHOT_MS) {
+      console.warn(`[processSnapshot] slow snapshot ${elapsedMs}ms class=${classId} student=${studentId} ` +
+        `request=${requestId} server-timing: ${resp.headers['server-timing'] || 'n/a'}`);
+    }
     
     // Check if API returned an error
     if (result.success === false) {
@@ -479,6 +492,13 @@ async function processSnapshot(data, socket) {
       socket.emit('snapshot_ack', { status: 'error', reason: result.error || 'AI server error' });
       return;
     }
+
+    // Rejected by the AI server's quality gate (dark, blurred, covered...):
+    // nothing was inferred, so don't record a neutral reading for it
+    if (result.quality && result.quality.ok === false) {
+      socket.emit('snapshot_ack', { status: 'skipped', reason: result.quality.reason, nextSnapshotMs: result.next_snapshot_ms });
+      return;
+    }
     
     const sid = result.studentId || studentId;
     let emotion = (result.emotion || 'neutral').toLowerCase();  // Default to neutral instead of unknown
@@ -515,7 +535,7 @@ async function processSnapshot(data, socket) {
       confidence = 0.1;
     }
     
-    // Get source from result (openface or facenet512)
+    // Get source from result (the engine that produced the answer)
     const source = result.source || 'py-model';
     
     // Use confidence-weighted engagement calculation
@@ -565,10 +585,24 @@ async function processSnapshot(data, socket) {
       confusionLevel,  // Include confusion level
       timestamp: new Date(), 
       box: result.box || null,
-      source: source  // Include source (openface or facenet512)
+      source: source  // Include source (engine that produced the answer)
     });
-    socket.emit('snapshot_ack', { status: 'ok' });
+    // The AI server paces each student: stable expressions and a busy server mean fewer snapshots
+    socket.emit('snapshot_ack', { status: 'ok', nextSnapshotMs: result.next_snapshot_ms });
   } catch (err) {
+    // A newer frame from the same student replaced this one before it was analysed
+    if (err.response && err.response.status === 409) {
+      socket.emit('snapshot_ack', { status: 'skipped', reason: 'superseded' });
+      return;
+    }
+    // AI server shed load (429 queue full / 503 busy or warming up): tell the client when to retry
+    if (err.response && (err.response.status === 429 || err.response.status === 503)) {
+      const retryAfterS = parseInt(err.response.headers['retry-after'], 10) || 1;
+      const reason = (err.response.data && err.response.data.reason) || 'busy';
+      console.warn(`[processSnapshot] AI server busy (${reason}), retry after ${retryAfterS}s`);
+      socket.emit('snapshot_ack', { status: 'busy', reason, retryAfterMs: retryAfterS * 1000 });
+      return;
+    }
     console.error('[processSnapshot] error', err.message || err);
     // Log more details for debugging
     if (err.response) {
@@ -85,6 +85,12 @@ let stream = null;
 let interval = null;
 let videoStreamInterval = null;
 let detectionEnabled = false;
+let snapshotPausedUntil = 0;  // AI server asked us to back off until this time (ms)
+// Snapshots are considered every SNAPSHOT_TICK_MS and sent when due: by default
+// every DEFAULT_SNAPSHOT_MS, or after the AI server's nextSnapshotMs hint
+const SNAPSHOT_TICK_MS = 250;
+const DEFAULT_SNAPSHOT_MS = 800;
+let nextSnapshotAt = 0;
 let cameraEnabled = false;
 
 // load student info - support both unified and old format
@@ -463,6 +469,9 @@ function sendVideoStream() {
 // Higher resolution for better detection accuracy
 function sendSnapshot() {
     if (!stream || !detectionEnabled) return;
+    const now = Date.now();
+    if (now < snapshotPausedUntil || now < nextSnapshotAt) return;
+    nextSnapshotAt = now + DEFAULT_SNAPSHOT_MS;
 
     const canvas = document.createElement("canvas");
     const video = document.getElementById("localVideo");
@@ -511,6 +520,16 @@ function sendSnapshot() {
     });
 }
 
+// Server overloaded: skip snapshots until it says to retry.
+// Otherwise follow its pacing hint for the next one.
+socket.on("snapshot_ack", (data) => {
+    if (data && data.status === "busy") {
+        snapshotPausedUntil = Date.now() + (data.retryAfterMs || 1000);
+    } else if (data && data.nextSnapshotMs > 0) {
+        nextSnapshotAt = Date.now() + data.nextSnapshotMs;
+    }
+});
+
 socket.on("join_ack", (data) => {
     const statusEl = document.getElementById("statusText");
     
@@ -557,9 +576,10 @@ socket.on("detection_started", (data) => {
             if (videoStreamInterval) clearInterval(videoStreamInterval);
             videoStreamInterval = setInterval(sendVideoStream, 100);  // Reduced from 150ms for lower latency
             
-        // Start sending detection snapshots (every 800ms for faster detection with good accuracy)
+        // Start sending detection snapshots (every 800ms unless the AI server paces us)
         if (interval) clearInterval(interval);
-        interval = setInterval(sendSnapshot, 800);  // Reduced from 1200ms for faster detection
+        nextSnapshotAt = 0;
+        interval = setInterval(sendSnapshot, SNAPSHOT_TICK_MS);
         }
 });
 
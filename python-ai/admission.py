@@ -0,0 +1,155 @@
+# admission.py
+# Bounded admission in front of a fixed inference executor: queue a little, reject the rest fast
+
+import asyncio
+import math
+import time
+from collections import deque
+import numpy as np
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing more work; carries the HTTP status and a Retry-After hint"""
+
+    def __init__(self, status, reason, retry_after_s):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+
+class AdmissionQueue:
+    """
+    At most `workers` jobs run on the executor and at most `max_queue` wait.
+
+    A request that finds the queue full is rejected with 429 before any work
+    is done. One that waits longer than `max_wait_ms` for a slot is rejected
+    with 503: its caller is about to give up anyway, and the slot is better
+    spent on fresher work. A job given a `deadline` that it cannot start by
+    is dropped the same way, as 'deadline_expired'. All carry a Retry-After
+    estimate of how long the current backlog takes to drain.
+
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, executor, workers, max_queue=32, max_wait_ms=5000.0, alpha=0.2):
+        self.executor = executor
+        self.workers = max(1, int(workers))
+        self.max_queue = max(0, int(max_queue))
+        self.max_wait_ms = float(max_wait_ms)
+        self.alpha = float(alpha)
+        self._slots = None
+        self._loop = None
+        self._waits = deque(maxlen=1000)
+
+        self.waiting = 0
+        self.running = 0
+        self.accepted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = {'queue_full': 0, 'queue_timeout': 0, 'deadline_expired': 0}
+        self.service_ms = None  # EWMA of executor time per job
+
+    def retry_after_s(self):
+        service_s = (self.service_ms or 1000.0) / 1000.0
+        backlog = self.waiting + self.running
+        return max(1, math.ceil(backlog * service_s / self.workers))
+
+    def check(self):
+        """Raise Overloaded when the queue is already full; cheap enough to call before reading the body."""
+        if self.waiting >= self.max_queue:
+            self.rejected['queue_full'] += 1
+            raise Overloaded(429, 'queue_full', self.retry_after_s())
+
+    async def run(self, fn, *args, deadline=None, on_start=None, on_finish=None):
+        """
+        Run fn(*args) on the executor once a slot is free, or raise Overloaded.
+
+        deadline: perf_counter() time after which the job must not start
+        on_start: called once the job has its slot, just before it is submitted;
+            if it raises, the slot is released and the job does not run
+        on_finish: called once for every job that got past on_start, when it
+            has really finished (or failed to submit), even if the caller was
+            cancelled while it ran
+        """
+        self.check()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+            self._loop = asyncio.get_running_loop()
+
+        t0 = time.perf_counter()
+        timeout = self.max_wait_ms / 1000.0
+        expires = deadline is not None and deadline - t0 < timeout
+        if expires:
+            timeout = deadline - t0
+            if timeout <= 0:
+                self.rejected['deadline_expired'] += 1
+                raise Overloaded(503, 'deadline_expired', self.retry_after_s())
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            reason = 'deadline_expired' if expires else 'queue_timeout'
+            self.rejected[reason] += 1
+            raise Overloaded(503, reason, self.retry_after_s())
+        finally:
+            self.waiting -= 1
+        self._waits.append((time.perf_counter() - t0) * 1000.0)
+        if on_start is not None:
+            try:
+                on_start()
+            except BaseException:
+                self._slots.release()
+                raise
+
+        self.accepted += 1
+        self.running += 1
+        started = time.perf_counter()
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self.running -= 1
+            self._slots.release()
+            if on_finish is not None:
+                on_finish()
+            raise
+        # The slot is released when the job really finishes, even if the
+        # request that queued it is cancelled meanwhile
+        future.add_done_callback(
+            lambda f: self._loop.call_soon_threadsafe(self._finished, f, started, on_finish))
+        return await asyncio.wrap_future(future)
+
+    def _finished(self, future, started, on_finish=None):
+        ms = (time.perf_counter() - started) * 1000.0
+        self.service_ms = ms if self.service_ms is None else self.service_ms + self.alpha * (ms - self.service_ms)
+        if future.cancelled() or future.exception() is not None:
+            self.failed += 1
+        else:
+            self.completed += 1
+        self.running -= 1
+        self._slots.release()
+        if on_finish is not None:
+            on_finish()
+
+    def stats(self):
+        waits = np.fromiter(self._waits, dtype=np.float64) if self._waits else None
+        return {
+            'workers': self.workers,
+            'max_queue': self.max_queue,
+            'max_wait_ms': self.max_wait_ms,
+            'queue_depth': self.waiting,
+            'running': self.running,
+            'accepted': self.accepted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': dict(self.rejected),
+            'rejected_total': sum(self.rejected.values()),
+            'wait_ms': {
+                'p50': round(float(np.percentile(waits, 50)), 2),
+                'p95': round(float(np.percentile(waits, 95)), 2),
+                'max': round(float(waits.max()), 2),
+            } if waits is not None else None,
+            'service_ms': round(self.service_ms, 2) if self.service_ms is not None else None,
+            'retry_after_s': self.retry_after_s(),
+        }
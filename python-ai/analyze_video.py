@@ -0,0 +1,329 @@
+# analyze_video.py
+# Score a recorded lecture offline: reader -> detection/inference -> writer threads, per-second emotion timeline
+#
+# Usage:
+#   python analyze_video.py lecture.mp4 --out timeline.csv
+#   python analyze_video.py lecture.mp4 --out timeline.parquet --sample-fps 2 --batch-size 32
+#   EMOTION_ENGINE=onnx python analyze_video.py lecture.mp4 --out timeline.csv
+#
+# The stages are connected by small bounded queues, so memory stays flat
+# whatever the length of the video: the reader blocks when inference falls
+# behind, and only face crops (not frames) wait for a batch to fill.
+# Parquet output needs pyarrow.
+
+import argparse
+import csv
+import os
+import queue
+import threading
+import time
+import numpy as np
+import cv2
+from emotion_engine import EMOTION_LABELS, create_engine
+
+HAAR_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+TIMELINE_COLUMNS = ['second', 'frames', 'faces', 'max_faces', 'dominant', 'confidence'] + EMOTION_LABELS
+_DONE = object()
+
+
+class PipelineStopped(Exception):
+    pass
+
+
+class VideoPipeline:
+    """
+    Three threads over one video file.
+
+    reader     decodes with cv2.VideoCapture, keeping one frame per 1/sample_fps
+               seconds (the others are only grabbed, not converted)
+    inference  Haar face detection per frame, face crops classified in
+               batches of batch_size with the configured emotion engine
+    writer     folds results into one timeline row per second of video
+    """
+
+    def __init__(self, path, engine, sample_fps=2.0, batch_size=32, max_width=640, min_face=40,
+                 queue_size=16):
+        self.path = path
+        self.engine = engine
+        self.sample_fps = float(sample_fps)
+        self.batch_size = max(1, int(batch_size))
+        self.max_width = int(max_width)
+        self.min_face = int(min_face)
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.results = queue.Queue(maxsize=queue_size)
+        self.stop = threading.Event()
+        self.errors = []
+
+        self.source_fps = None
+        self.total_frames = None
+        self.decoded = 0
+        self.sampled = 0
+        self.faces = 0
+        self.batches = 0
+        self.inference_s = 0.0
+        self.seconds_written = 0
+
+    # Queue helpers that give up when another stage has failed
+
+    def _put(self, q, item):
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                continue
+        raise PipelineStopped()
+
+    def _get(self, q):
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=0.2)
+            except queue.Empty:
+                continue
+        raise PipelineStopped()
+
+    def _stage(self, fn, *args):
+        def run():
+            try:
+                fn(*args)
+            except PipelineStopped:
+                pass
+            except Exception as e:
+                self.errors.append(e)
+                self.stop.set()
+        return threading.Thread(target=run, name=fn.__name__, daemon=True)
+
+    # Stages
+
+    def read_frames(self):
+        cap = cv2.VideoCapture(self.path)
+        if not cap.isOpened():
+            raise IOError(f"Could not open video {self.path}")
+        try:
+            self.source_fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+            count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            self.total_frames = count if count > 0 else None
+            step = max(1, round(self.source_fps / self.sample_fps)) if self.sample_fps > 0 else 1
+            index = 0
+            while not self.stop.is_set():
+                if index % step:
+                    if not cap.grab():
+                        break
+                else:
+                    ok, frame = cap.read()
+                    if not ok:
+                        break
+                    height, width = frame.shape[:2]
+                    if self.max_width and width > self.max_width:
+                        scale = self.max_width / width
+                        frame = cv2.resize(frame, (self.max_width, int(height * scale)), interpolation=cv2.INTER_AREA)
+                    self._put(self.frames, (index / self.source_fps, frame))
+                    self.sampled += 1
+                index += 1
+                self.decoded = index
+        finally:
+            cap.release()
+        self._put(self.frames, _DONE)
+
+    def _detect(self, cascade, frame):
+        gray = cv2.equalizeHist(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+        boxes = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=4,
+                                         minSize=(self.min_face, self.min_face))
+        # Copies, so the frame itself can be freed while the crop waits for its batch
+        return [frame[y:y + h, x:x + w].copy() for (x, y, w, h) in boxes]
+
+    def _flush(self, pending, crops):
+        """Classify the waiting crops and hand every pending frame to the writer, in order"""
+        probs = []
+        if crops:
+            t0 = time.perf_counter()
+            predictions = self.engine.predict_batch(crops)
+            self.inference_s += time.perf_counter() - t0
+            self.batches += 1
+            probs = [[p.get(label, 0.0) for label in EMOTION_LABELS] for p in predictions]
+        offset = 0
+        for timestamp, count in pending:
+            self._put(self.results, (timestamp, count, probs[offset:offset + count]))
+            offset += count
+
+    def infer(self):
+        cascade = cv2.CascadeClassifier(HAAR_CASCADE_PATH)
+        pending, crops = [], []
+        while True:
+            item = self._get(self.frames)
+            if item is _DONE:
+                break
+            timestamp, frame = item
+            faces = self._detect(cascade, frame)
+            pending.append((timestamp, len(faces)))
+            crops.extend(faces)
+            self.faces += len(faces)
+            if len(crops) >= self.batch_size:
+                self._flush(pending, crops)
+                pending, crops = [], []
+        self._flush(pending, crops)
+        self._put(self.results, _DONE)
+
+    def write_timeline(self, sink):
+        second, frames, faces, max_faces, sums = None, 0, 0, 0, np.zeros(len(EMOTION_LABELS))
+
+        def emit():
+            mean = sums / faces if faces else np.zeros(len(EMOTION_LABELS))
+            best = int(mean.argmax())
+            row = {
+                'second': second,
+                'frames': frames,
+                'faces': faces,
+                'max_faces': max_faces,
+                'dominant': EMOTION_LABELS[best] if faces else '',
+                'confidence': round(float(mean[best]), 2) if faces else None,
+            }
+            row.update({label: round(float(value), 2) for label, value in zip(EMOTION_LABELS, mean)})
+            sink.write(row)
+            self.seconds_written += 1
+
+        while True:
+            item = self._get(self.results)
+            if item is _DONE:
+                break
+            timestamp, count, probs = item
+            current = int(timestamp)
+            if current != second:
+                if second is not None:
+                    emit()
+                second, frames, faces, max_faces = current, 0, 0, 0
+                sums = np.zeros(len(EMOTION_LABELS))
+            frames += 1
+            faces += count
+            max_faces = max(max_faces, count)
+            if probs:
+                sums += np.asarray(probs).sum(axis=0)
+        if second is not None:
+            emit()
+
+    def run(self, sink, progress_s=5.0):
+        threads = [self._stage(self.read_frames), self._stage(self.infer), self._stage(self.write_timeline, sink)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            last = started
+            while any(thread.is_alive() for thread in threads):
+                threads[-1].join(timeout=0.5)
+                if progress_s and time.perf_counter() - last >= progress_s:
+                    last = time.perf_counter()
+                    print(self.progress(last - started))
+        except KeyboardInterrupt:
+            self.stop.set()
+            raise
+        finally:
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+        if self.errors:
+            raise self.errors[0]
+        return self.summary(time.perf_counter() - started)
+
+    def progress(self, elapsed):
+        done = f"{self.decoded}/{self.total_frames}" if self.total_frames else str(self.decoded)
+        return (f"  {done} frames decoded, {self.sampled} sampled, {self.faces} faces, "
+                f"{self.seconds_written} s written ({self.sampled / max(elapsed, 1e-9):.1f} sampled fps)")
+
+    def summary(self, elapsed):
+        video_s = self.decoded / self.source_fps if self.source_fps else 0.0
+        return {
+            'video_s': round(video_s, 1),
+            'wall_s': round(elapsed, 2),
+            'realtime_factor': round(video_s / elapsed, 2) if elapsed else None,
+            'decoded_frames': self.decoded,
+            'sampled_frames': self.sampled,
+            'faces': self.faces,
+            'batches': self.batches,
+            'decode_fps': round(self.decoded / elapsed, 1),
+            'sampled_fps': round(self.sampled / elapsed, 1),
+            'faces_per_s': round(self.faces / elapsed, 1),
+            'inference_s': round(self.inference_s, 2),
+            'timeline_seconds': self.seconds_written,
+        }
+
+
+class CsvSink:
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=TIMELINE_COLUMNS)
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    """Buffers a minute of rows at a time and writes each as a row group"""
+
+    def __init__(self, path, rows_per_group=60):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow (or write .csv)")
+        self.pa = pa
+        self.schema = pa.schema(
+            [('second', pa.int64()), ('frames', pa.int32()), ('faces', pa.int32()), ('max_faces', pa.int32()),
+             ('dominant', pa.string()), ('confidence', pa.float32())]
+            + [(label, pa.float32()) for label in EMOTION_LABELS])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.rows_per_group = rows_per_group
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.rows_per_group:
+            self._flush()
+
+    def _flush(self):
+        if self.rows:
+            self.writer.write_table(self.pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+def open_sink(path):
+    if os.path.splitext(path)[1].lower() == '.parquet':
+        return ParquetSink(path)
+    return CsvSink(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-second emotion timeline for a recorded video')
+    parser.add_argument('video')
+    parser.add_argument('--out', default=None, help='timeline .csv or .parquet (default: <video>.emotions.csv)')
+    parser.add_argument('--sample-fps', type=float, default=2.0, help='frames analysed per second of video (0: all)')
+    parser.add_argument('--batch-size', type=int, default=32, help='face crops per inference batch')
+    parser.add_argument('--max-width', type=int, default=640, help='downscale wider frames before detection')
+    parser.add_argument('--min-face', type=int, default=40, help='smallest face in pixels after downscaling')
+    parser.add_argument('--engine', default=None, help='deepface, onnx or torch (default: EMOTION_ENGINE)')
+    args = parser.parse_args()
+
+    out = args.out or os.path.splitext(args.video)[0] + '.emotions.csv'
+    engine = create_engine(args.engine)
+    print(f"Analysing {args.video} with the {engine.name} engine at {args.sample_fps:g} fps -> {out}")
+    sink = open_sink(out)
+    pipeline = VideoPipeline(args.video, engine, sample_fps=args.sample_fps, batch_size=args.batch_size,
+                             max_width=args.max_width, min_face=args.min_face)
+    try:
+        summary = pipeline.run(sink)
+    finally:
+        sink.close()
+    print(f"✓ {summary['timeline_seconds']} timeline rows written to {out}")
+    for key, value in summary.items():
+        print(f"  {key:<18} {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,189 +1,502 @@
 # python-ai/api_server.py
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import numpy as np, cv2, base64, time, traceback
-from deepface import DeepFace
-import os
+import cv2, time, traceback
+import os, threading
+from concurrent.futures import ThreadPoolExecutor
+from emotion_engine import EMOTION_LABELS, create_engine, detect_face
+from warmup import ModelWarmup, synthetic_frame
+from frame_io import decode_frame, read_frame_request
+from face_tracker import FaceTracker
+from frame_cache import FrameCache
+from face_detection import ThumbnailFaceDetector
+from snapshot_pacing import SnapshotPacer
+from student_state import create_student_state
+import metrics
+import profiler
+import server_timing
 
 app = Flask(__name__)
 CORS(app)
+# GET /metrics: per-stage latency histograms, no-face and error counts
+metrics.instrument_flask(app)
+# Server-Timing and X-Request-ID on /analyze responses
+server_timing.instrument_flask(app)
+# POST /admin/profile?seconds=N: sampling profile as collapsed stacks (needs ADMIN_TOKEN)
+profiler.register_flask(app)
 
-# Use OpenCV Haar cascade for quick face detection
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+# Use OpenCV Haar cascade for quick face detection.
+# CascadeClassifier is not safe to share between threads, so the request and
+# batch threads each load their own copy.
+HAAR_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+_thread_local = threading.local()
+
+def get_face_cascade():
+    cascade = getattr(_thread_local, 'face_cascade', None)
+    if cascade is None:
+        cascade = _thread_local.face_cascade = cv2.CascadeClassifier(HAAR_CASCADE_PATH)
+    return cascade
+
+# Haar runs on a FACE_THUMB_SIZE grayscale thumbnail with a coarser pyramid and
+# boxes are mapped back to full resolution; FACE_DETECTOR=legacy scans the full
+# frame at scaleFactor 1.05 as before (bench_face_detection.py compares them)
+FACE_DETECTOR = os.environ.get('FACE_DETECTOR', 'thumbnail')
+thumbnail_detector = ThumbnailFaceDetector(
+    thumb_size=int(os.environ.get('FACE_THUMB_SIZE', 400)),
+    scale_factor=float(os.environ.get('FACE_SCALE_FACTOR', 1.1)),
+    min_neighbors=int(os.environ.get('FACE_MIN_NEIGHBORS', 3))
+)
 
 # Configure DeepFace backend and model for better accuracy
 # Try to use the most accurate backend available
 DEEPFACE_BACKEND = 'opencv'  # or 'ssd', 'dlib', 'mtcnn', 'retinaface'
 DEEPFACE_MODEL = 'VGG-Face'  # Emotion model is built-in, this is for face recognition if needed
 
+# Per-student tracking: the Haar cascade first searches around the last face
+face_tracker = FaceTracker(
+    expand=float(os.environ.get('TRACKER_EXPAND', 0.5)),
+    refresh_every=int(os.environ.get('TRACKER_REFRESH_EVERY', 10))
+)
+
+# Frame dedup: a near-identical frame (dHash within FRAME_CACHE_DISTANCE bits)
+# reuses the student's last result for up to FRAME_CACHE_TTL_S seconds
+frame_cache = FrameCache(
+    max_entries=int(os.environ.get('FRAME_CACHE_ENTRIES', 10000)),
+    ttl_s=float(os.environ.get('FRAME_CACHE_TTL_S', 5)),
+    max_distance=int(os.environ.get('FRAME_CACHE_DISTANCE', 4))
+)
+
+# EMOTION_ENGINE selects the classifier behind every endpoint: deepface
+# (default), onnx or torch. /analyze_batch classifies all its faces in one forward pass.
+emotion_engine = create_engine()
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 64))
+# /analyze_classroom: every face in a room-camera frame, smaller faces allowed
+CLASSROOM_MIN_FACE = int(os.environ.get('CLASSROOM_MIN_FACE', 30))
+CLASSROOM_MAX_FACES = int(os.environ.get('CLASSROOM_MAX_FACES', 64))
+batch_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('BATCH_WORKERS', 16)), thread_name_prefix='analyze-batch')
+
+# next_snapshot_ms in /analyze and /analyze_batch results, as in
+# api_server_hybrid: SNAPSHOT_MIN_MS right after a student's emotion changes,
+# up to SNAPSHOT_MAX_MS once it has held for SNAPSHOT_STABLE_S, and never
+# sooner than this process can clear its backlog
+snapshot_pacer = SnapshotPacer(
+    min_ms=float(os.environ.get('SNAPSHOT_MIN_MS', 500)),
+    max_ms=float(os.environ.get('SNAPSHOT_MAX_MS', 5000)),
+    stable_s=float(os.environ.get('SNAPSHOT_STABLE_S', 60)),
+    parallelism=int(os.environ.get('SNAPSHOT_PARALLELISM', 0)) or None
+)
+# This server reports unsmoothed labels; a window of 1 only tracks how long
+# each student's emotion has held, for the pacer
+emotion_history = create_student_state(window=1, labels=EMOTION_LABELS)
+
+def paced(studentId, result, fresh=True):
+    """result plus next_snapshot_ms; `fresh` results (not served from the frame cache) update the student's history."""
+    if fresh and result.get('emotion'):
+        emotion_history.push(studentId, result['emotion'], result.get('confidence'))
+    return dict(result, next_snapshot_ms=snapshot_pacer.hint(emotion_history.stable_for(studentId)))
+
 def decode_b64_image(b64):
     """Decode data URL or raw base64 string into OpenCV BGR image."""
     if not b64:
         return None
-    if ',' in b64:
-        b64 = b64.split(',', 1)[1]
-    try:
-        img_bytes = base64.b64decode(b64)
-        arr = np.frombuffer(img_bytes, dtype=np.uint8)
-        img = cv2.imdecode(arr, flags=cv2.IMREAD_COLOR)
-        return img
-    except Exception:
-        return None
+    # frame_io times the base64 and imdecode stages
+    return decode_frame(b64)
 
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'ok', 'ts': time.time()})
+    return jsonify({'status': 'ok', 'ready': warmup.is_ready(), 'engine': emotion_engine.name,
+                    'face_detector': FACE_DETECTOR, 'tracker': face_tracker.stats(),
+                    'frame_cache': frame_cache.stats(), 'pacing': snapshot_pacer.stats(), 'ts': time.time()})
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    status = warmup.status()
+    return jsonify(status), (200 if status['ready'] else 503)
+
+def enhance_image(img):
+    """Upscale small frames and boost contrast (CLAHE on the L channel)."""
+    # Resize if too small (minimum 224x224 for DeepFace)
+    height, width = img.shape[:2]
+    if height < 224 or width < 224:
+        scale = max(224 / height, 224 / width)
+        new_width = int(width * scale)
+        new_height = int(height * scale)
+        t0 = time.perf_counter()
+        img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+        metrics.stage('resize').since(t0)
+
+    # Enhance image contrast for better face detection
+    t0 = time.perf_counter()
+    lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
+    l, a, b = cv2.split(lab)
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+    l = clahe.apply(l)
+    img = cv2.merge([l, a, b])
+    img = cv2.cvtColor(img, cv2.COLOR_LAB2BGR)
+    metrics.stage('clahe').since(t0)
+    return img
+
+def detect_faces(img, min_size=50):
+    """Haar-cascade face boxes (x, y, w, h), largest first."""
+    t0 = time.perf_counter()
+    try:
+        return _detect_faces(img, min_size)
+    finally:
+        metrics.stage('face_detection').since(t0)
+
+def _detect_faces(img, min_size):
+    if FACE_DETECTOR != 'legacy':
+        return thumbnail_detector.detect(img, min_size=min_size)
+    # convert to grayscale for Haar detection with improved parameters
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    # More lenient face detection parameters
+    faces = get_face_cascade().detectMultiScale(
+        gray, 
+        scaleFactor=1.05,  # Smaller steps for better detection
+        minNeighbors=3,   # Lower threshold
+        minSize=(min_size, min_size), # Minimum face size
+        flags=cv2.CASCADE_SCALE_IMAGE
+    )
+    return sorted(faces, key=lambda f: f[2] * f[3], reverse=True)
+
+def suppress_overlaps(faces, max_overlap=0.5):
+    """Drop boxes mostly covered by a larger kept box (Haar often reports one face twice); expects largest first."""
+    kept = []
+    for (x, y, w, h) in faces:
+        duplicate = False
+        for (kx, ky, kw, kh) in kept:
+            ix = max(0, min(x + w, kx + kw) - max(x, kx))
+            iy = max(0, min(y + h, ky + kh) - max(y, ky))
+            if ix * iy > max_overlap * w * h:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append((x, y, w, h))
+    return kept
+
+def crop_face(img, face, padding=20):
+    """Crop a detected face with padding; returns (face_img, (x, y, w, h))."""
+    (x, y, w, h) = face
+    # Add padding around face for better emotion detection
+    x = max(0, x - padding)
+    y = max(0, y - padding)
+    w = min(img.shape[1] - x, w + 2 * padding)
+    h = min(img.shape[0] - y, h + 2 * padding)
+    
+    face_img = img[y:y+h, x:x+w]
+    
+    # Ensure face image is large enough
+    if face_img.shape[0] < 48 or face_img.shape[1] < 48:
+        face_img = cv2.resize(face_img, (224, 224), interpolation=cv2.INTER_LINEAR)
+    return face_img, (x, y, w, h)
+
+def summarize_emotions(dominant, emotions):
+    """Normalize a DeepFace-style emotion dict; returns (dominant, confidence 0-1, emotions)."""
+    # Normalize emotion names to lowercase
+    dominant = dominant.lower() if dominant else 'unknown'
+    emotions = {k.lower(): float(v) for k, v in (emotions or {}).items()}
+    
+    # Get confidence from the dominant emotion value
+    confidence = float(emotions.get(dominant, 0.0)) if emotions else 0.0
+    
+    # If confidence is too low, try to get max from all emotions
+    if confidence < 0.1 and emotions:
+        max_emotion = max(emotions.items(), key=lambda x: x[1])
+        dominant = max_emotion[0]
+        confidence = float(max_emotion[1])
+    
+    # Normalize confidence to percentage (DeepFace returns 0-100)
+    if confidence > 1.0:
+        confidence = confidence / 100.0
+    return dominant, confidence, emotions
+
+def classify_face(face_img):
+    """The configured engine on one face crop; returns (dominant, confidence 0-1, emotions)."""
+    t0 = time.perf_counter()
+    emotions = emotion_engine.predict_batch([face_img])[0]
+    metrics.stage('emotion_batch').since(t0)
+    dominant = max(emotions, key=emotions.get) if emotions else 'unknown'
+    return summarize_emotions(dominant, emotions)
+
+def face_result(studentId, name, classId, dominant, confidence, emotions, box):
+    x, y, w, h = box
+    return {
+        'studentId': studentId,
+        'name': name,
+        'classId': classId,
+        'emotion': dominant,
+        'confidence': round(confidence * 100, 2),  # Return as percentage
+        'emotions': emotions,
+        'box': [int(x), int(y), int(w), int(h)],
+        'timestamp': float(time.time())
+    }
+
+def analyze_without_face(img, studentId, name, classId):
+    """
+    No Haar detection: let DeepFace's face detector have a go at the whole
+    frame (it falls back to the frame itself, as DeepFace.analyze did), then
+    classify with the configured engine like every other path.
+    """
+    metrics.NO_FACE.labels('not_detected').inc()
+    try:
+        t0 = time.perf_counter()
+        face_img, _ = detect_face(img, detector_backend=DEEPFACE_BACKEND)
+        metrics.stage('face_detection').since(t0)
+        dominant, confidence, emotions = classify_face(face_img)
+        return {
+            'studentId': studentId,
+            'name': name,
+            'classId': classId,
+            'emotion': dominant,
+            'confidence': round(confidence * 100, 2),  # Return as percentage
+            'emotions': emotions,
+            'box': None,
+            'timestamp': float(time.time())
+        }
+    except Exception as e:
+        print(f"DeepFace fallback failed: {e}")
+        metrics.NO_FACE.labels('deepface_failed').inc()
+        return {
+            'studentId': studentId, 'name': name, 'classId': classId,
+            'emotion': 'no_face', 'confidence': 0.0, 'emotions': {}, 'box': None, 'timestamp': float(time.time())
+        }
+
+def timed_jsonify(body):
+    t0 = time.perf_counter()
+    response = jsonify(body)
+    metrics.stage('serialize').since(t0)
+    return response
+
+def cached_result(result, age):
+    return dict(result, cached=True, cached_age_s=round(age, 3))
+
+def remember_result(studentId, raw, img, result):
+    # Boxes are in enhanced-image coordinates; only hash the face region when
+    # enhance_image() did not rescale the frame
+    box = result.get('box') if raw.shape == img.shape else None
+    frame_cache.store(studentId, raw, result, box=box)
 
 @app.route('/analyze', methods=['POST'])
 def analyze():
     try:
-        payload = request.get_json(force=True)
-        image_b64 = payload.get('image')
+        # JSON with a base64 image, or a multipart / raw image/jpeg body
+        payload, image = read_frame_request(request)
         studentId = payload.get('studentId', '')
         name = payload.get('name', '')
         classId = payload.get('classId', '')
 
-        if not image_b64 or not studentId:
+        if not image or not studentId:
             return jsonify({'error': 'missing image or studentId'}), 400
 
-        img = decode_b64_image(image_b64)
-        if img is None:
+        raw = decode_frame(image)
+        if raw is None:
             return jsonify({'error': 'invalid image'}), 400
 
-        # Improve image quality for better detection
-        # Resize if too small (minimum 224x224 for DeepFace)
-        height, width = img.shape[:2]
-        if height < 224 or width < 224:
-            scale = max(224 / height, 224 / width)
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
-        
-        # Enhance image contrast for better face detection
-        lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-        l, a, b = cv2.split(lab)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        l = clahe.apply(l)
-        img = cv2.merge([l, a, b])
-        img = cv2.cvtColor(img, cv2.COLOR_LAB2BGR)
-        
-        # convert to grayscale for Haar detection with improved parameters
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        # More lenient face detection parameters
-        faces = face_cascade.detectMultiScale(
-            gray, 
-            scaleFactor=1.05,  # Smaller steps for better detection
-            minNeighbors=3,   # Lower threshold
-            minSize=(50, 50), # Minimum face size
-            flags=cv2.CASCADE_SCALE_IMAGE
+        t0 = snapshot_pacer.begin()
+        ran_models = False
+        try:
+            result, ran_models = analyze_frame(raw, studentId, name, classId)
+        finally:
+            snapshot_pacer.end(t0, ran_models)
+        return timed_jsonify(paced(studentId, result, fresh=ran_models))
+    except Exception as ex:
+        traceback.print_exc()
+        return jsonify({'error': str(ex)}), 500
+
+def analyze_frame(raw, studentId, name, classId):
+    """/analyze on a decoded frame; returns (result, whether the models ran)."""
+    # Near-identical frame: reuse this student's last result
+    cached = frame_cache.lookup(studentId, raw)
+    if cached is not None:
+        return cached_result(*cached), False
+
+    # Improve image quality for better detection
+    img = enhance_image(raw)
+    faces = face_tracker.detect(studentId, img, detect_faces)
+
+    if len(faces) == 0:
+        result = analyze_without_face(img, studentId, name, classId)
+        remember_result(studentId, raw, img, result)
+        return result, True
+
+    # choose the biggest face
+    face_img, box = crop_face(img, faces[0])
+
+    # Same engine and preprocessing as /analyze_batch, so both agree on a face
+    try:
+        dominant, confidence, emotions = classify_face(face_img)
+    except Exception as e:
+        print(f"Emotion analysis error: {e}")
+        traceback.print_exc()
+        dominant = 'unknown'
+        emotions = {}
+        confidence = 0.0
+
+    result = face_result(studentId, name, classId, dominant, confidence, emotions, box)
+    remember_result(studentId, raw, img, result)
+    return result, True
+
+def _prepare_item(item):
+    """Decode, enhance and detect one batch item."""
+    if not isinstance(item, dict):
+        return {'error': 'item must be an object'}
+    studentId = item.get('studentId')
+    if not item.get('image') or not studentId:
+        return {'error': 'missing image or studentId'}
+    raw = decode_b64_image(item['image'])
+    if raw is None:
+        return {'error': 'invalid image'}
+    cached = frame_cache.lookup(studentId, raw)
+    if cached is not None:
+        return {'result': cached_result(*cached)}
+    img = enhance_image(raw)
+    faces = face_tracker.detect(studentId, img, detect_faces)
+    face_img, box = crop_face(img, faces[0]) if len(faces) else (None, None)
+    return {'raw': raw, 'img': img, 'face': face_img, 'box': box}
+
+@app.route('/analyze_batch', methods=['POST'])
+def analyze_batch():
+    """
+    Analyze several students' frames in one request.
+
+    Body: {"items": [{studentId, name, classId, image}, ...]}. Items are
+    decoded and face-detected concurrently, then every face crop is
+    classified in a single batched forward pass. Results keep input order;
+    a bad item gets an 'error' entry instead of failing the whole batch.
+    """
+    try:
+        t0 = time.perf_counter()
+        payload = request.get_json(force=True) or {}
+        metrics.stage('json_parse').since(t0)
+        items = payload.get('items') if isinstance(payload, dict) else payload
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'missing items'}), 400
+        if len(items) > BATCH_MAX_ITEMS:
+            return jsonify({'error': f'too many items (max {BATCH_MAX_ITEMS})'}), 413
+
+        prepared = list(batch_pool.map(_prepare_item, items))
+        results = [p.get('result') for p in prepared]
+        for i, p in enumerate(prepared):
+            if 'error' in p:
+                item = items[i] if isinstance(items[i], dict) else {}
+                results[i] = {'studentId': item.get('studentId', ''), 'error': p['error']}
+
+        with_face = [i for i, p in enumerate(prepared) if p.get('face') is not None]
+        try:
+            t0 = time.perf_counter()
+            batch_emotions = emotion_engine.predict_batch([prepared[i]['face'] for i in with_face])
+            metrics.stage('emotion_batch').since(t0)
+        except Exception as e:
+            print(f"Batched emotion analysis error: {e}")
+            traceback.print_exc()
+            batch_emotions = [{} for _ in with_face]
+
+        for i, emotions in zip(with_face, batch_emotions):
+            item = items[i]
+            dominant = max(emotions, key=emotions.get) if emotions else 'unknown'
+            dominant, confidence, emotions = summarize_emotions(dominant, emotions)
+            results[i] = face_result(item.get('studentId', ''), item.get('name', ''), item.get('classId', ''),
+                                     dominant, confidence, emotions, prepared[i]['box'])
+
+        # Items without a Haar face fall back to DeepFace's face detector, one by one
+        no_face = [i for i, p in enumerate(prepared) if 'img' in p and p['face'] is None]
+        fallbacks = batch_pool.map(
+            lambda i: analyze_without_face(prepared[i]['img'], items[i].get('studentId', ''),
+                                           items[i].get('name', ''), items[i].get('classId', '')),
+            no_face
         )
-        
-        if len(faces) == 0:
-            # Try DeepFace's built-in face detection as fallback
-            try:
-                analysis = DeepFace.analyze(
-                    img, 
-                    actions=['emotion'], 
-                    enforce_detection=False,
-                    silent=True
-                )
-                # Handle both dict and list responses from DeepFace
-                if isinstance(analysis, list):
-                    analysis = analysis[0]
-                
-                dominant = analysis.get('dominant_emotion', 'unknown')
-                emotions = analysis.get('emotion', {}) or {}
-                emotions = {k: float(v) for k, v in emotions.items()}
-                confidence = float(max(emotions.values())) if emotions else 0.0
-                
-                return jsonify({
-                    'studentId': studentId,
-                    'name': name,
-                    'classId': classId,
-                    'emotion': dominant.lower() if dominant else 'unknown',
-                    'confidence': confidence,
-                    'emotions': emotions,
-                    'box': None,
-                    'timestamp': float(time.time())
-                })
-            except Exception as e:
-                print(f"DeepFace fallback failed: {e}")
-                return jsonify({
-                    'studentId': studentId, 'name': name, 'classId': classId,
-                    'emotion': 'no_face', 'confidence': 0.0, 'emotions': {}, 'box': None, 'timestamp': float(time.time())
-                })
-
-        # choose the biggest face
-        faces = sorted(faces, key=lambda f: f[2] * f[3], reverse=True)
-        (x, y, w, h) = faces[0]
-        
-        # Add padding around face for better emotion detection
-        padding = 20
-        x = max(0, x - padding)
-        y = max(0, y - padding)
-        w = min(img.shape[1] - x, w + 2 * padding)
-        h = min(img.shape[0] - y, h + 2 * padding)
-        
-        face_img = img[y:y+h, x:x+w]
-        
-        # Ensure face image is large enough
-        if face_img.shape[0] < 48 or face_img.shape[1] < 48:
-            face_img = cv2.resize(face_img, (224, 224), interpolation=cv2.INTER_LINEAR)
-
-        # DeepFace analyze - return emotion dict and dominant emotion
+        for i, result in zip(no_face, fallbacks):
+            results[i] = result
+
+        for i, p in enumerate(prepared):
+            if 'img' in p:
+                remember_result(items[i]['studentId'], p['raw'], p['img'], results[i])
+            if 'error' not in p:
+                # Batch time is not one frame's cost, so the pacer's estimate is left to /analyze
+                results[i] = paced(items[i]['studentId'], results[i], fresh='img' in p)
+
+        return timed_jsonify({'count': len(results), 'results': results})
+    except Exception as ex:
+        traceback.print_exc()
+        return jsonify({'error': str(ex)}), 500
+
+@app.route('/analyze_classroom', methods=['POST'])
+def analyze_classroom():
+    """
+    Classify every face in one room-camera frame.
+
+    Accepts the same bodies as /analyze (studentId is not needed; classId
+    and cameraId are echoed back). All faces of at least CLASSROOM_MIN_FACE
+    pixels, up to CLASSROOM_MAX_FACES of the largest, are cropped and
+    classified together in one forward pass, so latency grows with the
+    batch size rather than with one model call per face.
+    """
+    try:
+        t0 = time.perf_counter()
+        payload, image = read_frame_request(request)
+        if not image:
+            return jsonify({'error': 'missing image'}), 400
+        raw = decode_frame(image)
+        if raw is None:
+            return jsonify({'error': 'invalid image'}), 400
+
+        img = enhance_image(raw)
+        t1 = time.perf_counter()
+        faces = suppress_overlaps(detect_faces(img, min_size=CLASSROOM_MIN_FACE))[:CLASSROOM_MAX_FACES]
+        crops = [crop_face(img, face) for face in faces]
+        t2 = time.perf_counter()
         try:
-            analysis = DeepFace.analyze(
-                face_img, 
-                actions=['emotion'], 
-                enforce_detection=False,
-                silent=True  # Suppress verbose output
-            )
-            
-            # Handle both dict and list responses from DeepFace
-            if isinstance(analysis, list):
-                analysis = analysis[0]
-            
-            dominant = analysis.get('dominant_emotion', 'unknown')
-            emotions = analysis.get('emotion', {}) or {}
-            
-            # Normalize emotion names to lowercase
-            dominant = dominant.lower() if dominant else 'unknown'
-            emotions = {k.lower(): float(v) for k, v in emotions.items()}
-            
-            # Get confidence from the dominant emotion value
-            confidence = float(emotions.get(dominant, 0.0)) if emotions else 0.0
-            
-            # If confidence is too low, try to get max from all emotions
-            if confidence < 0.1 and emotions:
-                max_emotion = max(emotions.items(), key=lambda x: x[1])
-                dominant = max_emotion[0]
-                confidence = float(max_emotion[1])
-            
-            # Normalize confidence to percentage (DeepFace returns 0-100)
-            if confidence > 1.0:
-                confidence = confidence / 100.0
-            
+            batch_emotions = emotion_engine.predict_batch([face_img for face_img, _ in crops])
+            metrics.stage('emotion_batch').since(t2)
         except Exception as e:
-            print(f"DeepFace analysis error: {e}")
+            print(f"Batched emotion analysis error: {e}")
             traceback.print_exc()
-            dominant = 'unknown'
-            emotions = {}
-            confidence = 0.0
+            batch_emotions = [{} for _ in crops]
+        t3 = time.perf_counter()
 
-        return jsonify({
-            'studentId': studentId,
-            'name': name,
-            'classId': classId,
-            'emotion': dominant,
-            'confidence': round(confidence * 100, 2),  # Return as percentage
-            'emotions': emotions,
-            'box': [int(x), int(y), int(w), int(h)],
+        results = []
+        for (_, box), emotions in zip(crops, batch_emotions):
+            dominant = max(emotions, key=emotions.get) if emotions else 'unknown'
+            dominant, confidence, emotions = summarize_emotions(dominant, emotions)
+            results.append({
+                'box': [int(v) for v in box],
+                'emotion': dominant,
+                'confidence': round(confidence * 100, 2),  # Return as percentage
+                'emotions': emotions
+            })
+
+        return timed_jsonify({
+            'classId': payload.get('classId', ''),
+            'cameraId': payload.get('cameraId', ''),
+            'count': len(results),
+            'faces': results,
+            'timing_ms': {
+                'decode': round((t1 - t0) * 1000.0, 2),
+                'detect': round((t2 - t1) * 1000.0, 2),
+                'classify': round((t3 - t2) * 1000.0, 2),
+                'total': round((t3 - t0) * 1000.0, 2)
+            },
             'timestamp': float(time.time())
         })
     except Exception as ex:
         traceback.print_exc()
         return jsonify({'error': str(ex)}), 500
 
+# Warm-up: build every model the pipeline can reach before /ready reports ok
+WARMUP_ON_START = os.environ.get('WARMUP_ON_START', '1') == '1'
+_warm_frame = synthetic_frame()
+
+def _warm_emotion():
+    emotion_engine.predict_batch([_warm_frame])
+    emotion_engine.predict_batch([_warm_frame] * 8)
+
+warmup = ModelWarmup(runs=int(os.environ.get('WARMUP_RUNS', 3)))
+warmup.add('haar_cascade', lambda: detect_faces(enhance_image(_warm_frame)))
+warmup.add('emotion', _warm_emotion, load=emotion_engine.load)
+warmup.add('deepface_detector', lambda: detect_face(_warm_frame, detector_backend=DEEPFACE_BACKEND))
+
 if __name__ == '__main__':
-    # for local dev, use this; in prod use gunicorn
+    if WARMUP_ON_START:
+        warmup.start()
+    # for local dev, use this; in prod use serve_prefork.py (PREFORK_APP=api_server)
     app.run(host='0.0.0.0', port=8000, debug=False)
\ No newline at end of file
@@ -0,0 +1,451 @@
+# api_server_async.py
+# asyncio front end for the hybrid pipeline: fixed inference executor behind a bounded admission queue
+#
+# Under a burst the Flask servers accept every connection and let requests pile
+# up until the caller's timeout fires. Here at most ASYNC_INFERENCE_WORKERS
+# frames are analysed at once and ASYNC_MAX_QUEUE wait; everything else gets
+# an immediate 429 (queue full) or 503 (waited too long / warming up) with a
+# Retry-After header, so clients back off instead of timing out.
+#
+# GET /stream upgrades to a WebSocket session for one student: metadata is
+# sent once and frames follow as binary messages, answered on the same socket
+# (protocol in StreamSession).
+#
+# Frames are queued per studentId, latest first (frame_queue.py): a newer frame
+# replaces one of the same student that is still waiting (409 superseded), and
+# one that cannot start within ASYNC_FRAME_DEADLINE_MS of arriving is dropped
+# (503 deadline_expired) instead of being analysed late.
+#
+# GET /metrics serves the Prometheus text format (metrics.py). /analyze responses
+# carry Server-Timing (including the time spent queued) and X-Request-ID, and
+# POST /admin/profile samples the inference threads when ADMIN_TOKEN is set
+# (profiler.py).
+#
+# Usage:
+#   python api_server_async.py
+#   ASYNC_INFERENCE_WORKERS=4 ASYNC_MAX_QUEUE=16 ASYNC_MAX_QUEUE_WAIT_MS=3000 python api_server_async.py
+#   ASYNC_FRAME_DEADLINE_MS=1500 python api_server_async.py
+
+import asyncio
+import itertools
+import json
+import os
+import time
+import traceback
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import WSMsgType, web
+import api_server_hybrid as hybrid
+import metrics
+import profiler
+import server_timing
+from admission import AdmissionQueue, Overloaded
+from frame_queue import LatestFrameQueue, Superseded
+from frame_io import METADATA_HEADERS, BINARY_CONTENT_TYPES
+
+PORT = int(os.environ.get('PORT', 8000))
+INFERENCE_WORKERS = int(os.environ.get('ASYNC_INFERENCE_WORKERS', 4))
+MAX_QUEUE = int(os.environ.get('ASYNC_MAX_QUEUE', 32))
+MAX_QUEUE_WAIT_MS = float(os.environ.get('ASYNC_MAX_QUEUE_WAIT_MS', 5000))
+FRAME_DEADLINE_MS = float(os.environ.get('ASYNC_FRAME_DEADLINE_MS', 3000))
+MAX_BODY_BYTES = int(os.environ.get('ASYNC_MAX_BODY_BYTES', 10 * 1024 * 1024))
+# JSON bodies at least this big (a base64 frame is ~100-300 KB) are parsed on a
+# helper thread so the event loop keeps serving other connections meanwhile
+JSON_OFFLOAD_BYTES = int(os.environ.get('ASYNC_JSON_OFFLOAD_BYTES', 64 * 1024))
+STREAM_HEARTBEAT_S = float(os.environ.get('ASYNC_STREAM_HEARTBEAT_S', 30))
+# /admin/profile samples these threads unless the request names others
+PROFILE_THREADS = ('inference', 'emotion-batcher')
+WARMING_RETRY_AFTER_S = 5
+
+executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix='inference')
+admission = AdmissionQueue(executor, INFERENCE_WORKERS, max_queue=MAX_QUEUE, max_wait_ms=MAX_QUEUE_WAIT_MS)
+frames = LatestFrameQueue(admission, deadline_ms=FRAME_DEADLINE_MS)
+sessions = weakref.WeakSet()
+session_ids = itertools.count(1)
+
+
+def overloaded_response(error):
+    return web.json_response(
+        {'success': False, 'error': 'overloaded', 'reason': error.reason, 'retry_after_s': error.retry_after_s},
+        status=error.status,
+        headers={'Retry-After': str(error.retry_after_s)}
+    )
+
+
+def _parse_json(body):
+    t0 = time.perf_counter()
+    try:
+        return json.loads(body or b'{}')
+    except ValueError:
+        return None
+    finally:
+        metrics.stage('json_parse').since(t0)
+
+
+async def _read_part(part, size):
+    """A multipart part's bytes, read chunk by chunk; `size` is what the body has used so far"""
+    data = bytearray()
+    while True:
+        chunk = await part.read_chunk()
+        if not chunk:
+            return data
+        data.extend(chunk)
+        if size + len(data) > MAX_BODY_BYTES:
+            raise web.HTTPRequestEntityTooLarge(max_size=MAX_BODY_BYTES, actual_size=size + len(data))
+
+
+async def read_multipart(request):
+    """
+    Multipart form: text fields for metadata, file field "image".
+
+    Parts are awaited from the stream as they arrive; request.post() would
+    instead spool file parts to a temporary file with blocking writes on the
+    event loop.
+    """
+    fields = dict(request.query)
+    image = None
+    size = 0
+    reader = await request.multipart()
+    while True:
+        part = await reader.next()
+        if part is None:
+            return fields, image
+        data = await _read_part(part, size)
+        size += len(data)
+        if part.filename is not None:
+            if part.name == 'image':
+                image = data
+        elif part.name:
+            fields[part.name] = data.decode(part.get_charset('utf-8'))
+
+
+async def read_frame_request(request):
+    """aiohttp version of frame_io.read_frame_request: (fields, image) from JSON, multipart or raw bodies."""
+    mimetype = request.content_type or ''
+    if mimetype == 'multipart/form-data':
+        return await read_multipart(request)
+
+    if mimetype.startswith(BINARY_CONTENT_TYPES):
+        fields = dict(request.query)
+        for key, header in METADATA_HEADERS.items():
+            if key not in fields and header in request.headers:
+                fields[key] = request.headers[header]
+        return fields, await request.read()
+
+    body = await request.read()
+    if len(body) >= JSON_OFFLOAD_BYTES:
+        payload = await asyncio.get_running_loop().run_in_executor(None, _parse_json, body)
+    else:
+        payload = _parse_json(body)
+    if not isinstance(payload, dict):
+        return {}, None
+    return payload, payload.get('image')
+
+
+def _analyze(fields, image, started, timing=None, queued=None):
+    # Runs on the inference executor: decoding is CPU work too. The executor
+    # does not carry the request's context over, so the timing is activated here.
+    if timing is None:
+        return _analyze_frame(fields, image, started)
+    timing.since('queue', queued)
+    token = server_timing.activate(timing)
+    try:
+        return _analyze_frame(fields, image, started)
+    finally:
+        server_timing.deactivate(token)
+
+
+def _analyze_frame(fields, image, started):
+    img = hybrid.decode_image(image)
+    if img is None:
+        return 400, {'success': False, 'error': 'invalid image'}
+    budget_ms = hybrid.request_budget_ms(fields.get('budget_ms'))
+    result = hybrid.analyze_image(img, fields['studentId'], fields.get('name', ''), fields.get('classId', ''),
+                                  budget_ms=budget_ms, started=started, pace=False)
+    return 200, result
+
+
+def next_snapshot_ms(student_id):
+    """Pacing hint from the student's stability and this server's admission backlog"""
+    return hybrid.snapshot_pacer.hint(
+        hybrid.emotion_buffer.stable_for(student_id),
+        backlog=admission.waiting + admission.running,
+        cost_ms=admission.service_ms,
+        parallelism=admission.workers
+    )
+
+
+async def analyze(request):
+    started = time.perf_counter()
+    timing = server_timing.RequestTiming(server_timing.request_id(request.headers.get(server_timing.REQUEST_ID_HEADER)),
+                                         started)
+    # json_parse and serialize land in this request's timing. aiohttp serves a
+    # keep-alive connection's requests in one task, hence the reset.
+    token = server_timing.activate(timing)
+    try:
+        response = await _analyze_request(request, started, timing)
+    finally:
+        server_timing.deactivate(token)
+    response.headers['Server-Timing'] = timing.header()
+    response.headers[server_timing.REQUEST_ID_HEADER] = timing.request_id
+    return response
+
+
+async def _analyze_request(request, started, timing):
+    if not hybrid.warmup.is_ready():
+        return overloaded_response(Overloaded(503, 'warming_up', WARMING_RETRY_AFTER_S))
+    try:
+        # Reject before reading the body when the queue is already full
+        admission.check()
+        fields, image = await read_frame_request(request)
+        if not fields.get('studentId') or not image:
+            return web.json_response({'success': False, 'error': 'missing fields'}, status=400)
+        queued = time.perf_counter()
+        timing.add('read', queued - started)
+        status, body = await frames.submit(fields['studentId'], _analyze, fields, image, started, timing, queued,
+                                           arrived=started)
+        if status == 200:
+            body['next_snapshot_ms'] = next_snapshot_ms(fields['studentId'])
+        t0 = time.perf_counter()
+        response = web.json_response(body, status=status)
+        metrics.stage('serialize').since(t0)
+        return response
+    except Superseded:
+        return web.json_response({'success': False, 'error': 'superseded', 'reason': 'superseded'}, status=409)
+    except Overloaded as e:
+        return overloaded_response(e)
+    except web.HTTPRequestEntityTooLarge as e:
+        return web.json_response({'success': False, 'error': 'body too large'}, status=e.status)
+    except Exception as ex:
+        traceback.print_exc()
+        return web.json_response({'success': False, 'error': str(ex)}, status=500)
+
+
+class StreamSession:
+    """
+    One student's WebSocket session.
+
+    Protocol (JSON text messages, frames as binary):
+        client  {"type": "hello", "studentId", "name", "classId", "budget_ms"}
+                (or the same fields in the /stream query string)
+        server  {"type": "ready", "session", "studentId"}
+        client  <binary JPEG/PNG frame>
+        server  {"type": "result", "seq", ...analyze_image result...}
+                {"type": "busy", "seq", "reason", "retry_after_s"}   overloaded or past the deadline, frame dropped
+                {"type": "superseded", "seq"}   replaced by a newer frame before it started
+                {"type": "error", "seq", "error"}
+        client  {"type": "config", "budget_ms"} / {"type": "ping"} -> {"type": "pong"}
+
+    Frames are analysed one at a time in arrival order, but only the newest
+    waiting frame is kept: the socket keeps reading while a frame is being
+    analysed, so a backlog collapses to the latest frame instead of piling up.
+    A frame byte-identical to the previous one gets the previous result
+    without being decoded.
+    """
+
+    def __init__(self, fields):
+        self.id = next(session_ids)
+        self.fields = {}
+        self.seq = 0
+        self.frames = 0
+        self.repeats = 0
+        self.busy = 0
+        self.superseded = 0
+        self.opened = time.time()
+        self._last_frame = None
+        self._last_result = None
+        self.update(fields)
+
+    @property
+    def student_id(self):
+        return self.fields.get('studentId')
+
+    def update(self, fields):
+        for key in ('studentId', 'name', 'classId', 'budget_ms'):
+            if fields.get(key) is not None:
+                self.fields[key] = fields[key]
+
+    async def analyze(self, frame):
+        self.seq += 1
+        self.frames += 1
+        seq = self.seq
+        started = time.perf_counter()
+        if self._last_result is not None and frame == self._last_frame:
+            self.repeats += 1
+            return dict(self._last_result, type='result', seq=seq, repeated=True,
+                        next_snapshot_ms=next_snapshot_ms(self.student_id))
+        try:
+            status, body = await frames.submit(self.student_id, _analyze, dict(self.fields), frame, started,
+                                               arrived=started)
+        except Superseded:
+            self.superseded += 1
+            return {'type': 'superseded', 'seq': seq}
+        except Overloaded as e:
+            self.busy += 1
+            return {'type': 'busy', 'seq': seq, 'reason': e.reason, 'retry_after_s': e.retry_after_s}
+        if status != 200:
+            return {'type': 'error', 'seq': seq, 'error': body.get('error')}
+        if body.get('success'):
+            self._last_frame, self._last_result = frame, body
+        return dict(body, type='result', seq=seq, next_snapshot_ms=next_snapshot_ms(self.student_id))
+
+    def stats(self):
+        return {
+            'session': self.id,
+            'studentId': self.student_id,
+            'frames': self.frames,
+            'repeats': self.repeats,
+            'busy': self.busy,
+            'superseded': self.superseded,
+            'age_s': round(time.time() - self.opened, 1),
+        }
+
+
+async def stream(request):
+    ws = web.WebSocketResponse(heartbeat=STREAM_HEARTBEAT_S, max_msg_size=MAX_BODY_BYTES)
+    await ws.prepare(request)
+    session = StreamSession(request.query)
+    sessions.add(session)
+    pending = set()
+
+    async def reply(frame):
+        try:
+            await ws.send_json(await session.analyze(frame))
+        except ConnectionResetError:
+            pass
+        except Exception:
+            traceback.print_exc()
+
+    if session.student_id:
+        await ws.send_json({'type': 'ready', 'session': session.id, 'studentId': session.student_id})
+
+    try:
+        async for msg in ws:
+            if msg.type == WSMsgType.BINARY:
+                if not session.student_id:
+                    await ws.send_json({'type': 'error', 'error': 'send hello with studentId first'})
+                elif not hybrid.warmup.is_ready():
+                    await ws.send_json({'type': 'busy', 'reason': 'warming_up', 'retry_after_s': WARMING_RETRY_AFTER_S})
+                else:
+                    # Keep reading while the frame waits, so a newer one can supersede it
+                    task = asyncio.ensure_future(reply(msg.data))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+            elif msg.type == WSMsgType.TEXT:
+                try:
+                    message = json.loads(msg.data)
+                except ValueError:
+                    message = None
+                if not isinstance(message, dict):
+                    await ws.send_json({'type': 'error', 'error': 'invalid message'})
+                elif message.get('type') == 'ping':
+                    await ws.send_json({'type': 'pong'})
+                elif message.get('type') in ('hello', 'config'):
+                    session.update(message)
+                    if not session.student_id:
+                        await ws.send_json({'type': 'error', 'error': 'missing studentId'})
+                    elif message['type'] == 'hello':
+                        await ws.send_json({'type': 'ready', 'session': session.id, 'studentId': session.student_id})
+                else:
+                    await ws.send_json({'type': 'error', 'error': f"unknown message type {message.get('type')}"})
+            elif msg.type == WSMsgType.ERROR:
+                print(f"⚠ Stream session {session.id} closed with {ws.exception()}")
+    except Exception:
+        traceback.print_exc()
+    finally:
+        for task in pending:
+            task.cancel()
+        sessions.discard(session)
+    return ws
+
+
+# Endpoints counted in emotion_requests_total / _seconds / _in_flight
+INSTRUMENTED = ('analyze',)
+
+
+@web.middleware
+async def request_metrics(request, handler):
+    endpoint = request.match_info.route.name
+    if endpoint not in INSTRUMENTED:
+        return await handler(request)
+    metrics.IN_FLIGHT.labels(endpoint).inc()
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        metrics.REQUEST_SECONDS.labels(endpoint).since(t0)
+        metrics.REQUESTS.labels(endpoint, str(status)).inc()
+        if status >= 500:
+            metrics.ERRORS.labels(endpoint).inc()
+        metrics.IN_FLIGHT.labels(endpoint).dec()
+
+
+async def admin_profile(request):
+    # Sampled from a default-executor thread so the profile does not take an inference slot
+    if not profiler.ADMIN_TOKEN:
+        return web.json_response({'error': 'profiling disabled (set ADMIN_TOKEN)'}, status=404)
+    if not profiler.authorized(profiler.bearer_token(request.headers), profiler.ADMIN_TOKEN):
+        return web.json_response({'error': 'unauthorized'}, status=401)
+    try:
+        seconds, options = profiler.profile_options(request.query, PROFILE_THREADS)
+        profile = profiler.SamplingProfiler(**options)
+        await asyncio.get_running_loop().run_in_executor(None, profile.run, seconds)
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+    except profiler.ProfilerBusy:
+        return web.json_response({'error': 'a profile is already running'}, status=409)
+    return web.Response(body=profile.collapsed().encode(),
+                        headers=dict(profiler.summary_headers(profile), **{'Content-Type': profiler.CONTENT_TYPE}))
+
+
+async def metrics_endpoint(request):
+    return web.Response(body=metrics.REGISTRY.render().encode(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+async def ready(request):
+    status = hybrid.warmup.status()
+    return web.json_response(status, status=200 if status['ready'] else 503)
+
+
+async def health(request):
+    return web.json_response({
+        'status': 'ok',
+        'ready': hybrid.warmup.is_ready(),
+        'mode': 'hybrid-async',
+        'engine': hybrid.emotion_engine.name,
+        'default_budget_ms': hybrid.DEFAULT_BUDGET_MS,
+        'admission': admission.stats(),
+        'frames': frames.stats(),
+        'streams': {'open': len(sessions), 'sessions': [session.stats() for session in list(sessions)[:50]]},
+        'batching': hybrid.emotion_batcher.stats(),
+        'tracker': hybrid.face_tracker.stats(),
+        'frame_cache': hybrid.frame_cache.stats(),
+        'smoothing': hybrid.emotion_buffer.stats(),
+        'quality_gate': hybrid.quality_gate.stats() if hybrid.QUALITY_GATE else None,
+        'pacing': hybrid.snapshot_pacer.stats()
+    })
+
+
+def create_app():
+    app = web.Application(client_max_size=MAX_BODY_BYTES, middlewares=[request_metrics])
+    app.router.add_post('/analyze', analyze, name='analyze')
+    app.router.add_get('/stream', stream)
+    app.router.add_get('/ready', ready)
+    app.router.add_get('/health', health)
+    app.router.add_get('/metrics', metrics_endpoint)
+    app.router.add_post('/admin/profile', admin_profile)
+    return app
+
+
+if __name__ == '__main__':
+    print(f"Async hybrid AI server running on http://0.0.0.0:{PORT} "
+          f"({INFERENCE_WORKERS} inference workers, queue {MAX_QUEUE}, max wait {MAX_QUEUE_WAIT_MS:.0f} ms)")
+    if hybrid.WARMUP_ON_START:
+        hybrid.warmup.start()
+    web.run_app(create_app(), host='0.0.0.0', port=PORT)
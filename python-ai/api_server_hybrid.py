@@ -3,29 +3,124 @@
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from deepface import DeepFace
-import numpy as np
-import cv2, base64, time, traceback
-from collections import deque
+import cv2, os, time, traceback
+from concurrent.futures import ThreadPoolExecutor
+from emotion_engine import EMOTION_LABELS, create_engine, crop_region, detect_face, detect_faces
+from face_tracker import FaceTracker
+from frame_cache import FrameCache
+from cascade import Cascade, Stage
+from micro_batcher import MicroBatcher
+from warmup import ModelWarmup, synthetic_frame
+from frame_io import decode_frame, read_frame_request
+from student_state import create_student_state
+from quality_gate import QualityGate
+from snapshot_pacing import SnapshotPacer
+import metrics
+import profiler
+import server_timing
 
 app = Flask(__name__)
 CORS(app)
+# GET /metrics: per-stage latency histograms, cascade outcomes, no-face and error counts
+metrics.instrument_flask(app)
+# Server-Timing and X-Request-ID on /analyze responses
+server_timing.instrument_flask(app)
+# POST /admin/profile?seconds=N: sampling profile as collapsed stacks (needs ADMIN_TOKEN)
+profiler.register_flask(app)
 
 # smoothing buffer (last N emotions) - reduced for faster adaptation
 BUFF_SIZE = 3
-emotion_buffer = {}  # studentId -> deque(maxlen=BUFF_SIZE)
+# Bounded: least recently seen students are evicted, idle ones expire after the TTL.
+# STUDENT_STATE_BACKEND=shared keeps it in shared memory so pre-forked workers agree.
+emotion_buffer = create_student_state(window=BUFF_SIZE, labels=EMOTION_LABELS)
 
-# thresholds (optimized for speed and accuracy)
-FAST_CONFIDENCE_THRESHOLD = 0.45   # Lower threshold for faster acceptance
-FALLBACK_CONFIDENCE_THRESHOLD = 0.25  # Lower minimum for better detection
+# thresholds: lowest confidence each cascade stage accepts. The top class of a
+# 7-way softmax is never below 1/7 (~0.143), so these read against that floor,
+# not against 0. With a fallback engine the fast pass hands anything under
+# FAST_CONFIDENCE_THRESHOLD (~1.75x chance) on to it; the last stage accepts down
+# to FALLBACK_CONFIDENCE_THRESHOLD (~1.4x chance) and below that the answer is
+# "no_detection". (It used to be 0.15, which only rejected near-uniform outputs.)
+FAST_CONFIDENCE_THRESHOLD = float(os.environ.get("FAST_CONFIDENCE_THRESHOLD", 0.25))
+FALLBACK_CONFIDENCE_THRESHOLD = float(os.environ.get("FALLBACK_CONFIDENCE_THRESHOLD", 0.2))
 
-def decode_image(b64):
+# per-request latency budget; kept below the backend's 20 s axios timeout.
+# Clients may send a smaller "budget_ms" with each request.
+DEFAULT_BUDGET_MS = float(os.environ.get("DEFAULT_BUDGET_MS", 15000))
+
+# micro-batching for the fast pass: concurrent requests share one forward pass.
+# Larger values trade p50 latency for throughput on CPU-only nodes.
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 8))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", 5))
+
+# EMOTION_ENGINE selects the fast-pass classifier: deepface (default), onnx or torch
+emotion_engine = create_engine()
+
+# FALLBACK_ENGINE (optional) is a second, different model that gets the crop
+# when the fast pass is unsure, e.g. EMOTION_ENGINE=deepface FALLBACK_ENGINE=onnx.
+# The onnx and torch engines serve the same EmotionResNet34 weights, so
+# pairing them (or an engine with itself) would only repeat the same answer.
+SAME_MODEL_ENGINES = ({"deepface"}, {"onnx", "torch"})
+
+def create_fallback_engine(name):
+    if not name:
+        return None
+    fallback = create_engine(name)
+    if any({emotion_engine.name, fallback.name} <= family for family in SAME_MODEL_ENGINES):
+        print(f"⚠ FALLBACK_ENGINE={name} runs the same model as EMOTION_ENGINE={emotion_engine.name}; no fallback")
+        return None
+    return fallback
+
+fallback_engine = create_fallback_engine(os.environ.get("FALLBACK_ENGINE", "").lower())
+emotion_batcher = MicroBatcher(
+    emotion_engine.predict_batch,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    name="emotion-batcher"
+)
+
+# per-student face tracking: search around the last face before a full-frame scan
+face_tracker = FaceTracker(
+    expand=float(os.environ.get("TRACKER_EXPAND", 0.5)),
+    refresh_every=int(os.environ.get("TRACKER_REFRESH_EVERY", 10))
+)
+
+# frame dedup: a near-identical frame (dHash within FRAME_CACHE_DISTANCE bits)
+# reuses the student's last result for up to FRAME_CACHE_TTL_S seconds
+frame_cache = FrameCache(
+    max_entries=int(os.environ.get("FRAME_CACHE_ENTRIES", 10000)),
+    ttl_s=float(os.environ.get("FRAME_CACHE_TTL_S", 5)),
+    max_distance=int(os.environ.get("FRAME_CACHE_DISTANCE", 4))
+)
+
+# pre-inference quality gate on a small thumbnail: dark, blurred, covered and
+# empty frames (and faces the tracker last saw too small) skip every model
+QUALITY_GATE = os.environ.get("QUALITY_GATE", "1") == "1"
+quality_gate = QualityGate(
+    min_brightness=float(os.environ.get("QUALITY_MIN_BRIGHTNESS", 35)),
+    min_sharpness=float(os.environ.get("QUALITY_MIN_SHARPNESS", 600)),
+    min_face=50
+)
+
+# next_snapshot_ms in every /analyze result: SNAPSHOT_MIN_MS right after a
+# student's emotion changes, up to SNAPSHOT_MAX_MS once it has held for
+# SNAPSHOT_STABLE_S, and never sooner than this process can clear its backlog
+snapshot_pacer = SnapshotPacer(
+    min_ms=float(os.environ.get("SNAPSHOT_MIN_MS", 500)),
+    max_ms=float(os.environ.get("SNAPSHOT_MAX_MS", 5000)),
+    stable_s=float(os.environ.get("SNAPSHOT_STABLE_S", 60)),
+    parallelism=int(os.environ.get("SNAPSHOT_PARALLELISM", 0)) or None
+)
+
+# /analyze_batch: items are decoded and face-detected concurrently, then every
+# face crop goes through the fast pass in one predict_batch call
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 64))
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", 16))
+batch_pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="analyze-batch")
+
+def decode_image(data):
+    """Decode a base64 / data-URL string or raw encoded bytes, capped at 640px."""
     try:
-        if "," in b64:
-            b64 = b64.split(',', 1)[1]
-        im_bytes = base64.b64decode(b64)
-        arr = np.frombuffer(im_bytes, np.uint8)
-        img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        img = decode_frame(data)
         
         # Optimize image size for better detection accuracy (max 640x480 for optimal face detection)
         # Larger images provide better face detail for emotion detection
@@ -37,248 +132,396 @@ def decode_image(b64):
                 new_width = int(width * scale)
                 new_height = int(height * scale)
                 # Use INTER_AREA for downscaling (better quality)
+                t0 = time.perf_counter()
                 img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_AREA)
+                metrics.stage("resize").since(t0)
         
         return img
     except Exception as e:
         return None
 
-def push_buffer(studentId, emotion):
-    if studentId not in emotion_buffer:
-        emotion_buffer[studentId] = deque(maxlen=BUFF_SIZE)
-    emotion_buffer[studentId].append(emotion)
-    counts = {}
-    for e in emotion_buffer[studentId]:
-        counts[e] = counts.get(e, 0) + 1
-    return max(counts, key=counts.get)
-
-def low_light(img):
-    # More lenient lighting check
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    return np.mean(gray) < 30  # Only reject very dark images
+def push_buffer(studentId, emotion, confidence=None):
+    return emotion_buffer.push(studentId, emotion, confidence)
 
 def small_face(region):
     # More lenient - accept smaller faces for better detection
     return region.get("w", 0) < 50 or region.get("h", 0) < 50
 
+def analyze_image(img, studentId, name="", classId="", budget_ms=None, started=None, pace=True):
+    """
+    Analyze a decoded frame, reusing the student's last result when the frame hasn't changed.
+
+    `started` is the request's perf_counter() start so time spent before the
+    cascade (decode, resize) counts against `budget_ms`. With `pace`, the
+    result carries next_snapshot_ms (front ends with their own queue, like
+    api_server_async, compute it themselves).
+    """
+    t0 = snapshot_pacer.begin()
+    ran_pipeline = False
+    try:
+        # Concurrent requests' fast passes share a micro-batch; one on its own is not held back
+        with emotion_batcher.expect():
+            result, ran_pipeline = _analyze_image(img, studentId, name, classId, budget_ms, started or t0)
+    finally:
+        snapshot_pacer.end(t0, ran_pipeline)
+    if pace:
+        result["next_snapshot_ms"] = snapshot_pacer.hint(emotion_buffer.stable_for(studentId))
+    return result
+
+def _analyze_image(img, studentId, name, classId, budget_ms, started):
+    """analyze_image without pacing; returns (result, whether the models ran)."""
+    img, result = screen_image(img, studentId, name, classId)
+    if result is not None:
+        return result, False
+
+    spent_ms = (time.perf_counter() - started) * 1000.0
+    result = run_pipeline(img, studentId, name, classId, budget_ms=budget_ms, spent_ms=spent_ms)
+    if result.get("success"):
+        frame_cache.store(studentId, img, result, box=face_tracker.last_box(studentId))
+    return dict(result), True
+
+def screen_image(img, studentId, name, classId):
+    """
+    Downscale a frame and run the checks that can answer without the models.
+
+    Returns (img, result): result is the response when the quality gate
+    rejected the frame or the student's cached result still applies, else None.
+    """
+
+    # Optimize image for better detection accuracy
+    # Use larger size (480px) for better face detail while maintaining speed
+    height, width = img.shape[:2]
+    target_size = 480  # Increased from 300 for better accuracy
+    if max(width, height) > target_size:
+        scale = target_size / max(width, height)
+        new_width = int(width * scale)
+        new_height = int(height * scale)
+        # Use INTER_AREA for downscaling (better quality than INTER_LINEAR)
+        t0 = time.perf_counter()
+        img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_AREA)
+        metrics.stage("resize").since(t0)
+
+    if QUALITY_GATE:
+        quality = quality_gate.check(img, face_box=face_tracker.last_box(studentId))
+        if not quality["ok"]:
+            if quality["reason"] == "small_face":
+                # The box is from an earlier frame: let the next one be detected afresh
+                face_tracker.forget(studentId)
+            metrics.NO_FACE.labels(quality["reason"]).inc()
+            return img, {
+                "success": True,
+                "studentId": studentId,
+                "name": name,
+                "classId": classId,
+                "emotion": "no_face",
+                "confidence": 0,
+                "warning": quality["reason"],
+                "quality": quality
+            }
+
+    cached = frame_cache.lookup(studentId, img)
+    if cached is not None:
+        result, age = cached
+        return img, dict(result, cached=True, cached_age_s=round(age, 3))
+    return img, None
+
+def _emotion_result(emotions, dominant=None):
+    """Dominant emotion and 0-1 confidence from a DeepFace-style percentage dict."""
+    emotions = {k.lower(): float(v) for k, v in (emotions or {}).items()}
+    if not emotions:
+        return None
+    dominant = (dominant or max(emotions, key=emotions.get)).lower()
+    if dominant not in emotions:
+        # If dominant emotion not in dict, use max confidence
+        dominant = max(emotions, key=emotions.get)
+    # DeepFace returns emotions as percentages (0-100), convert to decimal
+    conf = emotions[dominant]
+    conf = conf / 100.0 if conf > 1.0 else conf
+    return {"emotion": dominant, "confidence": conf, "emotions": emotions}
+
+def _fast_stage(ctx):
+    # Fast pass: classify the shared face crop in a micro-batch with other requests
+    emotions, ctx["batch"] = emotion_batcher.submit(ctx["face"])
+    return _emotion_result(emotions)
+
+def classify_batch(ctxs):
+    """
+    Fast pass for a whole /analyze_batch in one predict_batch call.
+
+    Each ctx gets the result as a precomputed fast stage for its cascade. If
+    the batched call fails, the ctxs are left as they were and each item runs
+    the fast stage on its own.
+    """
+    if not ctxs:
+        return
+    t0 = time.perf_counter()
+    try:
+        batch = emotion_engine.predict_batch([ctx["face"] for ctx in ctxs])
+    except Exception:
+        traceback.print_exc()
+        return
+    ms = (time.perf_counter() - t0) * 1000.0
+    info = {"size": len(ctxs), "max_size": BATCH_MAX_ITEMS, "queue_ms": 0.0, "infer_ms": round(ms, 2)}
+    for ctx, emotions in zip(ctxs, batch):
+        ctx["batch"] = info
+        ctx["precomputed"] = {FAST_STAGE: (_emotion_result(emotions), ms)}
+
+def _fallback_stage(ctx):
+    # Second opinion from a different model on the same crop (face was detected once in run_pipeline)
+    return _emotion_result(fallback_engine.predict_batch([ctx["face"]])[0])
+
+def detect_student_face(img, studentId):
+    """Detect (or track) the student's face once per request; returns (crop, region)."""
+    t0 = time.perf_counter()
+    boxes = face_tracker.detect(studentId, img, lambda im: detect_faces(im, detector_backend='opencv'))  # Fastest backend
+    metrics.stage("face_detection").since(t0)
+    return crop_region(img, boxes[0] if boxes else None)
+
+# The cascade as data: stages run in order until one reaches its acceptance
+# confidence. Costs start from prior_ms and are then learned from observed
+# timings; a request's budget_ms skips stages it cannot afford. Stages are
+# named after the engine they run.
+def build_cascade():
+    if fallback_engine is None:
+        return Cascade([Stage(emotion_engine.name, _fast_stage, FALLBACK_CONFIDENCE_THRESHOLD, prior_ms=50)])
+    return Cascade([
+        Stage(emotion_engine.name, _fast_stage, FAST_CONFIDENCE_THRESHOLD, prior_ms=50),
+        Stage(fallback_engine.name, _fallback_stage, FALLBACK_CONFIDENCE_THRESHOLD, prior_ms=100),
+    ])
+
+cascade = build_cascade()
+FAST_STAGE = cascade.stages[0].name
+
+def request_budget_ms(value):
+    """Latency budget for a request in ms; falls back to DEFAULT_BUDGET_MS."""
+    try:
+        budget = float(value)
+    except (TypeError, ValueError):
+        return DEFAULT_BUDGET_MS
+    return budget if budget > 0 else DEFAULT_BUDGET_MS
+
+def run_pipeline(img, studentId, name="", classId="", budget_ms=None, spent_ms=0.0):
+    """
+    Detect the face once, run the cascade on that crop and build the response dict.
+
+    Detection and classification are timed separately: detect_ms covers the
+    single detection, classify_ms the time each stage spent on the crop.
+    """
+    response, ctx = start_pipeline(img, studentId, name, classId, budget_ms)
+    if ctx is None:
+        return response
+    return finish_pipeline(response, ctx, budget_ms, spent_ms + ctx["detect_ms"])
+
+def start_pipeline(img, studentId, name="", classId="", budget_ms=None):
+    """Detection half of run_pipeline; returns (response, ctx), ctx None when there is no usable face."""
+    response = {
+        "success": True,
+        "studentId": studentId,
+        "name": name,
+        "classId": classId,
+        "budget_ms": budget_ms
+    }
+
+    t0 = time.perf_counter()
+    face, region = detect_student_face(img, studentId)
+    detect_ms = (time.perf_counter() - t0) * 1000.0
+    response["detect_ms"] = round(detect_ms, 1)
+    if small_face(region):
+        metrics.NO_FACE.labels("small_face").inc()
+        response.update(emotion="no_face", confidence=0, warning="small_face")
+        return response, None
+    return response, {"img": img, "face": face, "region": region, "studentId": studentId, "detect_ms": detect_ms}
+
+def finish_pipeline(response, ctx, budget_ms, spent_ms):
+    """Cascade half of run_pipeline: classify ctx's face crop and fill in the response."""
+    studentId = ctx["studentId"]
+    result, accepted, trace = cascade.run(ctx, budget_ms=budget_ms, spent_ms=spent_ms,
+                                          precomputed=ctx.get("precomputed"))
+    response["stages"] = trace
+    response["classify_ms"] = {t["stage"]: t["ms"] for t in trace if "ms" in t}
+    if ctx.get("batch"):
+        response["batch"] = ctx["batch"]
+
+    # Out of budget: return the best result so far rather than nothing
+    out_of_budget = any("skipped" in t for t in trace)
+    if result is None or not (accepted or out_of_budget):
+        metrics.NO_FACE.labels("no_detection").inc()
+        response.update(
+            emotion="neutral",  # Default to neutral instead of no_face
+            confidence=30,  # Low confidence but not zero
+            warning="no_detection"
+        )
+        return response
+
+    stage = accepted or result["stage"]
+    stage_ms = response["classify_ms"]
+    response.update(
+        emotion=push_buffer(studentId, result["emotion"], result["confidence"]),
+        confidence=result["confidence"] * 100,  # Return as percentage
+        source=stage,  # the engine that produced the answer
+        stage=stage
+    )
+    if FAST_STAGE in stage_ms:
+        response["fast_time"] = round(stage_ms[FAST_STAGE] / 1000.0, 3)
+    if stage != FAST_STAGE:
+        response["slow_time"] = round(stage_ms.get(stage, 0.0) / 1000.0, 3)
+    if not accepted:
+        response["warning"] = "budget_exhausted"
+    return response
+
 @app.route("/analyze", methods=["POST"])
 def analyze():
+    started = time.perf_counter()
     try:
-        payload = request.get_json(force=True) or {}
+        # JSON with a base64 image, or a multipart / raw image/jpeg body
+        payload, image = read_frame_request(request)
         studentId = payload.get("studentId", "")
         name = payload.get("name", "")
         classId = payload.get("classId", "")
-        b64 = payload.get("image")
 
-        if not studentId or not b64:
+        if not studentId or not image:
             return jsonify({"success": False, "error": "missing fields"}), 400
 
-        img = decode_image(b64)
+        img = decode_image(image)
         if img is None:
             return jsonify({"success": False, "error": "invalid image"}), 400
 
-        # Skip low light check for speed - let models handle it
-        
-        # Optimize image for better detection accuracy
-        # Use larger size (480px) for better face detail while maintaining speed
-        height, width = img.shape[:2]
-        target_size = 480  # Increased from 300 for better accuracy
-        if max(width, height) > target_size:
-            scale = target_size / max(width, height)
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            # Use INTER_AREA for downscaling (better quality than INTER_LINEAR)
-            img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_AREA)
-
-        # 1) Fast-pass: Use fastest backend and model
-        res_fast = None
-        t_fast = None
-        try:
-            t0 = time.time()
-            # Use 'opencv' backend (fastest) with 'OpenFace' (fastest emotion model)
-            res_fast = DeepFace.analyze(
-                img,
-                actions=['emotion'],
-                detector_backend='opencv',  # Fastest backend
-                model_name='OpenFace',  # Fastest model
-                enforce_detection=False,
-                silent=True
-            )
-            t_fast = time.time() - t0
-        except Exception as e:
-            print(f"OpenFace error: {e}")
-            res_fast = None
-
-        if res_fast:
-            # Handle both dict and list responses
-            if isinstance(res_fast, list):
-                res_fast = res_fast[0]
-            
-            if "dominant_emotion" in res_fast:
-                raw_fast = res_fast["dominant_emotion"].lower()
-                emotions_dict = res_fast.get("emotion", {})
-                # DeepFace returns emotions as percentages (0-100), convert to decimal
-                conf_raw = float(emotions_dict.get(raw_fast, 0))
-                conf_fast = conf_raw / 100.0 if conf_raw > 1.0 else conf_raw
-                region = res_fast.get("region", {})
-                
-                if small_face(region):
-                    return jsonify({
-                        "success": True,
-                        "studentId": studentId,
-                        "name": name,
-                        "classId": classId,
-                        "emotion": "no_face",
-                        "confidence": 0,
-                        "warning": "small_face"
-                    })
-                
-                # Accept OpenFace result if confidence meets threshold (lowered for speed)
-                if conf_fast >= FAST_CONFIDENCE_THRESHOLD:
-                    final = push_buffer(studentId, raw_fast)
-                    return jsonify({
-                        "success": True,
-                        "studentId": studentId,
-                        "name": name,
-                        "classId": classId,
-                        "emotion": final,
-                        "confidence": conf_fast * 100,  # Return as percentage
-                        "source": "openface",
-                        "fast_time": round(t_fast, 3)
-                    })
-                # Accept even lower confidence for speed (better than waiting for fallback)
-                elif conf_fast >= 0.25:
-                    final = push_buffer(studentId, raw_fast)
-                    return jsonify({
-                        "success": True,
-                        "studentId": studentId,
-                        "name": name,
-                        "classId": classId,
-                        "emotion": final,
-                        "confidence": conf_fast * 100,
-                        "source": "openface",
-                        "fast_time": round(t_fast, 3)
-                    })
-
-        # 2) Fallback: Try FER2013 (fastest emotion model), then VGG-Face, then default
-        res_slow = None
-        t_slow = None
-        models_to_try = ['FER2013', 'VGG-Face']  # Try FER2013 first, then VGG-Face
-        
-        for model_name in models_to_try:
-            try:
-                t0 = time.time()
-                res_slow = DeepFace.analyze(
-                    img,
-                    actions=['emotion'],
-                    detector_backend='opencv',  # Fastest backend
-                    model_name=model_name,
-                    enforce_detection=False,
-                    silent=True
-                )
-                t_slow = time.time() - t0
-                break  # Success, exit loop
-            except Exception as e:
-                print(f"{model_name} error: {e}")
-                res_slow = None
-                continue
-        
-        # Last resort: default model if both failed
-        if res_slow is None:
-            try:
-                t0 = time.time()
-                res_slow = DeepFace.analyze(
-                    img,
-                    actions=['emotion'],
-                    detector_backend='opencv',
-                    enforce_detection=False,
-                    silent=True
-                )
-                t_slow = time.time() - t0
-            except Exception as e2:
-                print(f"Default model error: {e2}")
-                res_slow = None
-
-        if res_slow:
-            # Handle both dict and list responses
-            if isinstance(res_slow, list):
-                res_slow = res_slow[0]
-            
-            if "dominant_emotion" in res_slow:
-                raw_slow = res_slow["dominant_emotion"].lower()
-                emotions_dict = res_slow.get("emotion", {})
-                # DeepFace returns emotions as percentages (0-100), convert to decimal
-                if raw_slow in emotions_dict:
-                    conf_slow = float(emotions_dict[raw_slow]) / 100.0
-                else:
-                    # If dominant emotion not in dict, use max confidence
-                    max_conf = float(max(emotions_dict.values()) if emotions_dict else 0)
-                    conf_slow = max_conf / 100.0 if max_conf > 1.0 else max_conf
-                region = res_slow.get("region", {})
-                
-                if small_face(region):
-                    return jsonify({
-                        "success": True,
-                        "studentId": studentId,
-                        "name": name,
-                        "classId": classId,
-                        "emotion": "no_face",
-                        "confidence": 0,
-                        "warning": "small_face"
-                    })
-                
-                # Accept VGG-Face result if confidence is reasonable
-                if conf_slow >= FALLBACK_CONFIDENCE_THRESHOLD:
-                    final = push_buffer(studentId, raw_slow)
-                    return jsonify({
-                        "success": True,
-                        "studentId": studentId,
-                        "name": name,
-                        "classId": classId,
-                        "emotion": final,
-                        "confidence": conf_slow * 100,  # Return as percentage
-                        "source": "fallback",
-                        "fast_time": round(t_fast, 3) if t_fast else None,
-                        "slow_time": round(t_slow, 3)
-                    })
-                # Accept even lower confidence for speed
-                elif conf_slow > 0.15:
-                    final = push_buffer(studentId, raw_slow)
-                    return jsonify({
-                        "success": True,
-                        "studentId": studentId,
-                        "name": name,
-                        "classId": classId,
-                        "emotion": final,
-                        "confidence": conf_slow * 100,
-                        "source": "fallback",
-                        "fast_time": round(t_fast, 3) if t_fast else None,
-                        "slow_time": round(t_slow, 3)
-                    })
-
-        return jsonify({
-            "success": True,
-            "studentId": studentId,
-            "name": name,
-            "classId": classId,
-            "emotion": "neutral",  # Default to neutral instead of no_face
-            "confidence": 30,  # Low confidence but not zero
-            "warning": "no_detection"
-        })
+        budget_ms = request_budget_ms(payload.get("budget_ms", request.args.get("budget_ms")))
+        return timed_jsonify(analyze_image(img, studentId, name, classId, budget_ms=budget_ms, started=started))
     except Exception as ex:
         traceback.print_exc()
         return jsonify({"success": False, "error": str(ex)}), 500
 
+def timed_jsonify(body):
+    t0 = time.perf_counter()
+    response = jsonify(body)
+    metrics.stage("serialize").since(t0)
+    return response
+
+def _decode_item(item):
+    if not isinstance(item, dict) or not item.get("image"):
+        return None
+    return decode_image(item["image"])
+
+def _prepare_item(item, img, budget_ms):
+    """Screen and face-detect one batch item; its cascade runs in _finish_item once the batch is classified."""
+    if not isinstance(item, dict):
+        return {"result": {"success": False, "error": "item must be an object"}}
+    studentId = item.get("studentId", "")
+    name = item.get("name", "")
+    classId = item.get("classId", "")
+    if not studentId or not item.get("image"):
+        return {"result": {"success": False, "studentId": studentId, "error": "missing fields"}}
+    if img is None:
+        return {"result": {"success": False, "studentId": studentId, "error": "invalid image"}}
+    prepared = {"studentId": studentId, "budget_ms": request_budget_ms(item.get("budget_ms", budget_ms)),
+                "paced": snapshot_pacer.begin(), "ran_pipeline": False}
+    try:
+        img, prepared["result"] = screen_image(img, studentId, name, classId)
+        if prepared["result"] is None:
+            prepared["ran_pipeline"] = True
+            prepared["img"] = img
+            prepared["result"], prepared["ctx"] = start_pipeline(img, studentId, name, classId, prepared["budget_ms"])
+    except Exception as ex:
+        traceback.print_exc()
+        prepared["result"] = {"success": False, "studentId": studentId, "error": str(ex)}
+    return prepared
+
+def _finish_item(prepared, started):
+    if "paced" not in prepared:
+        return prepared["result"]
+    studentId = prepared["studentId"]
+    result, ctx = prepared["result"], prepared.get("ctx")
+    try:
+        if ctx is not None:
+            spent_ms = (time.perf_counter() - started) * 1000.0
+            result = finish_pipeline(result, ctx, prepared["budget_ms"], spent_ms)
+            if result.get("success"):
+                frame_cache.store(studentId, prepared["img"], result, box=face_tracker.last_box(studentId))
+        result = dict(result)
+    except Exception as ex:
+        traceback.print_exc()
+        return {"success": False, "studentId": studentId, "error": str(ex)}
+    finally:
+        snapshot_pacer.end(prepared["paced"], prepared["ran_pipeline"])
+    if result.get("success"):
+        result["next_snapshot_ms"] = snapshot_pacer.hint(emotion_buffer.stable_for(studentId))
+    return result
+
+@app.route("/analyze_batch", methods=["POST"])
+def analyze_batch():
+    """
+    Analyze [{studentId, name, classId, image}, ...] in one call; results keep input order.
+
+    Faces are detected for every item first, then all crops go through the
+    fast pass together in one predict_batch call (see classify_batch); only
+    items the fast pass is unsure of go on to the fallback, one by one.
+    """
+    started = time.perf_counter()
+    try:
+        t0 = time.perf_counter()
+        payload = request.get_json(force=True) or {}
+        metrics.stage("json_parse").since(t0)
+        items = payload.get("items") if isinstance(payload, dict) else payload
+        budget_ms = payload.get("budget_ms") if isinstance(payload, dict) else None
+        if not isinstance(items, list) or not items:
+            return jsonify({"success": False, "error": "missing items"}), 400
+        if len(items) > BATCH_MAX_ITEMS:
+            return jsonify({"success": False, "error": f"too many items (max {BATCH_MAX_ITEMS})"}), 413
+
+        images = list(batch_pool.map(_decode_item, items))
+        prepared = list(batch_pool.map(lambda item, img: _prepare_item(item, img, budget_ms), items, images))
+        classify_batch([p["ctx"] for p in prepared if p.get("ctx") is not None])
+        results = list(batch_pool.map(lambda p: _finish_item(p, started), prepared))
+        return timed_jsonify({"success": True, "count": len(results), "results": results})
+    except Exception as ex:
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(ex)}), 500
+
+# Warm-up: load every model the pipeline can reach and run it on synthetic
+# frames; /ready answers 503 until this has finished.
+WARMUP_ON_START = os.environ.get("WARMUP_ON_START", "1") == "1"
+_warm_frame = synthetic_frame(480, 360)
+
+def _warm_emotion():
+    emotion_engine.predict_batch([_warm_frame])
+    emotion_engine.predict_batch([_warm_frame] * BATCH_MAX_SIZE)
+
+warmup = ModelWarmup(runs=int(os.environ.get("WARMUP_RUNS", 3)))
+warmup.add("opencv_detector", lambda: detect_face(_warm_frame, detector_backend='opencv'))
+warmup.add("emotion", _warm_emotion, load=emotion_engine.load)
+if fallback_engine is not None:
+    # Every cascade stage is warmed: the fast pass above, the fallback here
+    warmup.add("fallback_emotion", lambda: _fallback_stage({"face": _warm_frame}), load=fallback_engine.load)
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    status = warmup.status()
+    return jsonify(status), (200 if status["ready"] else 503)
+
 @app.route("/health", methods=["GET"])
 def health():
     return jsonify({
         "status": "ok",
+        "ready": warmup.is_ready(),
         "mode": "hybrid",
-        "openface_threshold": FAST_CONFIDENCE_THRESHOLD,
-        "fallback_threshold": FALLBACK_CONFIDENCE_THRESHOLD
+        "engine": emotion_engine.name,
+        "fallback_engine": fallback_engine.name if fallback_engine is not None else None,
+        "fast_threshold": FAST_CONFIDENCE_THRESHOLD,
+        "fallback_threshold": FALLBACK_CONFIDENCE_THRESHOLD,
+        "default_budget_ms": DEFAULT_BUDGET_MS,
+        "cascade": cascade.describe(),
+        "batching": emotion_batcher.stats(),
+        "tracker": face_tracker.stats(),
+        "frame_cache": frame_cache.stats(),
+        "smoothing": emotion_buffer.stats(),
+        "quality_gate": quality_gate.stats() if QUALITY_GATE else None,
+        "pacing": snapshot_pacer.stats()
     })
 
 if __name__ == "__main__":
-    print("Hybrid AI server (OpenFace -> Facenet512) running on http://0.0.0.0:8000")
+    print(f"Hybrid AI server ({' -> '.join(stage.name for stage in cascade.stages)}) running on http://0.0.0.0:8000")
+    if WARMUP_ON_START:
+        warmup.start()
     app.run(host="0.0.0.0", port=8000, debug=False)
 
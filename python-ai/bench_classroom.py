@@ -0,0 +1,66 @@
+# bench_classroom.py
+# Classification latency vs faces per frame: one model call per face vs one batched call for all of them
+#
+# Usage:
+#   python bench_classroom.py
+#   EMOTION_ENGINE=onnx python bench_classroom.py --faces 1 4 16 32 --runs 20
+#   python bench_classroom.py --deepface       # also time DeepFace.analyze per face (the old /analyze path)
+#
+# Detection is one Haar pass over the frame whatever the face count, so only
+# the classification step is timed here.
+
+import argparse
+import time
+import numpy as np
+import cv2
+from emotion_engine import create_engine
+from warmup import synthetic_frame
+
+
+def make_crops(count, seed=0):
+    rng = np.random.default_rng(seed)
+    face = cv2.resize(synthetic_frame(), (96, 96), interpolation=cv2.INTER_AREA).astype(np.int16)
+    return [np.clip(face + rng.normal(0, 6, face.shape), 0, 255).astype(np.uint8) for _ in range(count)]
+
+
+def best_ms(fn, runs):
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark batched multi-face classification')
+    parser.add_argument('--faces', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--engine', default=None, help='deepface, onnx or torch (default: EMOTION_ENGINE)')
+    parser.add_argument('--deepface', action='store_true', help='also time one DeepFace.analyze call per face')
+    args = parser.parse_args()
+
+    engine = create_engine(args.engine)
+    engine.load()
+    engine.predict_batch(make_crops(max(args.faces)))  # warm every batch shape path
+
+    print(f"engine {engine.name}, median of {args.runs} runs")
+    header = f"{'faces':>5} {'per-face ms':>12} {'batched ms':>11} {'ms/face':>8} {'speedup':>8}"
+    if args.deepface:
+        from deepface import DeepFace
+        header += f" {'DeepFace.analyze ms':>20}"
+    print(header)
+    for count in args.faces:
+        crops = make_crops(count)
+        looped = best_ms(lambda: [engine.predict_batch([crop]) for crop in crops], args.runs)
+        batched = best_ms(lambda: engine.predict_batch(crops), args.runs)
+        line = f"{count:>5} {looped:>12.2f} {batched:>11.2f} {batched / count:>8.2f} {looped / batched:>7.1f}x"
+        if args.deepface:
+            analyzed = best_ms(lambda: [DeepFace.analyze(crop, actions=['emotion'], enforce_detection=False,
+                                                         silent=True) for crop in crops], max(1, args.runs // 5))
+            line += f" {analyzed:>20.2f}"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
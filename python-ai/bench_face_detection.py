@@ -0,0 +1,148 @@
+# bench_face_detection.py
+# Recall and latency: api_server's full-frame Haar settings vs ThumbnailFaceDetector on local dataset images
+#
+# Usage:
+#   python bench_face_detection.py
+#   python bench_face_detection.py --samples 500 --thumb-sizes 320 400 480 --scale-factors 1.1 1.15 --equalize
+#
+# The datasets hold tight face crops, so two sets are scored:
+#   frames  each crop pasted at a random size and place into a 640x480 frame with
+#           a textured background; the paste rectangle is the ground truth
+#   crops   the crops as they are (a face is present in every one)
+
+import argparse
+import glob
+import os
+import random
+import time
+import numpy as np
+import cv2
+from face_detection import ThumbnailFaceDetector, HAAR_CASCADE_PATH
+from quantize_model import DATASET_DIRS
+
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png')
+
+
+class LegacyDetector:
+    """api_server.py before ThumbnailFaceDetector: upscale to 224, CLAHE on the full frame, Haar 1.05/3/50"""
+
+    def __init__(self):
+        self.cascade = cv2.CascadeClassifier(HAAR_CASCADE_PATH)
+        self.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+
+    def __call__(self, img):
+        height, width = img.shape[:2]
+        scale = 1.0
+        if height < 224 or width < 224:
+            scale = max(224 / height, 224 / width)
+            img = cv2.resize(img, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_LINEAR)
+        lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
+        l, a, b = cv2.split(lab)
+        img = cv2.cvtColor(cv2.merge([self.clahe.apply(l), a, b]), cv2.COLOR_LAB2BGR)
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        faces = self.cascade.detectMultiScale(gray, scaleFactor=1.05, minNeighbors=3, minSize=(50, 50),
+                                              flags=cv2.CASCADE_SCALE_IMAGE)
+        return [tuple(int(v / scale) for v in f) for f in faces]
+
+
+def find_images(limit, seed):
+    paths = []
+    for data_dir in DATASET_DIRS.values():
+        for pattern in IMAGE_PATTERNS:
+            paths.extend(glob.glob(os.path.join(data_dir, '*', '*', pattern)))
+    if not paths:
+        raise SystemExit("ERROR: No images found under data/*/<split>/<class>/")
+    random.Random(seed).shuffle(paths)
+    return paths[:limit]
+
+
+def background(rng, width=640, height=480):
+    base = np.linspace(rng.integers(40, 120), rng.integers(120, 220), width, dtype=np.float32)[None, :, None]
+    noise = cv2.GaussianBlur(rng.normal(0, 25, (height, width, 3)).astype(np.float32), (0, 0), 3)
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+
+def make_frames(crops, seed):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for crop in crops:
+        frame = background(rng)
+        size = int(rng.integers(90, 260))
+        x, y = int(rng.integers(0, 640 - size)), int(rng.integers(0, 480 - size))
+        frame[y:y + size, x:x + size] = cv2.resize(crop, (size, size), interpolation=cv2.INTER_LINEAR)
+        frames.append((frame, (x, y, size, size)))
+    return frames
+
+
+def iou(a, b):
+    ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    return inter / float(a[2] * a[3] + b[2] * b[3] - inter)
+
+
+def legacy_min_size(img):
+    """The legacy 50 px minimum applies after upscaling to 224, i.e. less than 50 px of a small crop"""
+    return 50 / max(1.0, 224 / min(img.shape[:2]))
+
+
+def score(detector, samples, min_iou):
+    """Recall (ground truth box matched, or any box when truth is None), false positives per image, latency"""
+    found, false_positives, times = 0, 0, []
+    for img, truth in samples:
+        t0 = time.perf_counter()
+        boxes = detector(img) if isinstance(detector, LegacyDetector) else detector(img, legacy_min_size(img))
+        times.append((time.perf_counter() - t0) * 1000.0)
+        if truth is None:
+            found += bool(len(boxes))
+            continue
+        matches = [iou(box, truth) >= min_iou for box in boxes]
+        found += any(matches)
+        false_positives += len(matches) - sum(matches)
+    times = np.asarray(times)
+    return {
+        'recall': found / len(samples),
+        'fp_per_image': false_positives / len(samples),
+        'mean_ms': float(times.mean()),
+        'p95_ms': float(np.percentile(times, 95)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark thumbnail Haar detection against the legacy settings')
+    parser.add_argument('--samples', type=int, default=300)
+    parser.add_argument('--thumb-sizes', type=int, nargs='+', default=[320, 400, 480])
+    parser.add_argument('--scale-factors', type=float, nargs='+', default=[1.1, 1.15])
+    parser.add_argument('--min-neighbors', type=int, default=3)
+    parser.add_argument('--equalize', action='store_true', help='equalizeHist the thumbnails')
+    parser.add_argument('--min-iou', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    crops = [img for img in (cv2.imread(p) for p in find_images(args.samples, args.seed)) if img is not None]
+    sets = {
+        'frames': make_frames(crops, args.seed),
+        'crops': [(img, None) for img in crops],
+    }
+
+    detectors = [('legacy 1.05/3 full frame', LegacyDetector())]
+    for thumb in args.thumb_sizes:
+        for factor in args.scale_factors:
+            detectors.append((f'thumb {thumb} {factor}/{args.min_neighbors}',
+                              ThumbnailFaceDetector(thumb, factor, args.min_neighbors, equalize=args.equalize)))
+
+    for set_name, samples in sets.items():
+        print()
+        print(f"{set_name}: {len(samples)} images"
+              + (" (640x480, face 90-260 px)" if set_name == 'frames' else " (dataset crops, 48-100 px)"))
+        print(f"{'detector':<28} {'recall':>7} {'FP/img':>7} {'mean ms':>8} {'p95 ms':>8} {'speedup':>8}")
+        baseline = None
+        for name, detector in detectors:
+            result = score(detector, samples, args.min_iou)
+            baseline = baseline or result['mean_ms']
+            print(f"{name:<28} {result['recall']:>7.1%} {result['fp_per_image']:>7.2f} {result['mean_ms']:>8.2f} "
+                  f"{result['p95_ms']:>8.2f} {baseline / result['mean_ms']:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# bench_frame_queue.py
+# Latest-frame-wins under overload: students stream faster than a running api_server_async.py can analyse
+#
+# Usage:
+#   ASYNC_INFERENCE_WORKERS=1 python api_server_async.py &
+#   python bench_frame_queue.py --url http://localhost:8000 --students 8 --fps 20 --seconds 10
+#
+# Every student sends frames at --fps on its own /stream session without waiting
+# for replies. Without the per-student queue each result would be older than
+# the last, growing with the backlog; with it, stale frames are superseded or
+# expire and the age of the results that do come back stays bounded.
+
+import argparse
+import asyncio
+import time
+import numpy as np
+import aiohttp
+from bench_stream import make_frames
+
+
+async def student(url, student_id, frames, fps, seconds):
+    sent, outcomes, ages = {}, {}, []
+    async with aiohttp.ClientSession() as session:
+        async with session.ws_connect(f'{url}/stream', max_msg_size=0) as ws:
+            await ws.send_json({'type': 'hello', 'studentId': student_id, 'name': 'bench', 'classId': 'bench'})
+            ready = await ws.receive_json()
+            if ready.get('type') != 'ready':
+                raise SystemExit(f"Stream not ready: {ready}")
+
+            async def send():
+                seq, end = 0, time.perf_counter() + seconds
+                while time.perf_counter() < end:
+                    seq += 1
+                    sent[seq] = time.perf_counter()
+                    await ws.send_bytes(frames[seq % len(frames)])
+                    await asyncio.sleep(1.0 / fps)
+                return seq
+
+            async def receive():
+                while True:
+                    body = await ws.receive_json()
+                    seq = body.get('seq')
+                    if seq is None:
+                        continue
+                    kind = body['type'] if body['type'] != 'busy' else body.get('reason')
+                    outcomes[kind] = outcomes.get(kind, 0) + 1
+                    if kind == 'result':
+                        ages.append((time.perf_counter() - sent[seq]) * 1000.0)
+
+            receiver = asyncio.ensure_future(receive())
+            total = await send()
+            # Let the last frames drain
+            while sum(outcomes.values()) < total:
+                await asyncio.sleep(0.05)
+            receiver.cancel()
+    return total, outcomes, ages
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Benchmark latest-frame-wins ingestion under overload')
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--students', type=int, default=8)
+    parser.add_argument('--fps', type=float, default=20)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--image', default=None, help='frame to send (default: synthetic face)')
+    args = parser.parse_args()
+
+    frames = make_frames(50, args.image)
+    results = await asyncio.gather(*[
+        student(args.url, f'bench-{i}', frames, args.fps, args.seconds) for i in range(args.students)])
+
+    total = sum(r[0] for r in results)
+    outcomes = {}
+    for _, counts, _ in results:
+        for kind, count in counts.items():
+            outcomes[kind] = outcomes.get(kind, 0) + count
+    ages = np.asarray([age for r in results for age in r[2]])
+    print(f"{args.students} students x {args.fps:g} fps for {args.seconds:g} s: {total} frames sent")
+    for kind, count in sorted(outcomes.items()):
+        print(f"  {kind:<18} {count:>6} ({count / total:.1%})")
+    if len(ages):
+        print(f"result age ms: p50 {np.percentile(ages, 50):.0f}  p95 {np.percentile(ages, 95):.0f}  max {ages.max():.0f}")
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f'{args.url}/health') as resp:
+            health = await resp.json()
+    print(f"server frames: {health.get('frames')}")
+    print(f"server admission rejected: {health['admission']['rejected']}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
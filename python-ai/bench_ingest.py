@@ -0,0 +1,92 @@
+# bench_ingest.py
+# Compare /analyze ingestion paths: JSON + base64 data URL vs multipart vs raw image/jpeg body
+#
+# Usage: python bench_ingest.py [--image frame.jpg] [--quality 80] [--iterations 500]
+
+import argparse
+import base64
+import io
+import json
+import time
+import numpy as np
+import cv2
+from flask import Flask, request
+from frame_io import decode_frame, read_frame_request
+from warmup import synthetic_frame
+
+
+def make_frame(path=None):
+    if path:
+        img = cv2.imread(path)
+        if img is None:
+            raise SystemExit(f"Could not read {path}")
+        return img
+    # Synthetic webcam frame with sensor noise so JPEG size is realistic
+    img = synthetic_frame().astype(np.int16)
+    img += np.random.default_rng(0).normal(0, 6, img.shape).astype(np.int16)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def time_path(app, iterations, make_request):
+    """
+    Median/p95 microseconds to parse the request and decode the frame.
+
+    `make_request()` returns fresh test_request_context kwargs; upload
+    streams are consumed on read so they are rebuilt every iteration.
+    """
+    timings = []
+    wire_bytes = None
+    for _ in range(iterations):
+        with app.test_request_context('/analyze', method='POST', **make_request()) as ctx:
+            wire_bytes = ctx.request.content_length
+            t0 = time.perf_counter()
+            fields, image = read_frame_request(request)
+            img = decode_frame(image)
+            timings.append((time.perf_counter() - t0) * 1e6)
+            assert img is not None and fields.get('studentId') == 'bench'
+    return wire_bytes, float(np.median(timings)), float(np.percentile(timings, 95))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark /analyze ingestion paths')
+    parser.add_argument('--image', type=str, default=None, help='JPEG/PNG frame to send (default: synthetic 640x480)')
+    parser.add_argument('--quality', type=int, default=80, help='JPEG quality')
+    parser.add_argument('--iterations', type=int, default=500)
+    args = parser.parse_args()
+
+    frame = make_frame(args.image)
+    ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, args.quality])
+    if not ok:
+        raise SystemExit('JPEG encode failed')
+    jpeg = encoded.tobytes()
+
+    meta = {'studentId': 'bench', 'name': 'Bench', 'classId': 'c1'}
+    data_url = 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode('ascii')
+    json_body = json.dumps(dict(meta, image=data_url)).encode('utf-8')
+
+    app = Flask(__name__)
+    paths = {
+        'json+base64': lambda: dict(data=json_body, content_type='application/json'),
+        'multipart': lambda: dict(data=dict(meta, image=(io.BytesIO(jpeg), 'frame.jpg')),
+                                  content_type='multipart/form-data'),
+        'raw image/jpeg': lambda: dict(data=jpeg, content_type='image/jpeg', query_string=meta),
+    }
+
+    # Imdecode alone is the floor every path pays
+    decode_only = []
+    for _ in range(args.iterations):
+        t0 = time.perf_counter()
+        cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+        decode_only.append((time.perf_counter() - t0) * 1e6)
+
+    print(f"Frame: {frame.shape[1]}x{frame.shape[0]}, JPEG q={args.quality}: {len(jpeg)} bytes")
+    print(f"cv2.imdecode alone: {np.median(decode_only):.0f} us (median)")
+    print()
+    print(f"{'path':<16} {'bytes on wire':>14} {'overhead':>9} {'p50 us':>9} {'p95 us':>9}")
+    for name, make_request in paths.items():
+        size, p50, p95 = time_path(app, args.iterations, make_request)
+        print(f"{name:<16} {size:>14} {100.0 * (size - len(jpeg)) / len(jpeg):>8.1f}% {p50:>9.0f} {p95:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
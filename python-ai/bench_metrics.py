@@ -0,0 +1,79 @@
+# bench_metrics.py
+# Cost of metrics.py instrumentation: one stage observation (with and without a Server-Timing collector), counter and gauge updates, rendering /metrics
+#
+# Usage:
+#   python bench_metrics.py
+#   python bench_metrics.py --calls 1000000 --threads 4
+#   python bench_metrics.py --multiprocess        # file-backed registry, as behind serve_prefork.py
+
+import argparse
+import tempfile
+import threading
+import time
+import metrics
+import server_timing
+
+
+def per_call_us(fn, calls, threads):
+    def loop():
+        for _ in range(calls):
+            fn()
+
+    workers = [threading.Thread(target=loop) for _ in range(threads)]
+    t0 = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - t0) * 1e6 / (calls * threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark metrics instrumentation overhead')
+    parser.add_argument('--calls', type=int, default=200000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--multiprocess', action='store_true', help='keep values in an mmap file (METRICS_MULTIPROC_DIR)')
+    args = parser.parse_args()
+
+    registry = metrics.Registry(tempfile.mkdtemp(prefix='bench-metrics-') if args.multiprocess else None)
+    stages = registry.histogram('bench_stage_seconds', 'bench', ('stage',))
+    counter = registry.counter('bench_total', 'bench', ('stage', 'outcome'))
+    gauge = registry.gauge('bench_in_flight', 'bench', ('endpoint',))
+
+    def stage_timer():
+        t0 = time.perf_counter()
+        stages.labels('imdecode').since(t0)
+
+    def stage_with_timing():
+        token = server_timing.activate(server_timing.RequestTiming('bench'))
+        t0 = time.perf_counter()
+        metrics.stage('bench').since(t0)
+        server_timing.deactivate(token)
+
+    def bare_timer():
+        # What the stage code pays without metrics: the two clock reads
+        t0 = time.perf_counter()
+        time.perf_counter() - t0
+
+    cases = [
+        ('perf_counter pair (baseline)', bare_timer),
+        ('histogram .since()', stage_timer),
+        ('metrics.stage().since()', lambda: metrics.stage('bench').since(time.perf_counter())),
+        ('  + Server-Timing (incl. set)', stage_with_timing),
+        ('counter .labels().inc()', lambda: counter.labels('openface', 'accepted').inc()),
+        ('gauge inc + dec', lambda: (gauge.labels('analyze').inc(), gauge.labels('analyze').dec())),
+    ]
+    print(f"{'operation':<30}" + ''.join(f"{f'{n} thr us':>12}" for n in args.threads))
+    for name, fn in cases:
+        print(f"{name:<30}" + ''.join(f"{per_call_us(fn, args.calls, n):>12.3f}" for n in args.threads))
+
+    for i in range(12):
+        stages.labels(f'stage{i}').observe(0.001 * i)
+        counter.labels(f'stage{i}', 'accepted').inc()
+    t0 = time.perf_counter()
+    text = registry.render()
+    print(f"\nrender: {len(text.splitlines())} lines in {(time.perf_counter() - t0) * 1000.0:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
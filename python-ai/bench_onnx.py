@@ -0,0 +1,131 @@
+# bench_onnx.py
+# Parity (same BGR crops through both engines) and latency: PyTorch EmotionResNet34 vs the exported ONNX model on ONNX Runtime (CPU)
+#
+# Usage:
+#   python bench_onnx.py --model models/emotion_resnet34_best.pth
+#   python bench_onnx.py --model models/emotion_resnet34_best.pth --onnx models/exported/emotion_resnet34_best.onnx
+#   python bench_onnx.py   # random weights: latency and export/preprocessing parity only
+
+import argparse
+import glob
+import os
+import tempfile
+import time
+import cv2
+import numpy as np
+import torch
+from train_emotion_model import EmotionResNet34, CONFIG
+from export_model import export_to_onnx
+from onnx_engine import OnnxEmotionEngine
+from inference_custom_model import TorchEmotionEngine
+
+
+def load_torch_model(model_path):
+    model = EmotionResNet34(num_classes=CONFIG['num_classes'], pretrained=False)
+    if model_path:
+        checkpoint = torch.load(model_path, map_location='cpu')
+        model.load_state_dict(checkpoint['model_state_dict'])
+    model.eval()
+    return model
+
+
+def sample_crops(data_glob, count, crop_sizes):
+    """
+    Raw BGR face crops of several sizes, as the servers hand them to an
+    engine: dataset images rescaled to each crop size, or random pixels
+    when no images are found.
+    """
+    paths = sorted(glob.glob(data_glob))[:count]
+    rng = np.random.default_rng(0)
+    crops = []
+    for i in range(count):
+        size = crop_sizes[i % len(crop_sizes)]
+        if paths:
+            img = cv2.imread(paths[i % len(paths)], cv2.IMREAD_COLOR)
+            crops.append(cv2.resize(img, (size, size), interpolation=cv2.INTER_CUBIC))
+        else:
+            crops.append(rng.integers(0, 256, (size, size, 3), dtype=np.uint8))
+    return crops
+
+
+def median_ms(fn, runs):
+    fn()  # warm
+    timings = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t0) * 1000.0)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare PyTorch and ONNX Runtime emotion inference')
+    parser.add_argument('--model', type=str, default=None, help='Trained checkpoint (.pth); random weights if omitted')
+    parser.add_argument('--onnx', type=str, default=None, help='Exported ONNX model; exported from --model if omitted')
+    parser.add_argument('--data', type=str, default='data/*/train/*/*.jpg', help='Images used for the parity check')
+    parser.add_argument('--parity-samples', type=int, default=64)
+    parser.add_argument('--crop-sizes', type=int, nargs='+', default=[64, 112, 180, 260],
+                        help='Face-crop sizes fed to both engines for the parity check')
+    parser.add_argument('--tolerance', type=float, default=1e-4, help='Max allowed probability difference')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=None, help='Threads for both runtimes (default: all CPUs)')
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model = load_torch_model(args.model)
+
+    tmp_dir = tempfile.mkdtemp(prefix='emotion_onnx_')
+    checkpoint_path = args.model
+    if checkpoint_path is None:
+        if args.onnx:
+            raise SystemExit('--onnx needs the --model checkpoint it was exported from')
+        checkpoint_path = os.path.join(tmp_dir, 'random_init.pth')
+        torch.save({'model_state_dict': model.state_dict()}, checkpoint_path)
+    onnx_path = args.onnx or export_to_onnx(checkpoint_path, os.path.join(tmp_dir, 'emotion_resnet34.onnx'),
+                                            image_size=CONFIG['image_size'])
+
+    engine = OnnxEmotionEngine(onnx_path, intra_op_threads=args.threads or None)
+    engine.load()
+    torch_engine = TorchEmotionEngine(checkpoint_path)
+
+    # Parity end to end: both engines' predict_batch on the same raw BGR crops,
+    # so preprocessing differences show up as well as runtime differences
+    crops = sample_crops(args.data, args.parity_samples, args.crop_sizes)
+    labels = list(engine.labels)
+    torch_probs = np.array([[p[k] for k in labels] for p in torch_engine.predict_batch(crops)]) / 100.0
+    ort_probs = np.array([[p[k] for k in labels] for p in engine.predict_batch(crops)]) / 100.0
+    max_diff = float(np.abs(torch_probs - ort_probs).max())
+    top1 = float((torch_probs.argmax(axis=1) == ort_probs.argmax(axis=1)).mean())
+    status = 'PASS' if max_diff <= args.tolerance and top1 == 1.0 else 'FAIL'
+    print(f"Parity on {len(crops)} BGR crops ({', '.join(map(str, args.crop_sizes))} px): "
+          f"max |p_torch - p_onnx| = {max_diff:.2e}, "
+          f"top-1 agreement {top1:.1%} -> {status} (tolerance {args.tolerance:g})")
+
+    # Latency
+    size = CONFIG['image_size']
+    print()
+    print(f"{'batch':>5} {'torch ms':>10} {'onnx ms':>10} {'torch ms/img':>13} {'onnx ms/img':>12} {'speedup':>8}")
+    for batch_size in args.batch_sizes:
+        batch = torch.randn(batch_size, 3, size, size)
+        batch_np = batch.numpy()
+
+        def run_torch():
+            with torch.inference_mode():
+                model(batch)
+
+        torch_ms = median_ms(run_torch, args.runs)
+        onnx_ms = median_ms(lambda: engine.predict_logits(batch_np), args.runs)
+        print(f"{batch_size:>5} {torch_ms:>10.2f} {onnx_ms:>10.2f} {torch_ms / batch_size:>13.2f} "
+              f"{onnx_ms / batch_size:>12.2f} {torch_ms / onnx_ms:>7.2f}x")
+
+    if not args.onnx:
+        print(f"\nExported model kept at {onnx_path}")
+    if status == 'FAIL':
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
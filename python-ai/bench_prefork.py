@@ -0,0 +1,189 @@
+# bench_prefork.py
+# Per-worker memory and throughput scaling of serve_prefork.py from 1 to N workers
+#
+# Usage:
+#   python bench_prefork.py                               # 1, 2, 4, ... up to the CPU count
+#   python bench_prefork.py --workers 1 2 4 8 --image face.jpg --duration 20
+#   PREFORK_APP=api_server python bench_prefork.py
+#   EMOTION_ENGINE=torch python bench_prefork.py --workers 2 4 --request-timeout 10
+#
+# A worker that hangs on its first inference after the fork (see
+# SINGLE_THREAD_ENV in serve_prefork.py) shows up as timeouts and max ms.
+#
+# Memory comes from /proc/<pid>/smaps_rollup (Linux): USS (private pages) is
+# what each extra worker really costs; PSS splits the shared weight pages
+# fairly between the processes mapping them.
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import numpy as np
+import cv2
+from warmup import synthetic_frame
+from serve_prefork import available_cpus
+
+
+def read_smaps_rollup(pid):
+    """{'rss', 'pss', 'uss', 'shared'} in MB for one process"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[-1] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    uss = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    shared = fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0)
+    return {
+        'rss': fields.get('Rss', 0) / 1024.0,
+        'pss': fields.get('Pss', 0) / 1024.0,
+        'uss': uss / 1024.0,
+        'shared': shared / 1024.0,
+    }
+
+
+def child_pids(pid):
+    children = []
+    task_dir = f'/proc/{pid}/task'
+    for tid in os.listdir(task_dir):
+        try:
+            with open(os.path.join(task_dir, tid, 'children')) as f:
+                children.extend(int(p) for p in f.read().split())
+        except OSError:
+            pass
+    return children
+
+
+def wait_ready(base_url, proc, timeout_s):
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            with urllib.request.urlopen(f'{base_url}/ready', timeout=2) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"server not ready after {timeout_s}s")
+
+
+def load_test(url, body, concurrency, duration_s, timeout_s=60.0):
+    """
+    Closed-loop load: `concurrency` clients posting the frame back to back.
+
+    Every request uses a fresh studentId so the per-student frame cache
+    cannot answer it and each one runs the full pipeline.
+
+    Returns (req/s, latencies, errors, timeouts).
+    """
+    latencies = []
+    errors = [0]
+    timeouts = [0]
+    lock = threading.Lock()
+    stop_at = time.time() + duration_s
+
+    def client(index):
+        sent = 0
+        while time.time() < stop_at:
+            sent += 1
+            target = f'{url}?studentId=bench-{index}-{sent}&name=bench&classId=bench'
+            request = urllib.request.Request(target, data=body, headers={'Content-Type': 'image/jpeg'})
+            t0 = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=timeout_s) as response:
+                    response.read()
+                ms = (time.perf_counter() - t0) * 1000.0
+                with lock:
+                    latencies.append(ms)
+            except (socket.timeout, TimeoutError):
+                with lock:
+                    timeouts[0] += 1
+            except Exception as e:
+                if isinstance(getattr(e, 'reason', None), (socket.timeout, TimeoutError)):
+                    with lock:
+                        timeouts[0] += 1
+                    continue
+                with lock:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return len(latencies) / elapsed, latencies, errors[0], timeouts[0]
+
+
+def default_worker_counts():
+    counts, n = [], 1
+    while n < available_cpus():
+        counts.append(n)
+        n *= 2
+    counts.append(available_cpus())
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark serve_prefork.py worker scaling')
+    parser.add_argument('--workers', type=int, nargs='+', default=None, help='Worker counts (default: 1, 2, 4 .. CPUs)')
+    parser.add_argument('--image', type=str, default=None, help='Frame to post (default: synthetic 640x480)')
+    parser.add_argument('--duration', type=float, default=15.0, help='Seconds of load per worker count')
+    parser.add_argument('--clients-per-worker', type=int, default=2)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--ready-timeout', type=float, default=600.0)
+    parser.add_argument('--request-timeout', type=float, default=60.0, help='Seconds before a request counts as hung')
+    args = parser.parse_args()
+
+    frame = cv2.imread(args.image) if args.image else synthetic_frame()
+    body = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+    url = f'http://127.0.0.1:{args.port}'
+    counts = args.workers or default_worker_counts()
+
+    print(f"App: {os.environ.get('PREFORK_APP', 'api_server_hybrid')}, CPUs: {available_cpus()}, "
+          f"frame: {len(body)} bytes")
+    print(f"{'workers':>7} {'req/s':>8} {'scale':>6} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'errors':>6} {'timeouts':>8} "
+          f"{'master RSS':>10} {'worker RSS':>10} {'worker USS':>10} {'worker PSS':>10} {'total PSS':>10}")
+
+    baseline = None
+    for workers in counts:
+        env = dict(os.environ, PORT=str(args.port), PREFORK_WORKERS=str(workers))
+        proc = subprocess.Popen([sys.executable, 'serve_prefork.py'], env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_ready(url, proc, args.ready_timeout)
+            # Workers warm up before they accept; this only primes their lazy threads (micro-batcher, pools).
+            # Its timeouts count too: the first inferences after the fork are the ones that could hang.
+            _, _, _, prime_timeouts = load_test(f'{url}/analyze', body, workers * args.clients_per_worker, 2.0,
+                                                args.request_timeout)
+            rps, latencies, errors, timeouts = load_test(f'{url}/analyze', body, workers * args.clients_per_worker,
+                                                         args.duration, args.request_timeout)
+            timeouts += prime_timeouts
+
+            master = read_smaps_rollup(proc.pid)
+            worker_mem = [read_smaps_rollup(pid) for pid in child_pids(proc.pid)]
+            mean = {k: float(np.mean([m[k] for m in worker_mem])) if worker_mem else 0.0 for k in master}
+            total_pss = master['pss'] + sum(m['pss'] for m in worker_mem)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+        baseline = baseline or rps or 1.0
+        p50 = float(np.percentile(latencies, 50)) if latencies else 0.0
+        p95 = float(np.percentile(latencies, 95)) if latencies else 0.0
+        worst = max(latencies) if latencies else 0.0
+        print(f"{workers:>7} {rps:>8.1f} {rps / baseline:>5.2f}x {p50:>8.1f} {p95:>8.1f} {worst:>8.1f} {errors:>6} {timeouts:>8} "
+              f"{master['rss']:>8.0f}MB {mean['rss']:>8.0f}MB {mean['uss']:>8.0f}MB {mean['pss']:>8.0f}MB "
+              f"{total_pss:>8.0f}MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# bench_preprocess.py
+# Parity and latency: PIL/torchvision validation transform vs the PIL-free FacePreprocessor
+#
+# Usage:
+#   python bench_preprocess.py
+#   python bench_preprocess.py --data 'data/ck+/train/*/*.jpg' --samples 500 --crop-sizes 96 160 240 320
+
+import argparse
+import glob
+import time
+import numpy as np
+import cv2
+import torch
+from PIL import Image
+from train_emotion_model import EmotionAugmentation, CONFIG
+from preprocessing import FacePreprocessor, decode_bgr
+
+# One grey level after normalisation is 1 / (255 * min(std)) ~= 0.0175
+ONE_LEVEL = 1.0 / (255.0 * 0.224)
+
+
+def pil_path(encoded, transform):
+    """What CustomEmotionDetector used to do: decode with PIL, then torchvision transforms."""
+    from io import BytesIO
+    return transform(Image.open(BytesIO(encoded)).convert('RGB')).unsqueeze(0)
+
+
+def array_pil_path(img, transform):
+    """The old ndarray route: BGR -> RGB -> PIL Image -> torchvision transforms."""
+    return transform(Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))).unsqueeze(0)
+
+
+def median_us(fn, runs):
+    fn()
+    timings = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t0) * 1e6)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare PIL and PIL-free preprocessing')
+    parser.add_argument('--data', type=str, default='data/*/train/*/*.jpg')
+    parser.add_argument('--samples', type=int, default=300)
+    parser.add_argument('--crop-sizes', type=int, nargs='+', default=[48, 96, 160, 240, 320],
+                        help='Square face-crop sizes for the array path (camera crops are usually larger than 112)')
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    transform = EmotionAugmentation(is_training=False)
+    preprocessor = FacePreprocessor(CONFIG['image_size'])
+
+    paths = sorted(glob.glob(args.data))
+    paths = paths[::max(1, len(paths) // args.samples)][:args.samples]
+    if not paths:
+        raise SystemExit(f"No images match {args.data}")
+
+    # Parity on dataset files: encoded bytes through both decoders
+    diffs = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            encoded = f.read()
+        reference = pil_path(encoded, transform).numpy()
+        ours = preprocessor([decode_bgr(encoded)])
+        diffs.append(np.abs(reference - ours).max())
+    diffs = np.array(diffs)
+    print(f"Encoded files ({len(paths)}): max diff {diffs.max():.4f} ({diffs.max() / ONE_LEVEL:.2f} grey levels), "
+          f"mean {diffs.mean():.5f}")
+
+    # Parity and latency on BGR crops of several sizes
+    source = cv2.imread(paths[0], cv2.IMREAD_COLOR)
+    rng = np.random.default_rng(0)
+    print()
+    print(f"{'crop':>5} {'max diff':>9} {'levels':>7} {'PIL us':>9} {'cv2/torch us':>13} {'speedup':>8}")
+    for size in args.crop_sizes:
+        crop = cv2.resize(source, (size, size), interpolation=cv2.INTER_CUBIC)
+        crop = np.clip(crop.astype(np.int16) + rng.integers(-12, 12, crop.shape), 0, 255).astype(np.uint8)
+        diff = float(np.abs(array_pil_path(crop, transform).numpy() - preprocessor([crop])).max())
+        pil_us = median_us(lambda: array_pil_path(crop, transform), args.runs)
+        ours_us = median_us(lambda: torch.from_numpy(preprocessor([crop])), args.runs)
+        print(f"{size:>5} {diff:>9.4f} {diff / ONE_LEVEL:>7.2f} {pil_us:>9.1f} {ours_us:>13.1f} {pil_us / ours_us:>7.2f}x")
+
+    # Decode + preprocess from encoded bytes
+    with open(paths[0], 'rb') as f:
+        encoded = f.read()
+    pil_us = median_us(lambda: pil_path(encoded, transform), args.runs)
+    ours_us = median_us(lambda: torch.from_numpy(preprocessor([decode_bgr(encoded)])), args.runs)
+    print(f"\nEncoded bytes -> tensor: PIL {pil_us:.1f} us, cv2/torch {ours_us:.1f} us ({pil_us / ours_us:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# bench_quality_gate.py
+# QualityGate cost per frame and how it labels clean vs synthetically degraded frames built from local dataset images
+#
+# Usage:
+#   python bench_quality_gate.py
+#   python bench_quality_gate.py --samples 500 --thumb-size 128
+#
+# Each dataset face is pasted into a 640x480 frame (as in bench_face_detection.py)
+# and then degraded five ways; a good gate passes 'clean' and names the rest.
+
+import argparse
+import time
+import numpy as np
+import cv2
+from bench_face_detection import find_images, make_frames
+from quality_gate import QualityGate, REASONS
+
+
+def degrade(frame, kind, rng):
+    if kind == 'clean':
+        return frame
+    if kind == 'dark':
+        # Underexposed: gain ~0.15 plus sensor noise
+        noisy = frame.astype(np.float32) * rng.uniform(0.08, 0.2) + rng.normal(0, 3, frame.shape)
+        return np.clip(noisy, 0, 255).astype(np.uint8)
+    if kind == 'blurred':
+        return cv2.GaussianBlur(frame, (0, 0), rng.uniform(4, 8))
+    if kind == 'covered':
+        # A finger over the lens: a dark, featureless smear of the scene
+        smear = cv2.GaussianBlur(frame, (0, 0), 25).astype(np.float32) * rng.uniform(0.15, 0.4)
+        return np.clip(smear + rng.normal(0, 2, frame.shape), 0, 255).astype(np.uint8)
+    if kind == 'empty':
+        flat = np.full(frame.shape, rng.integers(0, 256), dtype=np.float32)
+        return np.clip(flat + rng.normal(0, 1, frame.shape), 0, 255).astype(np.uint8)
+    raise ValueError(kind)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pre-inference quality gate')
+    parser.add_argument('--samples', type=int, default=200)
+    parser.add_argument('--thumb-size', type=int, default=96)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    crops = [img for img in (cv2.imread(p) for p in find_images(args.samples, args.seed)) if img is not None]
+    frames = [frame for frame, _ in make_frames(crops, args.seed)]
+    rng = np.random.default_rng(args.seed)
+    gate = QualityGate(thumb_size=args.thumb_size)
+
+    kinds = ('clean', 'empty', 'covered', 'dark', 'blurred')
+    outcomes = ('pass',) + REASONS
+    print(f"{len(frames)} frames per kind, thumbnail {args.thumb_size} px")
+    print(f"{'kind':<9}" + ''.join(f"{o:>11}" for o in outcomes) + f"{'correct':>9} {'mean us':>8}")
+    for kind in kinds:
+        counts = dict.fromkeys(outcomes, 0)
+        times = []
+        for frame in frames:
+            img = degrade(frame, kind, rng)
+            t0 = time.perf_counter()
+            result = gate.check(img)
+            times.append((time.perf_counter() - t0) * 1e6)
+            counts[result['reason'] or 'pass'] += 1
+        expected = 'pass' if kind == 'clean' else kind
+        print(f"{kind:<9}" + ''.join(f"{counts[o]:>11}" for o in outcomes)
+              + f"{counts[expected] / len(frames):>9.1%} {np.mean(times):>8.1f}")
+
+    stats = gate.stats()
+    print()
+    print(f"gate counters: {stats['checked']} checked, {stats['rejected_total']} rejected "
+          f"({stats['reject_rate']:.1%}), mean {stats['mean_us']} us per check")
+
+
+if __name__ == '__main__':
+    main()
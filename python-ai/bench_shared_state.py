@@ -0,0 +1,129 @@
+# bench_shared_state.py
+# Pushes/sec and consistency of SharedStudentStateStore with several forked workers hitting it at once
+#
+# Usage:
+#   python bench_shared_state.py
+#   python bench_shared_state.py --workers 8 --pushes 50000 --students 10000 --hot 64
+
+import argparse
+import multiprocessing
+import os
+import random
+import time
+import numpy as np
+from emotion_engine import EMOTION_LABELS
+from student_state import SharedStudentStateStore, StudentStateStore
+
+WINDOW = 3
+
+
+def worker(store, keys, pushes, seed, start, results):
+    rng = random.Random(seed)
+    labels = EMOTION_LABELS
+    plan = [(rng.choice(keys), rng.choice(labels)) for _ in range(pushes)]
+    start.wait()
+    t0 = time.perf_counter()
+    for key, label in plan:
+        store.push(key, label, 0.5)
+    results.put((os.getpid(), pushes / (time.perf_counter() - t0)))
+
+
+def check_invariants(store):
+    """Every live slot's vote counts must be the histogram of its window; returns the number of bad slots"""
+    live = np.flatnonzero(store._arrays['fingerprint'] != 0)
+    bad = 0
+    for slot in live:
+        window = store.history[slot]
+        expected = np.bincount(window[window >= 0], minlength=store.max_labels)
+        if not np.array_equal(expected, store.votes[slot]) or int(store._filled[slot]) != int((window >= 0).sum()):
+            bad += 1
+    return bad
+
+
+def run(workers, pushes, keys_for, stripes, students):
+    store = SharedStudentStateStore(window=WINDOW, labels=EMOTION_LABELS, buckets=max(1, students // 4),
+                                    ways=8, stripes=stripes)
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    procs = []
+    for i in range(workers):
+        proc = multiprocessing.Process(target=worker, args=(store, keys_for(i), pushes, i, start, results))
+        proc.start()
+        procs.append(proc)
+    time.sleep(0.2)
+    t0 = time.perf_counter()
+    start.set()
+    rates = [results.get()[1] for _ in procs]
+    elapsed = time.perf_counter() - t0
+    for proc in procs:
+        proc.join()
+    bad = check_invariants(store)
+    stats = store.stats()
+    store._cleanup()
+    return workers * pushes / elapsed, rates, bad, stats
+
+
+def check_cross_worker():
+    """A push in one worker is visible to the next push for that student in another"""
+    store = SharedStudentStateStore(window=WINDOW, labels=EMOTION_LABELS, buckets=64, stripes=8)
+    local = StudentStateStore(window=WINDOW, labels=EMOTION_LABELS)
+    rng = random.Random(7)
+    sequence = [(f'student-{rng.randrange(20)}', rng.choice(EMOTION_LABELS)) for _ in range(300)]
+    expected = [local.push(key, label) for key, label in sequence]
+
+    # Alternate the pushes across two processes, strictly in order
+    turns = [multiprocessing.Semaphore(0) for _ in range(2)]
+    results = multiprocessing.Queue()
+
+    def player(index):
+        for i in range(index, len(sequence), 2):
+            turns[index].acquire()
+            results.put((i, store.push(*sequence[i])))
+            turns[1 - index].release()
+
+    procs = [multiprocessing.Process(target=player, args=(i,)) for i in range(2)]
+    for proc in procs:
+        proc.start()
+    turns[0].release()
+    got = dict(results.get() for _ in sequence)
+    for proc in procs:
+        proc.join()
+    store._cleanup()
+    return sum(got[i] != expected[i] for i in range(len(sequence)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the shared-memory student state store')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--pushes', type=int, default=20000, help='pushes per worker')
+    parser.add_argument('--students', type=int, default=10000)
+    parser.add_argument('--hot', type=int, default=64, help='students in the contended scenario')
+    parser.add_argument('--stripes', type=int, default=64)
+    args = parser.parse_args()
+    multiprocessing.set_start_method('fork')
+
+    mismatches = check_cross_worker()
+    print(f"Two workers alternating pushes vs one local store: {mismatches} mismatches")
+
+    all_keys = [f'student-{i}' for i in range(args.students)]
+    per_worker = args.students // args.workers
+    disjoint = lambda i: all_keys[i * per_worker:(i + 1) * per_worker]
+    hot = lambda i: all_keys[:args.hot]
+
+    print()
+    print(f"{args.workers} workers x {args.pushes} pushes, {os.cpu_count()} CPUs")
+    print(f"{'scenario':<32} {'stripes':>7} {'total/s':>10} {'worker min/s':>13} {'worker max/s':>13} {'bad slots':>9}")
+    for name, keys_for in (('disjoint students', disjoint), (f'{args.hot} hot shared students', hot)):
+        for stripes in (1, args.stripes):
+            total, rates, bad, stats = run(args.workers, args.pushes, keys_for, stripes, args.students)
+            print(f"{name:<32} {stats['stripes']:>7} {total:>10.0f} {min(rates):>13.0f} {max(rates):>13.0f} {bad:>9}")
+
+    local = StudentStateStore(window=WINDOW, labels=EMOTION_LABELS)
+    t0 = time.perf_counter()
+    for i in range(args.pushes):
+        local.push(all_keys[i % args.students], EMOTION_LABELS[i % len(EMOTION_LABELS)])
+    print(f"{'local store, one process':<32} {'-':>7} {args.pushes / (time.perf_counter() - t0):>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# bench_stream.py
+# Per-frame latency against a running api_server_async.py: POST per frame (new or kept-alive connection) vs one /stream session
+#
+# Usage:
+#   python api_server_async.py &
+#   python bench_stream.py --url http://localhost:8000 --frames 200
+#
+# Every frame carries its own sensor noise, so neither the frame cache nor the
+# stream's repeated-frame shortcut hides the analysis cost.
+
+import argparse
+import asyncio
+import time
+import numpy as np
+import cv2
+import aiohttp
+from warmup import synthetic_frame
+
+
+def make_frames(count, path=None, quality=80):
+    base = cv2.imread(path) if path else synthetic_frame()
+    if base is None:
+        raise SystemExit(f"Could not read {path}")
+    rng = np.random.default_rng(0)
+    frames = []
+    for _ in range(count):
+        noisy = np.clip(base.astype(np.int16) + rng.normal(0, 4, base.shape), 0, 255).astype(np.uint8)
+        frames.append(cv2.imencode('.jpg', noisy, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+    return frames
+
+
+async def post_frames(url, frames, student_id, keep_alive):
+    headers = {'Content-Type': 'image/jpeg', 'X-Student-Id': student_id, 'X-Student-Name': 'bench', 'X-Class-Id': 'bench'}
+    latencies, failures = [], 0
+    connector = aiohttp.TCPConnector(force_close=not keep_alive)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        for frame in frames:
+            t0 = time.perf_counter()
+            async with session.post(f'{url}/analyze', data=frame, headers=headers) as resp:
+                body = await resp.json()
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+            failures += resp.status != 200 or not body.get('success')
+    return latencies, failures
+
+
+async def stream_frames(url, frames, student_id):
+    latencies, failures = [], 0
+    async with aiohttp.ClientSession() as session:
+        async with session.ws_connect(f'{url}/stream', max_msg_size=0) as ws:
+            await ws.send_json({'type': 'hello', 'studentId': student_id, 'name': 'bench', 'classId': 'bench'})
+            ready = await ws.receive_json()
+            if ready.get('type') != 'ready':
+                raise SystemExit(f"Stream not ready: {ready}")
+            for frame in frames:
+                t0 = time.perf_counter()
+                await ws.send_bytes(frame)
+                body = await ws.receive_json()
+                latencies.append((time.perf_counter() - t0) * 1000.0)
+                failures += body.get('type') != 'result' or not body.get('success')
+    return latencies, failures
+
+
+def summarize(name, latencies, failures):
+    values = np.asarray(latencies)
+    print(f"{name:<26} {np.mean(values):>8.1f} {np.percentile(values, 50):>8.1f} "
+          f"{np.percentile(values, 95):>8.1f} {len(values) / (values.sum() / 1000.0):>8.1f} {failures:>6}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Compare per-frame POSTs with a WebSocket stream session')
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--image', default=None)
+    args = parser.parse_args()
+
+    frames = make_frames(args.frames, args.image)
+    print(f"{args.frames} frames, {np.mean([len(f) for f in frames]) / 1024:.1f} KB each, sent one at a time")
+    print(f"{'path':<26} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'fps':>8} {'failed':>6}")
+    # Separate studentIds so smoothing and tracker state don't carry over between runs
+    summarize('POST, new connection', *await post_frames(args.url, frames, 'bench-post', keep_alive=False))
+    summarize('POST, keep-alive', *await post_frames(args.url, frames, 'bench-keepalive', keep_alive=True))
+    summarize('WebSocket /stream', *await stream_frames(args.url, frames, 'bench-stream'))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+# bench_student_state.py
+# Memory and push cost: dict-of-deques smoothing buffer vs StudentStateStore at 100k students
+#
+# Usage:
+#   python bench_student_state.py
+#   python bench_student_state.py --students 100000 --pushes-per-student 5 --bounded 20000
+
+import argparse
+import random
+import time
+import tracemalloc
+from collections import deque
+from emotion_engine import EMOTION_LABELS
+from student_state import StudentStateStore
+
+WINDOW = 3
+
+
+class LegacyBuffer:
+    """The original api_server_hybrid push_buffer: unbounded dict of deques, counts rebuilt per call"""
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.buffer = {}
+
+    def push(self, key, emotion):
+        if key not in self.buffer:
+            self.buffer[key] = deque(maxlen=self.window)
+        self.buffer[key].append(emotion)
+        counts = {}
+        for e in self.buffer[key]:
+            counts[e] = counts.get(e, 0) + 1
+        return max(counts, key=counts.get)
+
+
+def check_equivalence(students, pushes, seed=0):
+    rng = random.Random(seed)
+    legacy = LegacyBuffer()
+    store = StudentStateStore(window=WINDOW, labels=EMOTION_LABELS, max_students=students, ttl_s=1e9)
+    mismatches = 0
+    for _ in range(pushes):
+        key = f'student-{rng.randrange(students)}'
+        label = rng.choice(EMOTION_LABELS[:3]) if rng.random() < 0.7 else rng.choice(EMOTION_LABELS)
+        if legacy.push(key, label) != store.push(key, label):
+            mismatches += 1
+    return mismatches
+
+
+def fill(buffer, keys, labels, pushes_per_student):
+    t0 = time.perf_counter()
+    count = 0
+    for round_index in range(pushes_per_student):
+        for i, key in enumerate(keys):
+            buffer.push(key, labels[(i + round_index) % len(labels)])
+            count += 1
+    return (time.perf_counter() - t0) * 1e6 / count
+
+
+def measure(make, keys, labels, pushes_per_student):
+    """Push cost from an untraced run (tracemalloc slows allocation), memory from a traced one"""
+    us = fill(make(), keys, labels, pushes_per_student)
+    tracemalloc.start()
+    buffer = make()
+    fill(buffer, keys, labels, pushes_per_student)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return buffer, us, current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-student smoothing state')
+    parser.add_argument('--students', type=int, default=100000)
+    parser.add_argument('--pushes-per-student', type=int, default=3)
+    parser.add_argument('--bounded', type=int, default=10000, help='max_students for the bounded run')
+    args = parser.parse_args()
+
+    mismatches = check_equivalence(1000, 200000)
+    print(f"Equivalence with the dict-of-deques buffer over 200k random pushes: {mismatches} mismatches")
+
+    # Keys are created up front so neither side is charged for the strings themselves
+    keys = [f'student{i:06d}@school.example' for i in range(args.students)]
+    labels = EMOTION_LABELS
+
+    print()
+    print(f"{args.students} students x {args.pushes_per_student} pushes (key strings excluded from traced memory)")
+    print(f"{'store':<28} {'us/push':>8} {'traced MB':>10} {'peak MB':>8} {'B/student':>10}")
+
+    legacy, us, current, peak = measure(LegacyBuffer, keys, labels, args.pushes_per_student)
+    print(f"{'dict of deques (unbounded)':<28} {us:>8.2f} {current / 2**20:>10.2f} {peak / 2**20:>8.2f} "
+          f"{current / args.students:>10.1f}")
+    del legacy
+
+    store, us, current, peak = measure(
+        lambda: StudentStateStore(window=WINDOW, labels=labels, max_students=args.students),
+        keys, labels, args.pushes_per_student)
+    print(f"{'StudentStateStore (100%)':<28} {us:>8.2f} {current / 2**20:>10.2f} {peak / 2**20:>8.2f} "
+          f"{current / args.students:>10.1f}")
+    arrays, index = store.memory_bytes()
+    print(f"  reported: arrays {arrays / 2**20:.2f} MB, index {index / 2**20:.2f} MB (index includes key strings)")
+    del store
+
+    store, us, current, peak = measure(
+        lambda: StudentStateStore(window=WINDOW, labels=labels, max_students=args.bounded),
+        keys, labels, args.pushes_per_student)
+    stats = store.stats()
+    print(f"{f'StudentStateStore ({args.bounded})':<28} {us:>8.2f} {current / 2**20:>10.2f} {peak / 2**20:>8.2f} "
+          f"{current / len(store):>10.1f}")
+    print(f"  resident students {stats['students']}, evictions {stats['evictions']}")
+
+
+if __name__ == '__main__':
+    main()
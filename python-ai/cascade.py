@@ -0,0 +1,141 @@
+# cascade.py
+# Cost-aware model cascade: stages described as data, run under a per-request latency budget
+
+import threading
+import time
+from metrics import CASCADE_STAGE_RESULTS, cascade_stage
+
+
+class Stage:
+    """
+    One step of the cascade.
+
+    Args:
+        name: stage name reported in responses
+        run: callable(ctx) -> result dict with at least 'confidence' (0-1),
+            or None when the stage produced nothing
+        accept_confidence: a result at or above this confidence is returned
+            immediately
+        prior_ms: cost estimate used until the stage has been timed
+    """
+
+    def __init__(self, name, run, accept_confidence, prior_ms=100.0):
+        self.name = name
+        self.run = run
+        self.accept_confidence = float(accept_confidence)
+        self.prior_ms = float(prior_ms)
+
+    def describe(self):
+        return {'name': self.name, 'accept_confidence': self.accept_confidence}
+
+
+class StageCostModel:
+    """Per-stage latency estimate learned online as an exponentially weighted moving average."""
+
+    def __init__(self, alpha=0.2):
+        self.alpha = float(alpha)
+        self._ms = {}
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, ms):
+        with self._lock:
+            previous = self._ms.get(name)
+            self._ms[name] = ms if previous is None else previous + self.alpha * (ms - previous)
+            self._samples[name] = self._samples.get(name, 0) + 1
+
+    def estimate(self, name, default):
+        return self._ms.get(name, default)
+
+    def snapshot(self):
+        return {name: {'ms': round(ms, 2), 'samples': self._samples.get(name, 0)}
+                for name, ms in self._ms.items()}
+
+
+class Cascade:
+    """
+    Runs stages in order until one result is accepted.
+
+    With a budget, a stage whose estimated cost would take the request past
+    the budget is skipped, and the best result seen so far is returned.
+    Every run records a trace of what ran, what was skipped and why.
+    """
+
+    def __init__(self, stages, cost_model=None):
+        self.stages = list(stages)
+        self.costs = cost_model or StageCostModel()
+
+    def run(self, ctx, budget_ms=None, spent_ms=0.0, precomputed=None):
+        """
+        Args:
+            ctx: per-request state handed to every stage
+            budget_ms: total latency budget for the request, or None
+            spent_ms: time already used by the request before the cascade
+            precomputed: {stage name: (result, ms)} for stages already run
+                outside the cascade (e.g. one forward pass over a whole
+                batch). They are not run again, and since their ms is a
+                batch's time rather than one request's, it is traced but
+                not learned by the cost model.
+
+        Returns:
+            (result, accepted_stage, trace). result is the accepted result,
+            or the highest-confidence result seen when nothing was accepted
+            (None if no stage produced one). accepted_stage is None in the
+            latter case.
+        """
+        start = time.perf_counter()
+        best, best_stage = None, None
+        trace = []
+        precomputed = precomputed or {}
+        for stage in self.stages:
+            if stage.name in precomputed:
+                result, ms = precomputed[stage.name]
+                entry = {'stage': stage.name, 'ms': round(ms, 1), 'precomputed': True}
+            else:
+                elapsed = spent_ms + (time.perf_counter() - start) * 1000.0
+                estimate = self.costs.estimate(stage.name, stage.prior_ms)
+                if budget_ms is not None and elapsed + estimate > budget_ms:
+                    trace.append({'stage': stage.name, 'skipped': 'budget', 'estimate_ms': round(estimate, 1)})
+                    CASCADE_STAGE_RESULTS.labels(stage.name, 'skipped').inc()
+                    continue
+
+                t0 = time.perf_counter()
+                try:
+                    result = stage.run(ctx)
+                except Exception as e:
+                    print(f"{stage.name} error: {e}")
+                    # A failing stage still costs time; learn that too
+                    ms = (time.perf_counter() - t0) * 1000.0
+                    self.costs.observe(stage.name, ms)
+                    cascade_stage(stage.name).observe(ms / 1000.0)
+                    CASCADE_STAGE_RESULTS.labels(stage.name, 'error').inc()
+                    trace.append({'stage': stage.name, 'ms': round(ms, 1), 'error': str(e)})
+                    continue
+                ms = (time.perf_counter() - t0) * 1000.0
+                self.costs.observe(stage.name, ms)
+                entry = {'stage': stage.name, 'ms': round(ms, 1)}
+            cascade_stage(stage.name).observe(ms / 1000.0)
+
+            trace.append(entry)
+            if result is None:
+                CASCADE_STAGE_RESULTS.labels(stage.name, 'rejected').inc()
+                continue
+            confidence = float(result.get('confidence', 0.0))
+            entry['confidence'] = round(confidence, 4)
+
+            if confidence >= stage.accept_confidence:
+                entry['accepted'] = True
+                CASCADE_STAGE_RESULTS.labels(stage.name, 'accepted').inc()
+                return result, stage.name, trace
+            CASCADE_STAGE_RESULTS.labels(stage.name, 'rejected').inc()
+            if best is None or confidence > float(best.get('confidence', 0.0)):
+                best, best_stage = result, stage.name
+
+        if best is not None:
+            best = dict(best, stage=best_stage)
+        return best, None, trace
+
+    def describe(self):
+        return [dict(stage.describe(),
+                     estimate_ms=round(self.costs.estimate(stage.name, stage.prior_ms), 2))
+                for stage in self.stages]
@@ -0,0 +1,156 @@
+# emotion_engine.py
+# Face detection and batched emotion classification shared by the API servers
+
+import os
+import threading
+import numpy as np
+import cv2
+
+# Output order of DeepFace's FER2013-trained Emotion model
+EMOTION_LABELS = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+
+# Artifacts produced by train_emotion_model.py / export_model.py
+DEFAULT_TORCH_MODEL_PATH = 'models/emotion_resnet34_best.pth'
+DEFAULT_ONNX_MODEL_PATH = 'models/exported/emotion_resnet34_best.onnx'
+
+
+def detect_faces(img, detector_backend='opencv'):
+    """
+    Detect faces in a BGR image with one of DeepFace's detector backends.
+
+    Returns:
+        list of (x, y, w, h) boxes, largest first. Empty when nothing was
+        found (DeepFace reports the whole frame in that case).
+    """
+    from deepface import DeepFace
+
+    faces = DeepFace.extract_faces(
+        img,
+        detector_backend=detector_backend,
+        enforce_detection=False,
+        align=False
+    )
+    height, width = img.shape[:2]
+    boxes = []
+    for face in faces or []:
+        area = face.get('facial_area') or {}
+        box = tuple(int(area.get(k, 0)) for k in ('x', 'y', 'w', 'h'))
+        if box[2] <= 0 or box[3] <= 0 or (box[2] >= width and box[3] >= height):
+            continue
+        boxes.append(box)
+    return sorted(boxes, key=lambda b: b[2] * b[3], reverse=True)
+
+
+def crop_region(img, box):
+    """
+    Crop a (x, y, w, h) box, or the whole frame when box is None.
+
+    Returns:
+        (crop, region) with region as {'x', 'y', 'w', 'h'}
+    """
+    height, width = img.shape[:2]
+    if box is not None:
+        x, y, w, h = box
+        x, y = max(0, x), max(0, y)
+        crop = img[y:y + h, x:x + w]
+        if crop.size:
+            return crop, {'x': x, 'y': y, 'w': crop.shape[1], 'h': crop.shape[0]}
+    return img, {'x': 0, 'y': 0, 'w': width, 'h': height}
+
+
+def detect_face(img, detector_backend='opencv'):
+    """
+    Detect the largest face in a BGR image.
+
+    Returns:
+        (crop, region) in image coordinates. Without a detection the whole
+        frame is returned, the same as DeepFace does with enforce_detection=False.
+    """
+    boxes = detect_faces(img, detector_backend)
+    return crop_region(img, boxes[0] if boxes else None)
+
+
+def _build_emotion_model():
+    # Imported here so EMOTION_ENGINE=onnx|torch never loads DeepFace or TensorFlow
+    from deepface import DeepFace
+
+    try:
+        model = DeepFace.build_model(task='facial_attribute', model_name='Emotion')
+    except TypeError:
+        # DeepFace < 0.0.90 has no task argument
+        model = DeepFace.build_model('Emotion')
+    # Newer DeepFace wraps the Keras model in a client object
+    return getattr(model, 'model', model)
+
+
+class DeepFaceEmotionEngine:
+    """DeepFace's Emotion CNN driven directly so several face crops share one forward pass"""
+
+    name = 'deepface'
+    input_size = 48
+    labels = EMOTION_LABELS
+
+    def __init__(self):
+        self.model = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self.model is None:
+            with self._lock:
+                if self.model is None:
+                    self.model = _build_emotion_model()
+        return self.model
+
+    def preprocess(self, faces):
+        """Stack BGR (or grayscale) crops into a (N, 48, 48, 1) float batch in [0, 1]."""
+        size = self.input_size
+        batch = np.empty((len(faces), size, size, 1), dtype=np.float32)
+        for i, face in enumerate(faces):
+            gray = face if face.ndim == 2 else cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+            batch[i, :, :, 0] = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA)
+        batch *= 1.0 / 255.0
+        return batch
+
+    def predict_batch(self, faces):
+        """
+        Classify a list of face crops in one forward pass.
+
+        Returns:
+            list of {emotion: percentage} dicts, the same shape as the
+            'emotion' field of DeepFace.analyze
+        """
+        if not faces:
+            return []
+        model = self.load()
+        probs = np.asarray(model(self.preprocess(faces), training=False), dtype=np.float64)
+        probs = 100.0 * probs / np.maximum(probs.sum(axis=1, keepdims=True), 1e-12)
+        return [dict(zip(self.labels, row.tolist())) for row in probs]
+
+
+def create_engine(name=None):
+    """
+    Build the emotion engine selected by `name` or the EMOTION_ENGINE env var.
+
+    Engines:
+        deepface  DeepFace's Emotion CNN (default)
+        onnx      exported EmotionResNet34 on ONNX Runtime (ONNX_MODEL_PATH,
+                  ORT_INTRA_OP_THREADS, ORT_INTER_OP_THREADS, ORT_GRAPH_OPTIMIZATION)
+        torch     trained EmotionResNet34 on PyTorch (CUSTOM_MODEL_PATH: .pth checkpoint
+                  or INT8 TorchScript .pt from quantize_model.py)
+    """
+    name = (name or os.environ.get('EMOTION_ENGINE', 'deepface')).lower()
+    if name == 'deepface':
+        return DeepFaceEmotionEngine()
+    if name == 'onnx':
+        from onnx_engine import OnnxEmotionEngine
+        intra = os.environ.get('ORT_INTRA_OP_THREADS')
+        return OnnxEmotionEngine(
+            os.environ.get('ONNX_MODEL_PATH', DEFAULT_ONNX_MODEL_PATH),
+            intra_op_threads=int(intra) if intra else None,
+            inter_op_threads=int(os.environ.get('ORT_INTER_OP_THREADS', 1)),
+            graph_optimization=os.environ.get('ORT_GRAPH_OPTIMIZATION', 'all')
+        )
+    if name == 'torch':
+        from inference_custom_model import TorchEmotionEngine
+        return TorchEmotionEngine(os.environ.get('CUSTOM_MODEL_PATH', DEFAULT_TORCH_MODEL_PATH))
+    raise ValueError(f"Unknown EMOTION_ENGINE '{name}' (expected deepface, onnx or torch)")
@@ -4,7 +4,6 @@
 import torch
 import torch.onnx
 import onnx
-import tensorflow as tf
 from train_emotion_model import EmotionResNet34, CONFIG
 from emotion_mapping import EMOTION_CLASSES
 import os
@@ -0,0 +1,85 @@
+# face_detection.py
+# Haar face detection on a fixed-size grayscale thumbnail with a coarse pyramid, boxes mapped back to full resolution
+
+import threading
+import cv2
+
+HAAR_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+# The frontal-face cascade was trained on 24x24 windows; nothing smaller can be found
+HAAR_WINDOW = 24
+
+
+class ThumbnailFaceDetector:
+    """
+    Runs the cascade on a grayscale thumbnail whose longest side is
+    `thumb_size`, instead of on the full (upscaled, contrast-enhanced) frame.
+
+    Shrinking the image first cuts every pyramid level by the same factor,
+    and a coarser `scale_factor` cuts the number of levels: 1.05 scans about
+    twice as many as 1.1. Boxes come back in the input image's coordinates,
+    so callers crop from the full-resolution frame as before. The defaults
+    are the best recall/latency point of bench_face_detection.py;
+    equalizeHist lowered recall there and is off by default.
+
+    Args:
+        thumb_size: longest side of the detection thumbnail in pixels; smaller
+            images are scaled up to it, and it grows when min_size would
+            otherwise fall below the cascade's 24 px window
+        scale_factor, min_neighbors: detectMultiScale pyramid step and
+            grouping threshold
+        min_size: smallest face to report, in input-image pixels
+        equalize: equalizeHist the thumbnail before detection
+    """
+
+    def __init__(self, thumb_size=400, scale_factor=1.1, min_neighbors=3, min_size=50, equalize=False):
+        self.thumb_size = int(thumb_size)
+        self.scale_factor = float(scale_factor)
+        self.min_neighbors = int(min_neighbors)
+        self.min_size = int(min_size)
+        self.equalize = bool(equalize)
+        # CascadeClassifier is not safe to share between threads
+        self._local = threading.local()
+
+    def _cascade(self):
+        cascade = getattr(self._local, 'cascade', None)
+        if cascade is None:
+            cascade = self._local.cascade = cv2.CascadeClassifier(HAAR_CASCADE_PATH)
+        return cascade
+
+    def thumbnail(self, img, min_size=None):
+        """(grayscale thumbnail, scale from input to thumbnail)"""
+        height, width = img.shape[:2]
+        scale = max(self.thumb_size / max(height, width), HAAR_WINDOW / (min_size or self.min_size))
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+        # Resize before the colour conversion so it only touches thumbnail pixels
+        small = cv2.resize(img, size, interpolation=interpolation) if scale != 1.0 else img
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        if self.equalize:
+            gray = cv2.equalizeHist(gray)
+        return gray, scale
+
+    def detect(self, img, min_size=None):
+        """
+        Face boxes (x, y, w, h) in `img` coordinates, largest first.
+        """
+        min_size = min_size or self.min_size
+        gray, scale = self.thumbnail(img, min_size)
+        smallest = max(HAAR_WINDOW, round(min_size * scale))
+        if smallest > min(gray.shape[:2]):
+            return []
+        faces = self._cascade().detectMultiScale(
+            gray,
+            scaleFactor=self.scale_factor,
+            minNeighbors=self.min_neighbors,
+            minSize=(smallest, smallest)
+        )
+        height, width = img.shape[:2]
+        boxes = []
+        for (x, y, w, h) in faces:
+            x0, y0 = int(x / scale), int(y / scale)
+            x1, y1 = min(width, int(round((x + w) / scale))), min(height, int(round((y + h) / scale)))
+            boxes.append((x0, y0, x1 - x0, y1 - y0))
+        return sorted(boxes, key=lambda b: b[2] * b[3], reverse=True)
+
+    __call__ = detect
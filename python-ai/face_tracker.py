@@ -0,0 +1,98 @@
+# face_tracker.py
+# Per-student face tracking: search around the last known face before scanning the whole frame
+
+import threading
+from collections import OrderedDict
+
+
+class FaceTracker:
+    """
+    Remembers the last face box per student and runs the detector only on an
+    expanded region around it.
+
+    A full-frame scan is done when a student has no track, when the region
+    search misses, and every `refresh_every` frames so a second person or a
+    large move is not missed for long.
+
+    Args:
+        expand: margin added on every side of the last box, as a fraction of
+            its width/height
+        refresh_every: force a full-frame scan after this many tracked frames
+        max_tracks: number of students remembered (least recently seen evicted)
+    """
+
+    def __init__(self, expand=0.5, refresh_every=10, max_tracks=10000):
+        self.expand = float(expand)
+        self.refresh_every = max(1, int(refresh_every))
+        self.max_tracks = max(1, int(max_tracks))
+        self._tracks = OrderedDict()  # key -> [box, frames since last full scan]
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.full_scans = 0
+
+    def _search_region(self, box, shape):
+        x, y, w, h = box
+        height, width = shape[:2]
+        mx, my = int(w * self.expand), int(h * self.expand)
+        x0, y0 = max(0, x - mx), max(0, y - my)
+        x1, y1 = min(width, x + w + mx), min(height, y + h + my)
+        return x0, y0, x1, y1
+
+    def _remember(self, key, box, since_full):
+        with self._lock:
+            self._tracks[key] = [tuple(int(v) for v in box), since_full]
+            self._tracks.move_to_end(key)
+            while len(self._tracks) > self.max_tracks:
+                self._tracks.popitem(last=False)
+
+    def forget(self, key):
+        with self._lock:
+            self._tracks.pop(key, None)
+
+    def last_box(self, key):
+        track = self._tracks.get(key)
+        return track[0] if track else None
+
+    def detect(self, key, img, detect_fn):
+        """
+        Find faces for `key` in `img`.
+
+        Args:
+            detect_fn: callable(img) -> list of (x, y, w, h) boxes, largest first
+
+        Returns:
+            list of (x, y, w, h) boxes in full-image coordinates, largest first
+        """
+        track = self._tracks.get(key)
+        if track is not None and track[1] < self.refresh_every:
+            x0, y0, x1, y1 = self._search_region(track[0], img.shape)
+            if x1 > x0 and y1 > y0:
+                faces = detect_fn(img[y0:y1, x0:x1])
+                if len(faces):
+                    faces = [(int(x) + x0, int(y) + y0, int(w), int(h)) for (x, y, w, h) in faces]
+                    self.hits += 1
+                    self._remember(key, faces[0], track[1] + 1)
+                    return faces
+            self.misses += 1
+
+        self.full_scans += 1
+        faces = [tuple(int(v) for v in f) for f in detect_fn(img)]
+        if faces:
+            self._remember(key, faces[0], 0)
+        else:
+            self.forget(key)
+        return faces
+
+    def stats(self):
+        tracked = self.hits + self.misses
+        return {
+            'tracks': len(self._tracks),
+            'hits': self.hits,
+            'misses': self.misses,
+            'full_scans': self.full_scans,
+            'hit_rate': round(self.hits / tracked, 3) if tracked else 0.0,
+            'expand': self.expand,
+            'refresh_every': self.refresh_every,
+        }
@@ -0,0 +1,117 @@
+# frame_cache.py
+# Perceptual-hash frame dedup: reuse a student's last result while their frames stay the same
+
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import cv2
+
+
+def dhash(img, hash_size=8):
+    """
+    Difference hash of a BGR or grayscale image as a 64-bit int.
+
+    A bilinear pass to an 8x larger thumbnail touches only a few pixels per
+    output cell; INTER_AREA then averages it down, so the cost stays in the
+    tens of microseconds regardless of input resolution.
+    """
+    thumb = cv2.resize(img, ((hash_size + 1) * 8, hash_size * 8), interpolation=cv2.INTER_LINEAR)
+    small = cv2.resize(thumb, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def _region(img, box):
+    if box is None:
+        return img
+    x, y, w, h = box
+    crop = img[max(0, y):y + h, max(0, x):x + w]
+    return crop if crop.size else img
+
+
+class FrameCache:
+    """
+    Last analysed frame hash and result per student.
+
+    The hash is taken over the face box the result came from (or the whole
+    frame when there was none), and a new frame is hashed over that same box,
+    so background changes and detector jitter do not break the match.
+
+    A lookup hits when the new frame is within `max_distance` bits of the
+    stored hash and the stored result is younger than `ttl_s`. Memory is
+    bounded by `max_entries`; the least recently used student is evicted.
+    """
+
+    def __init__(self, max_entries=10000, ttl_s=5.0, max_distance=4):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_s = float(ttl_s)
+        self.max_distance = int(max_distance)
+        self._entries = OrderedDict()  # key -> (hash, box, result, stored_at)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def lookup(self, key, img):
+        """Return (result, age_s) when `img` is a near-duplicate of the student's last frame, else None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        stored_hash, box, result, stored_at = entry
+        age = now - stored_at
+        if age > self.ttl_s:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            self.expired += 1
+            self.misses += 1
+            return None
+        if hamming(stored_hash, dhash(_region(img, box))) > self.max_distance:
+            self.misses += 1
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        self.hits += 1
+        return result, age
+
+    def store(self, key, img, result, box=None):
+        """Remember `result` for `img`; `box` is the (x, y, w, h) face region to hash, if any."""
+        box = tuple(int(v) for v in box) if box is not None else None
+        entry = (dhash(_region(img, box)), box, result, time.time())
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def forget(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_s': self.ttl_s,
+            'max_distance': self.max_distance,
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+        }
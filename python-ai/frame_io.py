@@ -0,0 +1,99 @@
+# frame_io.py
+# Request parsing for /analyze: JSON + base64 data URLs, multipart uploads or raw image bodies
+
+import base64
+import time
+import numpy as np
+import cv2
+from metrics import stage
+
+# Header fallbacks for metadata when the body is a raw image
+METADATA_HEADERS = {
+    'studentId': 'X-Student-Id',
+    'name': 'X-Student-Name',
+    'classId': 'X-Class-Id',
+}
+
+BINARY_CONTENT_TYPES = ('image/', 'application/octet-stream')
+
+
+def b64_to_bytes(b64):
+    """Strip an optional data-URL prefix and base64-decode."""
+    t0 = time.perf_counter()
+    if ',' in b64:
+        b64 = b64.split(',', 1)[1]
+    data = base64.b64decode(b64)
+    stage('base64_decode').since(t0)
+    return data
+
+
+def imdecode_buffer(buf):
+    """Decode an encoded image straight from a bytes-like buffer (no copy before cv2.imdecode)."""
+    arr = np.frombuffer(buf, dtype=np.uint8)
+    if arr.size == 0:
+        return None
+    t0 = time.perf_counter()
+    img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+    stage('imdecode').since(t0)
+    return img
+
+
+def decode_frame(data):
+    """Decode either a base64 / data-URL string or raw encoded bytes into a BGR image."""
+    if not data:
+        return None
+    try:
+        if isinstance(data, str):
+            return imdecode_buffer(b64_to_bytes(data))
+        return imdecode_buffer(data)
+    except Exception:
+        return None
+
+
+def _upload_buffer(storage):
+    # Small uploads are spooled into a BytesIO; expose its buffer instead of copying it out
+    stream = storage.stream
+    if hasattr(stream, 'getbuffer'):
+        return stream.getbuffer()
+    return storage.read()
+
+
+def is_binary_request(req):
+    mimetype = req.mimetype or ''
+    return mimetype.startswith(BINARY_CONTENT_TYPES)
+
+
+def read_frame_request(req):
+    """
+    Extract metadata and the encoded image from a Flask request.
+
+    Supported bodies:
+        application/json      {"studentId", "name", "classId", "image": <base64 or data URL>}
+        multipart/form-data   form fields for metadata, file field "image"
+        image/* or application/octet-stream
+                              raw encoded frame; metadata from the query string
+                              or X-Student-Id / X-Student-Name / X-Class-Id headers
+
+    Returns:
+        (fields, image) where image is a base64 string (JSON) or a bytes-like
+        buffer (binary paths); pass it to decode_frame().
+    """
+    if req.mimetype == 'multipart/form-data':
+        fields = req.args.to_dict()
+        fields.update(req.form.to_dict())
+        upload = req.files.get('image')
+        return fields, (_upload_buffer(upload) if upload else None)
+
+    if is_binary_request(req):
+        fields = req.args.to_dict()
+        for key, header in METADATA_HEADERS.items():
+            if key not in fields and header in req.headers:
+                fields[key] = req.headers[header]
+        return fields, req.get_data(cache=False)
+
+    t0 = time.perf_counter()
+    payload = req.get_json(force=True) or {}
+    stage('json_parse').since(t0)
+    if not isinstance(payload, dict):
+        return {}, None
+    return payload, payload.get('image')
@@ -0,0 +1,131 @@
+# frame_queue.py
+# Latest-frame-wins ingestion per student: a newer frame replaces one still waiting, stale frames never start
+
+import asyncio
+import time
+from admission import Overloaded
+
+
+class Superseded(Exception):
+    """The frame was replaced by a newer one from the same student before inference started"""
+
+
+class _Pending:
+    __slots__ = ('task', 'superseded')
+
+    def __init__(self):
+        self.task = None
+        self.superseded = False
+
+
+class LatestFrameQueue:
+    """
+    Per-key (studentId) front for an AdmissionQueue.
+
+    Each key has at most one frame being analysed and one waiting. A frame
+    that arrives while an older one from the same key is still waiting
+    replaces it: the older request fails with Superseded straight away and
+    gives up its place in the admission queue. Frames of one key run one at
+    a time, in arrival order, so the smoothing window still sees them in
+    capture order.
+
+    A frame that cannot start within `deadline_ms` of arriving is dropped by
+    the admission queue as 'deadline_expired' (503) rather than analysed late.
+
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, admission, deadline_ms=3000.0):
+        self.admission = admission
+        self.deadline_ms = float(deadline_ms)
+        self._pending = {}  # key -> _Pending that has not started yet
+        self._locks = {}    # key -> asyncio.Lock held until the key's running frame finishes on the executor
+
+        self.submitted = 0
+        self.started = 0
+        self.superseded = 0
+        self.expired = 0
+
+    async def submit(self, key, fn, *args, arrived=None):
+        """
+        Run fn(*args) through the admission queue as `key`'s newest frame.
+
+        `arrived` is the perf_counter() time the frame came in (default now);
+        the deadline counts from it, so time spent reading the body counts too.
+        Raises Superseded, or Overloaded as AdmissionQueue.run does.
+        """
+        arrived = time.perf_counter() if arrived is None else arrived
+        self.submitted += 1
+        previous = self._pending.pop(key, None)
+        if previous is not None:
+            previous.superseded = True
+            previous.task.cancel()
+            self.superseded += 1
+
+        entry = self._pending[key] = _Pending()
+        entry.task = asyncio.ensure_future(self._run(key, entry, fn, args, arrived + self.deadline_ms / 1000.0))
+        try:
+            return await entry.task
+        except asyncio.CancelledError:
+            if entry.superseded:
+                raise Superseded()
+            raise
+        except Overloaded as e:
+            if entry.superseded:
+                # The deadline fired in the same loop iteration as the cancel
+                raise Superseded()
+            if e.reason == 'deadline_expired':
+                self.expired += 1
+            raise
+        finally:
+            if self._pending.get(key) is entry:
+                del self._pending[key]
+            lock = self._locks.get(key)
+            if lock is not None and not lock.locked() and key not in self._pending:
+                del self._locks[key]
+
+    async def _run(self, key, entry, fn, args, deadline):
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        await lock.acquire()
+        submitted = False
+
+        def start():
+            nonlocal submitted
+            self._start(key, entry)
+            submitted = True
+
+        try:
+            # Once the frame is on the executor the lock is released by the
+            # job's completion, not by this coroutine: a client that goes away
+            # mid-inference must not let its next frame run alongside this one
+            return await self.admission.run(fn, *args, deadline=deadline, on_start=start,
+                                            on_finish=lambda: self._release(key, lock))
+        finally:
+            if not submitted:
+                self._release(key, lock)
+
+    def _start(self, key, entry):
+        if entry.superseded:
+            # Replaced while wait_for was handing it the slot: cancellation can lose that race
+            raise asyncio.CancelledError()
+        # Past this point the frame is on the executor and can no longer be replaced
+        if self._pending.get(key) is entry:
+            del self._pending[key]
+        self.started += 1
+
+    def _release(self, key, lock):
+        lock.release()
+        if not lock.locked() and key not in self._pending and self._locks.get(key) is lock:
+            del self._locks[key]
+
+    def stats(self):
+        return {
+            'deadline_ms': self.deadline_ms,
+            'pending': len(self._pending),
+            'submitted': self.submitted,
+            'started': self.started,
+            'superseded': self.superseded,
+            'expired': self.expired,
+        }
@@ -2,96 +2,195 @@
 # Inference using trained custom emotion detection model
 # Can be integrated with api_server_hybrid.py
 
+import threading
+import time
 import torch
 import torch.nn.functional as F
-from torchvision import transforms
 from PIL import Image
 import numpy as np
 import cv2
 from train_emotion_model import EmotionResNet34, CONFIG
 from emotion_mapping import EMOTION_CLASSES, INDEX_TO_EMOTION
+from preprocessing import FacePreprocessor, decode_bgr
 
 class CustomEmotionDetector:
     """Custom emotion detector using trained ResNet-34 model"""
     
     def __init__(self, model_path, device='cpu'):
+        """
+        Args:
+            model_path: training checkpoint (.pth) or INT8 TorchScript (.pt)
+                written by quantize_model.py
+            device: 'cpu' or 'cuda'; quantized models always run on CPU
+        """
         self.device = device
-        self.model = EmotionResNet34(num_classes=7, pretrained=False)
         
-        # Load trained weights
-        checkpoint = torch.load(model_path, map_location=device)
-        self.model.load_state_dict(checkpoint['model_state_dict'])
+        if model_path.endswith('.pt'):
+            # Quantized TorchScript from quantize_model.py (CPU only)
+            extra_files = {'quantized_engine': ''}
+            self.model = torch.jit.load(model_path, map_location='cpu', _extra_files=extra_files)
+            engine = extra_files['quantized_engine']
+            if isinstance(engine, bytes):
+                engine = engine.decode()
+            if engine:
+                torch.backends.quantized.engine = engine
+            self.device = device = 'cpu'
+        else:
+            self.model = EmotionResNet34(num_classes=7, pretrained=False)
+            
+            # Load trained weights
+            checkpoint = torch.load(model_path, map_location=device)
+            self.model.load_state_dict(checkpoint['model_state_dict'])
         self.model.eval()
         self.model = self.model.to(device)
+        self.last_stats = None
         
-        # Image preprocessing
-        self.transform = transforms.Compose([
-            transforms.Resize((CONFIG['image_size'], CONFIG['image_size'])),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], 
-                              std=[0.229, 0.224, 0.225])
-        ])
+        # Image preprocessing (same output as EmotionAugmentation(is_training=False), without PIL)
+        self.preprocessor = FacePreprocessor(CONFIG['image_size'])
         
         print(f"✓ Custom emotion model loaded from {model_path}")
         print(f"  Device: {device}")
         print(f"  Image size: {CONFIG['image_size']}x{CONFIG['image_size']}")
     
+    def load_image(self, img):
+        """
+        Load one input as a uint8 array
+        
+        Args:
+            img: BGR numpy array, encoded image bytes, file path, or PIL Image
+        
+        Returns:
+            (array, bgr) where bgr is False for RGB arrays from PIL
+        """
+        if isinstance(img, np.ndarray):
+            return img, True
+        if isinstance(img, (bytes, bytearray, memoryview)):
+            return decode_bgr(img), True
+        if isinstance(img, str):
+            array = cv2.imread(img, cv2.IMREAD_COLOR)
+            if array is None:
+                raise ValueError(f'Could not read image: {img}')
+            return array, True
+        if isinstance(img, Image.Image):
+            return np.asarray(img.convert('RGB')), False
+        raise TypeError(f'Unsupported image type: {type(img).__name__}')
+    
     def preprocess_image(self, img):
         """
         Preprocess image for inference
         
         Args:
-            img: PIL Image or numpy array
+            img: BGR numpy array, encoded image bytes, or PIL Image
         
         Returns:
             Preprocessed tensor
         """
-        if isinstance(img, np.ndarray):
-            img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        return self.preprocess_batch([img])
+    
+    def preprocess_batch(self, images):
+        """
+        Stack several inputs into one (N, 3, H, W) tensor
+        
+        Args:
+            images: list of BGR arrays, encoded bytes, file paths or PIL Images
+        """
+        loaded = [self.load_image(img) for img in images]
+        if all(bgr for _, bgr in loaded):
+            batch = self.preprocessor([array for array, _ in loaded])
+        else:
+            batch = self.preprocessor([array if bgr else array[:, :, ::-1] for array, bgr in loaded])
+        return torch.from_numpy(batch).to(self.device)
+    
+    def _results(self, probabilities):
+        """Per-image result dicts from a (N, 7) probability tensor"""
+        confidence, predicted = torch.max(probabilities, 1)
+        rows = probabilities.cpu().numpy().tolist()
+        results = []
+        for row, idx, conf in zip(rows, predicted.tolist(), confidence.tolist()):
+            prob_dict = dict(zip(EMOTION_CLASSES, row))
+            results.append({
+                'emotion': INDEX_TO_EMOTION[idx],
+                'confidence': conf,
+                'probabilities': prob_dict,
+                'all_emotions': prob_dict
+            })
+        return results
+    
+    def detect_emotions(self, images, batch_size=32):
+        """
+        Detect emotions in several images with one forward pass per batch
+        
+        Args:
+            images: list of BGR arrays, encoded bytes, file paths or PIL Images
+            batch_size: images per forward pass
         
-        # Convert to RGB if needed
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+        Returns:
+            list of dicts with emotion, confidence, and probabilities, in
+            input order. Timings and images/sec of the call are left in
+            self.last_stats.
+        """
+        batch_size = max(1, int(batch_size))
+        results = []
+        preprocess_ms = inference_ms = 0.0
+        batches = 0
+        start = time.perf_counter()
+        for i in range(0, len(images), batch_size):
+            t0 = time.perf_counter()
+            batch = self.preprocess_batch(images[i:i + batch_size])
+            t1 = time.perf_counter()
+            with torch.inference_mode():
+                probabilities = F.softmax(self.model(batch), dim=1)
+                results.extend(self._results(probabilities))
+            t2 = time.perf_counter()
+            preprocess_ms += (t1 - t0) * 1000.0
+            inference_ms += (t2 - t1) * 1000.0
+            batches += 1
+        total_ms = (time.perf_counter() - start) * 1000.0
         
-        # Apply transforms
-        img_tensor = self.transform(img).unsqueeze(0)
-        return img_tensor.to(self.device)
+        self.last_stats = {
+            'images': len(images),
+            'batches': batches,
+            'batch_size': batch_size,
+            'preprocess_ms': round(preprocess_ms, 2),
+            'inference_ms': round(inference_ms, 2),
+            'total_ms': round(total_ms, 2),
+            'images_per_sec': round(1000.0 * len(images) / total_ms, 1) if total_ms > 0 else 0.0
+        }
+        return results
+    
+    def measure_throughput(self, images, batch_sizes=(1, 4, 8, 16, 32, 64), runs=3):
+        """
+        Images/sec of detect_emotions for each batch size
+        
+        Args:
+            images: sample inputs, reused for every batch size
+            batch_sizes: batch sizes to try
+            runs: timed repetitions per batch size (best is kept)
+        
+        Returns:
+            {batch_size: images_per_sec}
+        """
+        self.detect_emotions(images[:max(batch_sizes)], batch_size=max(batch_sizes))  # warm
+        throughput = {}
+        for batch_size in batch_sizes:
+            best = 0.0
+            for _ in range(runs):
+                self.detect_emotions(images, batch_size=batch_size)
+                best = max(best, self.last_stats['images_per_sec'])
+            throughput[batch_size] = best
+        return throughput
     
     def detect_emotion(self, img):
         """
         Detect emotion in image
         
         Args:
-            img: PIL Image or numpy array
+            img: BGR numpy array, encoded image bytes, or PIL Image
         
         Returns:
             dict with emotion, confidence, and probabilities
         """
-        # Preprocess
-        img_tensor = self.preprocess_image(img)
-        
-        # Inference
-        with torch.no_grad():
-            outputs = self.model(img_tensor)
-            probabilities = F.softmax(outputs, dim=1)
-            confidence, predicted = torch.max(probabilities, 1)
-        
-        # Get emotion
-        emotion_idx = predicted.item()
-        emotion = INDEX_TO_EMOTION[emotion_idx]
-        confidence_score = confidence.item()
-        
-        # Get all probabilities
-        prob_dict = {}
-        for i, prob in enumerate(probabilities[0]):
-            prob_dict[INDEX_TO_EMOTION[i]] = prob.item()
-        
-        return {
-            'emotion': emotion,
-            'confidence': confidence_score,
-            'probabilities': prob_dict,
-            'all_emotions': prob_dict
-        }
+        return self.detect_emotions([img], batch_size=1)[0]
     
     def detect_emotion_from_base64(self, base64_string):
         """
@@ -103,17 +202,7 @@ class CustomEmotionDetector:
         Returns:
             dict with emotion, confidence, and probabilities
         """
-        import base64
-        from io import BytesIO
-        
-        # Decode base64
-        if ',' in base64_string:
-            base64_string = base64_string.split(',', 1)[1]
-        
-        img_bytes = base64.b64decode(base64_string)
-        img = Image.open(BytesIO(img_bytes)).convert('RGB')
-        
-        return self.detect_emotion(img)
+        return self.detect_emotion(decode_bgr(base64_string))
     
     def detect_emotion_from_path(self, image_path):
         """
@@ -125,8 +214,37 @@ class CustomEmotionDetector:
         Returns:
             dict with emotion, confidence, and probabilities
         """
-        img = Image.open(image_path).convert('RGB')
-        return self.detect_emotion(img)
+        return self.detect_emotion(image_path)
+
+class TorchEmotionEngine:
+    """CustomEmotionDetector behind the API servers' emotion engine interface (see emotion_engine.create_engine)"""
+    
+    name = 'torch'
+    labels = EMOTION_CLASSES
+    
+    def __init__(self, model_path, device='cpu'):
+        self.model_path = model_path
+        self.device = device
+        self.detector = None
+        self._lock = threading.Lock()
+    
+    def load(self):
+        if self.detector is None:
+            with self._lock:
+                if self.detector is None:
+                    self.detector = CustomEmotionDetector(self.model_path, device=self.device)
+        return self.detector
+    
+    def predict_batch(self, faces):
+        """
+        Classify BGR face crops
+        
+        Returns:
+            list of {emotion: percentage} dicts
+        """
+        detector = self.load()
+        results = detector.detect_emotions(faces, batch_size=max(1, len(faces)))
+        return [{k: 100.0 * v for k, v in r['probabilities'].items()} for r in results]
 
 # Example usage
 if __name__ == '__main__':
@@ -141,4 +259,11 @@ if __name__ == '__main__':
     # print(f"Emotion: {result['emotion']}")
     # print(f"Confidence: {result['confidence']:.2%}")
     # print(f"Probabilities: {result['probabilities']}")
+    
+    # Batch of images (arrays, encoded bytes or paths)
+    # results = detector.detect_emotions(['a.jpg', 'b.jpg', 'c.jpg'], batch_size=16)
+    # print(detector.last_stats['images_per_sec'], 'images/sec')
+    
+    # Pick a batch size for this CPU
+    # print(detector.measure_throughput(['a.jpg'] * 64))
 
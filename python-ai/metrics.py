@@ -0,0 +1,547 @@
+# metrics.py
+# Prometheus text-format counters, gauges and histograms without a client library, summed across pre-forked workers
+
+import bisect
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import server_timing
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Set (serve_prefork.py does) to keep every process's values in <dir>/<pid>.db
+# so /metrics on any worker reports the sum over all of them
+MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR')
+
+# Seconds. Stages range from ~10 us (base64 of a small frame) to seconds (DeepFace fallbacks)
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _CounterValue:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeValue(_CounterValue):
+    __slots__ = ()
+
+    def dec(self, amount=1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = float(value)
+
+
+class _HistogramValue:
+    __slots__ = ('bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        # bisect_left: a value equal to a bound belongs to that bucket (le = less or equal)
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def since(self, t0):
+        """observe(now - t0) for a time.perf_counter() start"""
+        self.observe(time.perf_counter() - t0)
+
+    def snapshot(self):
+        """(per-bucket counts, sum)"""
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class _FileStore:
+    """
+    One process's metric values in an mmap'd file, <directory>/<pid>.db, so
+    other processes can read and add them up.
+
+    Layout: an 8-byte used-length header, then entries of a 4-byte key
+    length, the UTF-8 key padded to 8 bytes and an 8-byte float value.
+    Entries are only appended and values updated in place, so a reader never
+    needs a lock. A forked child starts a file of its own: the values it
+    inherited stay counted in the parent's file.
+    """
+
+    _HEADER = struct.Struct('<Q')
+    _LENGTH = struct.Struct('<I')
+    _VALUE = struct.Struct('<d')
+    _INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._fd = None
+        self._mmap = None
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # Also runs in a freshly forked child: drop the parent's mapping and a
+        # lock another thread may have held at fork time
+        if self._mmap is not None:
+            self._mmap.close()
+            os.close(self._fd)
+        self._fd = None
+        self._mmap = None
+        self._positions = {}
+        self._used = self._HEADER.size
+        self._lock = threading.Lock()
+
+    def _position(self, key):
+        """Offset of key's value, appending the entry if new (caller holds the lock)"""
+        position = self._positions.get(key)
+        if position is not None:
+            return position
+        if self._mmap is None:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{os.getpid()}.db')
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+            os.ftruncate(self._fd, self._INITIAL_SIZE)
+            self._mmap = mmap.mmap(self._fd, self._INITIAL_SIZE)
+        encoded = key.encode()
+        position = self._used + (self._LENGTH.size + len(encoded) + 7) // 8 * 8
+        end = position + self._VALUE.size
+        if end > len(self._mmap):
+            size = max(end, 2 * len(self._mmap))
+            os.ftruncate(self._fd, size)
+            self._mmap.close()
+            self._mmap = mmap.mmap(self._fd, size)
+        self._LENGTH.pack_into(self._mmap, self._used, len(encoded))
+        self._mmap[self._used + self._LENGTH.size:self._used + self._LENGTH.size + len(encoded)] = encoded
+        self._VALUE.pack_into(self._mmap, position, 0.0)
+        # Publish the entry only once it is complete
+        self._used = end
+        self._HEADER.pack_into(self._mmap, 0, self._used)
+        self._positions[key] = position
+        return position
+
+    def add(self, *updates):
+        """add((key, amount), ...) as one update"""
+        with self._lock:
+            for key, amount in updates:
+                position = self._position(key)
+                self._VALUE.pack_into(self._mmap, position, self._VALUE.unpack_from(self._mmap, position)[0] + amount)
+
+    def set(self, key, value):
+        with self._lock:
+            self._VALUE.pack_into(self._mmap, self._position(key), float(value))
+
+    def get(self, key):
+        with self._lock:
+            return self._VALUE.unpack_from(self._mmap, self._position(key))[0]
+
+    @classmethod
+    def read(cls, path):
+        """(key, value) pairs of one process's file"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < cls._HEADER.size:
+            return
+        used = min(cls._HEADER.unpack_from(data, 0)[0], len(data))
+        offset = cls._HEADER.size
+        while offset + cls._LENGTH.size <= used:
+            length = cls._LENGTH.unpack_from(data, offset)[0]
+            position = offset + (cls._LENGTH.size + length + 7) // 8 * 8
+            if position + cls._VALUE.size > used:
+                break
+            key = data[offset + cls._LENGTH.size:offset + cls._LENGTH.size + length].decode()
+            yield key, cls._VALUE.unpack_from(data, position)[0]
+            offset = position + cls._VALUE.size
+
+    def collect(self):
+        """(pid, key, value) for every process that has written to the directory"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith('.db'):
+                continue
+            try:
+                pid = int(name[:-3])
+                for key, value in self.read(os.path.join(self.directory, name)):
+                    yield pid, key, value
+            except (ValueError, OSError):
+                continue
+
+
+def _key(name, values, sample=''):
+    return json.dumps([name, list(values), sample])
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _FileCounterValue:
+    __slots__ = ('_store', '_key')
+
+    def __init__(self, store, key):
+        self._store = store
+        self._key = key
+        # Listed (at 0) from creation on, like a local series
+        store.add((key, 0.0))
+
+    @property
+    def value(self):
+        return self._store.get(self._key)
+
+    def inc(self, amount=1.0):
+        self._store.add((self._key, amount))
+
+
+class _FileGaugeValue(_FileCounterValue):
+    __slots__ = ()
+
+    def dec(self, amount=1.0):
+        self._store.add((self._key, -amount))
+
+    def set(self, value):
+        self._store.set(self._key, value)
+
+
+class _FileHistogramValue:
+    __slots__ = ('bounds', '_store', '_buckets', '_sum')
+
+    def __init__(self, bounds, store, name, values):
+        self.bounds = bounds
+        self._store = store
+        self._buckets = [_key(name, values, str(i)) for i in range(len(bounds) + 1)]
+        self._sum = _key(name, values, 'sum')
+        store.add(*((key, 0.0) for key in self._buckets + [self._sum]))
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        self._store.add((self._buckets[index], 1.0), (self._sum, value))
+
+    def since(self, t0):
+        """observe(now - t0) for a time.perf_counter() start"""
+        self.observe(time.perf_counter() - t0)
+
+    def snapshot(self):
+        return [int(self._store.get(key)) for key in self._buckets], self._store.get(self._sum)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), store=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._store = store
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _new(self, values):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """The series for these label values (positional, in labelnames order)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects labels {self.labelnames}, got {values}')
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new(values)
+        return child
+
+    def series(self):
+        with self._lock:
+            return list(self._children.items())
+
+    def collect(self):
+        """[(label values, sample)] of this process"""
+        return [(values, child.value) for values, child in self.series()]
+
+    def merge(self, samples, values, sample, value):
+        """Add one file entry into samples, the summed collect() of all processes"""
+        samples[values] = samples.get(values, 0.0) + value
+
+    def render(self, samples=None):
+        samples = self.collect() if samples is None else samples
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for values, value in sorted(samples, key=lambda sample: sample[0]):
+            lines.append(f'{self.name}{_labels(self.labelnames, values)} {_format(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new(self, values):
+        if self._store is not None:
+            return _FileCounterValue(self._store, _key(self.name, values))
+        return _CounterValue()
+
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new(self, values):
+        if self._store is not None:
+            return _FileGaugeValue(self._store, _key(self.name, values))
+        return _GaugeValue()
+
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1.0):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, store=None):
+        super().__init__(name, help, labelnames, store)
+        self.bounds = tuple(sorted(float(b) for b in buckets))
+
+    def _new(self, values):
+        if self._store is not None:
+            return _FileHistogramValue(self.bounds, self._store, self.name, values)
+        return _HistogramValue(self.bounds)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def collect(self):
+        return [(values, child.snapshot()) for values, child in self.series()]
+
+    def merge(self, samples, values, sample, value):
+        counts, total = samples.get(values) or ([0] * (len(self.bounds) + 1), 0.0)
+        if sample == 'sum':
+            total += value
+        else:
+            counts[int(sample)] += int(value)
+        samples[values] = (counts, total)
+
+    def render(self, samples=None):
+        samples = self.collect() if samples is None else samples
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for values, (counts, total) in sorted(samples, key=lambda sample: sample[0]):
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float('inf'),), counts):
+                cumulative += count
+                le = (('le', _format(bound)),)
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, values)} {_format(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, values)} {cumulative}')
+        return lines
+
+
+class Registry:
+    """
+    Metrics rendered in the Prometheus text format.
+
+    With `multiprocess_dir`, every process (the serve_prefork.py master and
+    each worker) writes its values to its own file there and render() adds
+    up all the files, so a scrape of the shared port reports the whole
+    server whichever worker answers it. Counters and histograms of workers
+    that have exited stay in the sum; their gauges are dropped.
+    """
+
+    def __init__(self, multiprocess_dir=None):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._store = _FileStore(multiprocess_dir) if multiprocess_dir else None
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f'metric {metric.name} already registered differently')
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames, store=self._store))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge(name, help, labelnames, store=self._store))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets, store=self._store))
+
+    def render(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+        if self._store is None:
+            samples = {name: None for name in metrics}
+        else:
+            samples = self._collect_files(metrics)
+        lines = []
+        for name, metric in metrics.items():
+            lines.extend(metric.render(samples[name]))
+        return '\n'.join(lines) + '\n'
+
+    def _collect_files(self, metrics):
+        merged = {name: {} for name in metrics}
+        alive = {}
+        for pid, key, value in self._store.collect():
+            name, values, sample = json.loads(key)
+            metric = metrics.get(name)
+            if metric is None:
+                continue
+            if metric.kind == 'gauge':
+                if pid not in alive:
+                    alive[pid] = _pid_alive(pid)
+                if not alive[pid]:
+                    continue
+            metric.merge(merged[name], tuple(values), sample, value)
+        return {name: list(series.items()) for name, series in merged.items()}
+
+
+REGISTRY = Registry(MULTIPROC_DIR)
+
+# Shared by frame_io, cascade and the servers
+STAGE_SECONDS = REGISTRY.histogram(
+    'emotion_stage_seconds',
+    'Time spent in each request stage (json_parse, base64_decode, imdecode, resize, clahe, '
+    'face_detection, deepface, emotion_batch, serialize)',
+    ('stage',))
+CASCADE_STAGE_SECONDS = REGISTRY.histogram(
+    'emotion_cascade_stage_seconds', 'Time spent in each cascade model', ('stage',))
+CASCADE_STAGE_RESULTS = REGISTRY.counter(
+    'emotion_cascade_stage_results_total',
+    'Cascade stage outcomes: accepted, rejected (below its confidence), error, skipped (budget)',
+    ('stage', 'outcome'))
+NO_FACE = REGISTRY.counter(
+    'emotion_no_face_total', 'Results without a usable face, by reason', ('reason',))
+ERRORS = REGISTRY.counter(
+    'emotion_errors_total', 'Requests answered with a 5xx error', ('endpoint',))
+REQUESTS = REGISTRY.counter(
+    'emotion_requests_total', 'Requests answered, by endpoint and HTTP status', ('endpoint', 'status'))
+REQUEST_SECONDS = REGISTRY.histogram(
+    'emotion_request_seconds', 'Request latency as seen by the server', ('endpoint',))
+IN_FLIGHT = REGISTRY.gauge(
+    'emotion_requests_in_flight', 'Requests currently being handled', ('endpoint',))
+
+
+class StageTimer:
+    """
+    One stage's histogram series that also adds each duration to the
+    current request's Server-Timing breakdown (server_timing.py), if any.
+    """
+
+    __slots__ = ('name', 'series')
+
+    def __init__(self, name, series):
+        self.name = name
+        self.series = series
+
+    def observe(self, seconds):
+        self.series.observe(seconds)
+        timing = server_timing.current()
+        if timing is not None:
+            timing.add(self.name, seconds)
+
+    def since(self, t0):
+        """observe(now - t0) for a time.perf_counter() start"""
+        self.observe(time.perf_counter() - t0)
+
+
+_stage_timers = {}
+
+
+def _timer(histogram, name, timing_name):
+    timer = _stage_timers.get((histogram.name, name))
+    if timer is None:
+        timer = _stage_timers.setdefault((histogram.name, name), StageTimer(timing_name, histogram.labels(name)))
+    return timer
+
+
+def stage(name):
+    """Timer for one emotion_stage_seconds stage: metrics.stage('resize').since(t0)"""
+    return _timer(STAGE_SECONDS, name, name)
+
+
+def cascade_stage(name):
+    """Timer for one cascade model; shows up in Server-Timing as cascade_<name>"""
+    return _timer(CASCADE_STAGE_SECONDS, name, f'cascade_{name}')
+
+
+def instrument_flask(app, skip=('metrics', 'ready', 'health', 'static', 'admin_profile')):
+    """Request counts, latency and in-flight gauges for a Flask app's endpoints, plus GET /metrics."""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _metrics_start():
+        if request.endpoint and request.endpoint not in skip:
+            g.metrics_endpoint = request.endpoint
+            g.metrics_started = time.perf_counter()
+            IN_FLIGHT.labels(request.endpoint).inc()
+
+    @app.after_request
+    def _metrics_done(response):
+        endpoint = g.pop('metrics_endpoint', None)
+        if endpoint is not None:
+            REQUEST_SECONDS.labels(endpoint).since(g.pop('metrics_started'))
+            REQUESTS.labels(endpoint, str(response.status_code)).inc()
+            if response.status_code >= 500:
+                ERRORS.labels(endpoint).inc()
+            IN_FLIGHT.labels(endpoint).dec()
+        return response
+
+    @app.teardown_request
+    def _metrics_teardown(exc):
+        # after_request is skipped when a view raises
+        endpoint = g.pop('metrics_endpoint', None)
+        if endpoint is not None:
+            REQUESTS.labels(endpoint, '500').inc()
+            ERRORS.labels(endpoint).inc()
+            IN_FLIGHT.labels(endpoint).dec()
+
+    app.add_url_rule('/metrics', 'metrics', lambda: Response(REGISTRY.render(), content_type=CONTENT_TYPE))
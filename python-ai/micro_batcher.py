@@ -0,0 +1,173 @@
+# micro_batcher.py
+# Dynamic micro-batching: coalesce concurrent single-item requests into one batched call
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+
+class _Pending:
+    __slots__ = ('item', 'future', 'enqueued')
+
+    def __init__(self, item):
+        self.item = item
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from many request threads and runs them through
+    `batch_fn` together.
+
+    A batch is closed when it holds `max_batch_size` items or when the oldest
+    item has waited `max_wait_ms`, whichever comes first. Items that queued up
+    while the previous batch was running are picked up immediately.
+
+    The wait only happens while more items are known to be on their way:
+    callers announce themselves with `expect()` before the work that leads up
+    to `submit()` (decode, face detection). When every expected caller has
+    submitted, or nobody is expected, the batch is dispatched at once, so a
+    lone request never sits out `max_wait_ms`.
+
+    Args:
+        batch_fn: callable taking a list of items and returning a list of
+            results in the same order
+        max_batch_size: upper bound on items per batch
+        max_wait_ms: how long the first item of a batch may wait for company
+    """
+
+    def __init__(self, batch_fn, max_batch_size=8, max_wait_ms=5.0, name='micro-batcher'):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self.name = name
+
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._expected = 0  # callers inside expect() that have not submitted yet
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+
+        # Counters (only mutated by the worker thread)
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+        self.largest_batch = 0
+
+    def _ensure_worker(self):
+        # The worker is started lazily, and restarted in forked children where
+        # the parent's thread no longer exists.
+        pid = os.getpid()
+        if self._worker is not None and self._worker_pid == pid:
+            return
+        with self._lock:
+            if self._worker is None or self._worker_pid != pid:
+                if self._worker_pid != pid:
+                    self._items = deque()
+                    self._cond = threading.Condition()
+                    self._expected = 0
+                self._worker_pid = pid
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+
+    @contextmanager
+    def expect(self):
+        """
+        Mark the calling thread as about to submit (at most one item).
+
+        Open batches wait for it, up to `max_wait_ms`, until it submits or
+        leaves the block without submitting (e.g. a cache hit).
+        """
+        self._ensure_worker()
+        with self._cond:
+            self._expected += 1
+        self._local.expected = True
+        try:
+            yield self
+        finally:
+            if getattr(self._local, 'expected', False):
+                self._local.expected = False
+                with self._cond:
+                    self._expected -= 1
+                    self._cond.notify_all()
+
+    def submit(self, item, timeout=None):
+        """
+        Queue one item and block until its batch has been processed.
+
+        Returns:
+            (result, info) where info describes the batch the item ran in
+        """
+        self._ensure_worker()
+        pending = _Pending(item)
+        with self._cond:
+            if getattr(self._local, 'expected', False):
+                self._local.expected = False
+                self._expected -= 1
+            self._items.append(pending)
+            self._cond.notify_all()
+        return pending.future.result(timeout=timeout)
+
+    def _collect(self):
+        with self._cond:
+            while not self._items:
+                self._cond.wait()
+            first = self._items.popleft()
+            batch = [first]
+            deadline = first.enqueued + self.max_wait_ms / 1000.0
+            while len(batch) < self.max_batch_size:
+                if self._items:
+                    batch.append(self._items.popleft())
+                    continue
+                remaining = deadline - time.perf_counter()
+                if self._expected <= 0 or remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            try:
+                results = self.batch_fn([p.item for p in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f'{self.name}: batch_fn returned {len(results)} results for {len(batch)} items')
+            except Exception as e:
+                self.errors += 1
+                for p in batch:
+                    p.future.set_exception(e)
+                continue
+            infer_ms = (time.perf_counter() - started) * 1000.0
+
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            for p, result in zip(batch, results):
+                p.future.set_result((result, {
+                    'size': len(batch),
+                    'max_size': self.max_batch_size,
+                    'max_wait_ms': self.max_wait_ms,
+                    'queue_ms': round((started - p.enqueued) * 1000.0, 2),
+                    'infer_ms': round(infer_ms, 2),
+                }))
+
+    def stats(self):
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_ms,
+            'batches': self.batches,
+            'items': self.items,
+            'errors': self.errors,
+            'largest_batch': self.largest_batch,
+            'avg_batch_size': round(self.items / self.batches, 2) if self.batches else 0.0,
+            'queued': len(self._items),
+            'expected': self._expected,
+        }
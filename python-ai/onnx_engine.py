@@ -0,0 +1,102 @@
+# onnx_engine.py
+# ONNX Runtime CPU serving for the exported EmotionResNet34 (see export_model.py)
+
+import os
+import threading
+import numpy as np
+from emotion_mapping import EMOTION_CLASSES
+from preprocessing import FacePreprocessor
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    'disable': 'ORT_DISABLE_ALL',
+    'basic': 'ORT_ENABLE_BASIC',
+    'extended': 'ORT_ENABLE_EXTENDED',
+    'all': 'ORT_ENABLE_ALL',
+}
+
+
+def create_session_options(intra_op_threads=None, inter_op_threads=1, graph_optimization='all'):
+    """
+    Session options tuned for CPU serving.
+
+    Args:
+        intra_op_threads: threads used inside one operator (conv/gemm);
+            defaults to the number of CPUs available to the process
+        inter_op_threads: threads running independent graph branches; a
+            ResNet is a chain, so 1 avoids oversubscription
+        graph_optimization: 'disable', 'basic', 'extended' or 'all'
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    if intra_op_threads is None:
+        intra_op_threads = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    options.intra_op_num_threads = int(intra_op_threads)
+    options.inter_op_num_threads = int(inter_op_threads)
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = getattr(
+        ort.GraphOptimizationLevel, GRAPH_OPTIMIZATION_LEVELS[graph_optimization])
+    return options
+
+
+class OnnxEmotionEngine:
+    """
+    EmotionResNet34 served by ONNX Runtime on CPU.
+
+    Same interface as emotion_engine.DeepFaceEmotionEngine: predict_batch()
+    takes BGR face crops and returns {emotion: percentage} dicts. Crops go
+    through the same FacePreprocessor as TorchEmotionEngine, so both engines
+    see identical input tensors.
+    """
+
+    name = 'onnx'
+    labels = EMOTION_CLASSES
+
+    def __init__(self, model_path, intra_op_threads=None, inter_op_threads=1, graph_optimization='all'):
+        self.model_path = model_path
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.graph_optimization = graph_optimization
+        self.session = None
+        self.input_name = None
+        self.input_size = None
+        self.preprocessor = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self.session is None:
+            with self._lock:
+                if self.session is None:
+                    import onnxruntime as ort
+
+                    options = create_session_options(
+                        self.intra_op_threads, self.inter_op_threads, self.graph_optimization)
+                    session = ort.InferenceSession(
+                        self.model_path, sess_options=options, providers=['CPUExecutionProvider'])
+                    model_input = session.get_inputs()[0]
+                    self.input_name = model_input.name
+                    # Input is (batch, 3, H, W) with a dynamic batch axis
+                    self.input_size = int(model_input.shape[-1])
+                    self.preprocessor = FacePreprocessor(self.input_size)
+                    self.session = session
+                    print(f"✓ ONNX emotion model loaded from {self.model_path}")
+        return self.session
+
+    def preprocess(self, faces):
+        """Normalised (N, 3, H, W) float32 batch of BGR crops, as EmotionAugmentation(is_training=False) builds it."""
+        self.load()
+        return self.preprocessor(faces)
+
+    def predict_logits(self, batch):
+        session = self.load()
+        return session.run(None, {self.input_name: batch})[0]
+
+    def predict_batch(self, faces):
+        if not faces:
+            return []
+        self.load()
+        logits = self.predict_logits(self.preprocess(faces)).astype(np.float64)
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs = 100.0 * probs / probs.sum(axis=1, keepdims=True)
+        return [dict(zip(self.labels, row.tolist())) for row in probs]
@@ -0,0 +1,119 @@
+# preprocessing.py
+# PIL-free preprocessing: encoded bytes or BGR arrays to the normalised NCHW batch the ResNet expects
+
+import threading
+from functools import lru_cache
+import numpy as np
+import cv2
+from frame_io import decode_frame
+
+try:
+    import torch
+    import torch.nn.functional as F
+except ImportError:
+    # Serving images without PyTorch (EMOTION_ENGINE=onnx) resize with numpy instead
+    torch = None
+
+# ImageNet statistics used by EmotionAugmentation
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+@lru_cache(maxsize=256)
+def _resize_weights(size_in, size_out):
+    """
+    (size_out, size_in) antialiased bilinear weights, as PIL computes them:
+    a triangle filter widened by the downscale factor, clipped at the edges
+    and normalised per output pixel.
+    """
+    scale = size_in / size_out
+    support = max(scale, 1.0)
+    centers = (np.arange(size_out) + 0.5) * scale
+    pixels = np.arange(size_in) + 0.5
+    weights = np.maximum(0.0, 1.0 - np.abs(pixels[None, :] - centers[:, None]) / support)
+    weights /= weights.sum(axis=1, keepdims=True)
+    return weights.astype(np.float32)
+
+
+def decode_bgr(data):
+    """Decode a base64 / data-URL string or raw encoded bytes into a BGR array."""
+    img = decode_frame(data)
+    if img is None:
+        raise ValueError('Could not decode image')
+    return img
+
+
+class FacePreprocessor:
+    """
+    Equivalent of EmotionAugmentation(is_training=False) on uint8 arrays.
+
+    Per image: one antialiased bilinear resize on the uint8 pixels with the
+    triangle filter torchvision Resize gets from PIL (PyTorch's kernel when
+    it is installed, else the same weights applied with numpy). PIL rounds
+    fixed-point weights and rounds to uint8 between its horizontal and
+    vertical passes; neither path copies that exactly, so some pixels come
+    out one grey level off, never more (tests/test_preprocessing.py): up to
+    1 / (255 * 0.224) ~= 0.0175 after Normalize. Matching PIL bit for bit
+    costs more than PIL itself. Then
+    ToTensor + Normalize folded into a single x * scale - offset written
+    straight into a preallocated NCHW float32 buffer. The BGR -> RGB swap
+    happens in that write, so there is no cvtColor, PIL Image or
+    intermediate float copy.
+
+    The returned array is a view of a per-thread buffer and stays valid
+    until the next call on the same thread.
+    """
+
+    def __init__(self, image_size, mean=MEAN, std=STD):
+        self.image_size = int(image_size)
+        mean = np.asarray(mean, dtype=np.float32)
+        std = np.asarray(std, dtype=np.float32)
+        # (x / 255 - mean) / std == x * scale - offset
+        self.scale = (1.0 / (255.0 * std)).astype(np.float32)
+        self.offset = (mean / std).astype(np.float32)
+        self._local = threading.local()
+
+    def _buffer(self, count):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or buffer.shape[0] < count:
+            size = self.image_size
+            buffer = np.empty((count, 3, size, size), dtype=np.float32)
+            self._local.buffer = buffer
+        return buffer[:count]
+
+    def resize(self, img):
+        """Resize an HxWx3 uint8 image; returns a (3, size, size) uint8 view in the input channel order."""
+        size = self.image_size
+        if img.shape[0] == size and img.shape[1] == size:
+            return img.transpose(2, 0, 1)
+        if torch is None:
+            rows = _resize_weights(img.shape[0], size)
+            cols = _resize_weights(img.shape[1], size)
+            # (size, W, C) then (size, C, size): rows first, columns second
+            resized = np.tensordot(np.tensordot(rows, img.astype(np.float32), axes=(1, 0)), cols, axes=(1, 1))
+            return np.clip(np.rint(resized), 0, 255).astype(np.uint8).transpose(1, 0, 2)
+        tensor = torch.from_numpy(np.ascontiguousarray(img)).permute(2, 0, 1).unsqueeze(0)
+        resized = F.interpolate(tensor, size=(size, size), mode='bilinear', antialias=True, align_corners=False)
+        return resized[0].numpy()
+
+    def __call__(self, images, bgr=True):
+        """
+        Args:
+            images: list of HxWx3 uint8 arrays (grayscale HxW is expanded)
+            bgr: channel order of the inputs; False for RGB
+
+        Returns:
+            (N, 3, size, size) float32 array in RGB order
+        """
+        batch = self._buffer(len(images))
+        for i, img in enumerate(images):
+            if img.ndim == 2:
+                img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+            elif img.shape[2] == 4:
+                img = img[:, :, :3]
+            planes = self.resize(img)
+            for c in range(3):
+                src = planes[2 - c] if bgr else planes[c]
+                np.multiply(src, self.scale[c], out=batch[i, c])
+                batch[i, c] -= self.offset[c]
+        return batch
@@ -0,0 +1,192 @@
+# profiler.py
+# On-demand sampling profiler: periodic stack snapshots of worker threads, returned as collapsed stacks
+#
+# The output is one line per distinct stack, root first, with its sample count:
+#   inference-0;api_server_async.py:_analyze;api_server_hybrid.py:analyze_image;... 42
+# which flamegraph.pl, speedscope and inferno read directly.
+#
+# The servers expose it as POST /admin/profile?seconds=N, enabled only when
+# ADMIN_TOKEN is set and authenticated with 'Authorization: Bearer <token>':
+#   curl -X POST -H "Authorization: Bearer $ADMIN_TOKEN" \
+#        'http://localhost:8000/admin/profile?seconds=10' > profile.txt
+#   flamegraph.pl profile.txt > profile.svg
+# Behind serve_prefork.py the profile covers the one worker that answers.
+
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+PROFILE_MAX_S = float(os.environ.get('PROFILE_MAX_S', 60))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 10))
+CONTENT_TYPE = 'text/plain; charset=utf-8'
+
+# Samples whose innermost Python frame is one of these are threads waiting for
+# work, not doing it; they are dropped unless include_idle is set
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('selectors.py', 'select'),
+    ('socket.py', 'accept'),
+    ('socketserver.py', 'serve_forever'),
+    ('thread.py', '_worker'),
+}
+
+# Only one profile runs at a time per process
+_busy = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Another profile is already running in this process"""
+
+
+def _label(code):
+    return f'{os.path.basename(code.co_filename)}:{code.co_name}'
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of other threads every `interval_ms` with
+    sys._current_frames(), for `seconds`.
+
+    Nothing is installed in the profiled threads: the cost is one stack walk
+    per thread per sample, paid by the sampler thread while it holds the GIL,
+    and nothing at all while no profile is running.
+
+    Args:
+        interval_ms: time between samples
+        thread_prefixes: only threads whose name starts with one of these
+            (None: every thread but the sampler)
+        include_idle: keep samples of threads parked in a wait (IDLE_FRAMES)
+    """
+
+    def __init__(self, interval_ms=10.0, thread_prefixes=None, include_idle=False):
+        self.interval_s = max(0.001, float(interval_ms) / 1000.0)
+        self.thread_prefixes = tuple(thread_prefixes) if thread_prefixes else None
+        self.include_idle = bool(include_idle)
+        self.stacks = Counter()
+        self.samples = 0
+        self.ticks = 0
+        self.sample_us = 0.0
+
+    def _wanted(self, thread):
+        if thread is None:
+            return False
+        return self.thread_prefixes is None or thread.name.startswith(self.thread_prefixes)
+
+    def sample(self):
+        t0 = time.perf_counter()
+        me = threading.get_ident()
+        threads = {thread.ident: thread for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            thread = threads.get(ident)
+            if ident == me or not self._wanted(thread):
+                continue
+            leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+            if not self.include_idle and leaf in IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_label(frame.f_code))
+                frame = frame.f_back
+            stack.append(thread.name)
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+        self.ticks += 1
+        self.sample_us += (time.perf_counter() - t0) * 1e6
+
+    def run(self, seconds):
+        """Sample for `seconds` on the calling thread; raises ProfilerBusy if a profile is already running"""
+        if not _busy.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            deadline = time.perf_counter() + float(seconds)
+            next_tick = time.perf_counter()
+            while next_tick < deadline:
+                self.sample()
+                next_tick += self.interval_s
+                delay = next_tick - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        finally:
+            _busy.release()
+        return self
+
+    def collapsed(self):
+        """Collapsed stacks ('frame;frame;frame count' lines), most sampled first"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def summary(self):
+        return {
+            'ticks': self.ticks,
+            'samples': self.samples,
+            'stacks': len(self.stacks),
+            'mean_sample_us': round(self.sample_us / self.ticks, 1) if self.ticks else None,
+        }
+
+
+def authorized(token, expected):
+    """Constant-time token check; always False when no admin token is configured"""
+    return bool(expected) and bool(token) and hmac.compare_digest(token.encode(), expected.encode())
+
+
+def bearer_token(headers):
+    """Token from 'Authorization: Bearer <token>' or X-Admin-Token"""
+    auth = headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        return auth[len('Bearer '):].strip()
+    return headers.get('X-Admin-Token')
+
+
+def profile_options(args, thread_prefixes=None):
+    """
+    (seconds, SamplingProfiler kwargs) from query arguments:
+    seconds (required, up to PROFILE_MAX_S), interval_ms, threads
+    (comma-separated name prefixes) and idle=1. Raises ValueError.
+    """
+    seconds = float(args.get('seconds', 0))
+    if not 0 < seconds <= PROFILE_MAX_S:
+        raise ValueError(f'seconds must be in (0, {PROFILE_MAX_S:g}]')
+    interval_ms = float(args.get('interval_ms', PROFILE_INTERVAL_MS))
+    if interval_ms < 1:
+        raise ValueError('interval_ms must be at least 1')
+    threads = args.get('threads')
+    return seconds, {
+        'interval_ms': interval_ms,
+        'thread_prefixes': [t for t in threads.split(',') if t] if threads else thread_prefixes,
+        'include_idle': args.get('idle') == '1',
+    }
+
+
+def summary_headers(profile):
+    summary = profile.summary()
+    return {
+        'X-Profile-Ticks': str(summary['ticks']),
+        'X-Profile-Samples': str(summary['samples']),
+        'X-Profile-Sample-Us': str(summary['mean_sample_us']),
+    }
+
+
+def register_flask(app, thread_prefixes=None):
+    """POST /admin/profile on a Flask app; blocks the calling request for the profile's duration."""
+    from flask import Response, jsonify, request
+
+    def admin_profile():
+        if not ADMIN_TOKEN:
+            return jsonify({'error': 'profiling disabled (set ADMIN_TOKEN)'}), 404
+        if not authorized(bearer_token(request.headers), ADMIN_TOKEN):
+            return jsonify({'error': 'unauthorized'}), 401
+        try:
+            seconds, options = profile_options(request.args, thread_prefixes)
+            profile = SamplingProfiler(**options).run(seconds)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except ProfilerBusy:
+            return jsonify({'error': 'a profile is already running'}), 409
+        return Response(profile.collapsed(), content_type=CONTENT_TYPE, headers=summary_headers(profile))
+
+    app.add_url_rule('/admin/profile', 'admin_profile', admin_profile, methods=['POST'])
@@ -0,0 +1,260 @@
+# quantize_model.py
+# Post-training static INT8 quantization of the trained EmotionResNet34 for CPU serving
+#
+# Usage:
+#   python quantize_model.py --model models/emotion_resnet34_best.pth
+#   python quantize_model.py --model models/emotion_resnet34_best.pth --calibration-samples 1024 --eval-samples 4096
+#
+# Writes a TorchScript artifact (models/exported/emotion_resnet34_best_int8.pt by
+# default) that CustomEmotionDetector loads like a .pth checkpoint, and a JSON
+# report comparing latency, size and per-class accuracy against FP32.
+
+import argparse
+import io
+import json
+import os
+import random
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import ConcatDataset, DataLoader, Subset
+from torchvision.models.quantization.resnet import QuantizableResNet, QuantizableBasicBlock
+from train_emotion_model import EmotionResNet34, EmotionDataset, EmotionAugmentation, CONFIG
+from emotion_mapping import EMOTION_CLASSES
+
+DATASET_DIRS = {
+    'raf-db': 'data/raf-db',
+    'affectnet': 'data/affectnet',
+    'fer2013': 'data/fer2013',
+    'ck+': 'data/ck+',
+    'archive2': 'data/archive2',
+}
+
+
+def default_quantized_engine():
+    """fbgemm on x86, qnnpack on ARM"""
+    engines = torch.backends.quantized.supported_engines
+    return 'fbgemm' if 'fbgemm' in engines else 'qnnpack'
+
+
+def build_quantizable_model(num_classes=7):
+    """
+    EmotionResNet34 rebuilt from torchvision's quantizable blocks.
+
+    Same layers and parameter names as EmotionResNet34.backbone, plus
+    quant/dequant stubs and functional adds that eager-mode quantization needs.
+    """
+    model = QuantizableResNet(QuantizableBasicBlock, [3, 4, 6, 3])
+    num_features = model.fc.in_features
+    model.fc = nn.Sequential(
+        nn.Dropout(0.5),
+        nn.Linear(num_features, 512),
+        nn.ReLU(),
+        nn.Dropout(0.3),
+        nn.Linear(512, num_classes)
+    )
+    return model
+
+
+def load_fp32_models(model_path):
+    """Load a training checkpoint as (EmotionResNet34, quantizable copy), both in eval mode."""
+    checkpoint = torch.load(model_path, map_location='cpu')
+    state_dict = checkpoint['model_state_dict']
+
+    fp32 = EmotionResNet34(num_classes=CONFIG['num_classes'], pretrained=False)
+    fp32.load_state_dict(state_dict)
+    fp32.eval()
+
+    quantizable = build_quantizable_model(CONFIG['num_classes'])
+    quantizable.load_state_dict({k[len('backbone.'):]: v for k, v in state_dict.items()})
+    quantizable.eval()
+    return fp32, quantizable
+
+
+def quantize(model, calibration_loader, engine):
+    """Fuse conv-bn-relu, calibrate observers on `calibration_loader` and convert to INT8 in place."""
+    torch.backends.quantized.engine = engine
+    model.eval()
+    model.fuse_model()
+    # Linear + ReLU in the classifier head
+    torch.ao.quantization.fuse_modules(model.fc, [['1', '2']], inplace=True)
+    model.qconfig = torch.ao.quantization.get_default_qconfig(engine)
+    torch.ao.quantization.prepare(model, inplace=True)
+
+    with torch.inference_mode():
+        for batch in calibration_loader:
+            model(batch['image'])
+
+    torch.ao.quantization.convert(model, inplace=True)
+    return model
+
+
+def load_slices(calibration_samples, eval_samples, seed=0):
+    """
+    Disjoint calibration and evaluation slices of data/*/train.
+
+    Both use the validation transform, so observers see the same value
+    ranges as serving.
+    """
+    transform = EmotionAugmentation(is_training=False)
+    datasets = []
+    for dataset_name, data_dir in DATASET_DIRS.items():
+        if os.path.exists(data_dir):
+            dataset = EmotionDataset(data_dir, dataset_name, transform, split='train')
+            if len(dataset) > 0:
+                datasets.append(dataset)
+    if not datasets:
+        raise SystemExit("ERROR: No datasets found under data/*/train")
+
+    combined = ConcatDataset(datasets)
+    indices = list(range(len(combined)))
+    random.Random(seed).shuffle(indices)
+    calibration = Subset(combined, indices[:calibration_samples])
+    evaluation = Subset(combined, indices[calibration_samples:calibration_samples + eval_samples])
+    return calibration, evaluation
+
+
+def evaluate(model, loader):
+    """Overall and per-class top-1 accuracy (%)"""
+    correct = np.zeros(CONFIG['num_classes'], dtype=np.int64)
+    total = np.zeros(CONFIG['num_classes'], dtype=np.int64)
+    with torch.inference_mode():
+        for batch in loader:
+            predicted = model(batch['image']).argmax(dim=1).numpy()
+            labels = batch['label'].numpy()
+            np.add.at(total, labels, 1)
+            np.add.at(correct, labels, predicted == labels)
+
+    per_class = {}
+    for i, emotion in enumerate(EMOTION_CLASSES):
+        per_class[emotion] = round(100.0 * correct[i] / total[i], 2) if total[i] else None
+    overall = round(100.0 * correct.sum() / max(1, total.sum()), 2)
+    return overall, per_class, {emotion: int(total[i]) for i, emotion in enumerate(EMOTION_CLASSES)}
+
+
+def measure_latency(model, batch_size, runs):
+    """Median and p95 latency (ms) of one forward pass"""
+    size = CONFIG['image_size']
+    batch = torch.randn(batch_size, 3, size, size)
+    timings = []
+    with torch.inference_mode():
+        model(batch)  # warm
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            model(batch)
+            timings.append((time.perf_counter() - t0) * 1000.0)
+    return {
+        'p50_ms': round(float(np.percentile(timings, 50)), 2),
+        'p95_ms': round(float(np.percentile(timings, 95)), 2),
+    }
+
+
+def serialized_mb(scripted):
+    buffer = io.BytesIO()
+    torch.jit.save(scripted, buffer)
+    return round(buffer.tell() / (1024 * 1024), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Static INT8 quantization of EmotionResNet34')
+    parser.add_argument('--model', type=str, default='models/emotion_resnet34_best.pth', help='Trained FP32 checkpoint')
+    parser.add_argument('--output', type=str, default=None, help='Quantized TorchScript (.pt)')
+    parser.add_argument('--report', type=str, default=None, help='JSON report (default: next to --output)')
+    parser.add_argument('--calibration-samples', type=int, default=512)
+    parser.add_argument('--eval-samples', type=int, default=2048)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--latency-batch-sizes', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--runs', type=int, default=30)
+    parser.add_argument('--threads', type=int, default=None, help='torch threads (default: all CPUs)')
+    parser.add_argument('--engine', type=str, default=default_quantized_engine(), choices=['fbgemm', 'qnnpack', 'x86'])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    base_name = os.path.splitext(os.path.basename(args.model))[0]
+    output_path = args.output or os.path.join('models', 'exported', f'{base_name}_int8.pt')
+    report_path = args.report or os.path.splitext(output_path)[0] + '_report.json'
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+
+    print("="*50)
+    print("INT8 quantization")
+    print("="*50)
+    print(f"Model: {args.model}")
+    print(f"Engine: {args.engine}")
+
+    fp32, quantizable = load_fp32_models(args.model)
+    calibration, evaluation = load_slices(args.calibration_samples, args.eval_samples, args.seed)
+    print(f"Calibration samples: {len(calibration)}, evaluation samples: {len(evaluation)}")
+
+    loader_kwargs = {'batch_size': args.batch_size, 'shuffle': False, 'num_workers': CONFIG['num_workers']}
+    calibration_loader = DataLoader(calibration, **loader_kwargs)
+    eval_loader = DataLoader(evaluation, **loader_kwargs)
+
+    t0 = time.perf_counter()
+    int8 = quantize(quantizable, calibration_loader, args.engine)
+    print(f"✓ Calibrated and converted in {time.perf_counter() - t0:.1f}s")
+
+    example = torch.randn(1, 3, CONFIG['image_size'], CONFIG['image_size'])
+    with torch.inference_mode():
+        int8_scripted = torch.jit.trace(int8, example)
+        fp32_scripted = torch.jit.trace(fp32, example)
+    torch.jit.save(int8_scripted, output_path, _extra_files={'quantized_engine': args.engine})
+    print(f"✓ Quantized model saved to {output_path}")
+
+    print("\nEvaluating FP32...")
+    fp32_acc, fp32_per_class, support = evaluate(fp32_scripted, eval_loader)
+    print("Evaluating INT8...")
+    int8_acc, int8_per_class, _ = evaluate(int8_scripted, eval_loader)
+
+    latency = {}
+    for batch_size in args.latency_batch_sizes:
+        latency[str(batch_size)] = {
+            'fp32': measure_latency(fp32_scripted, batch_size, args.runs),
+            'int8': measure_latency(int8_scripted, batch_size, args.runs),
+        }
+        fp32_ms = latency[str(batch_size)]['fp32']['p50_ms']
+        int8_ms = latency[str(batch_size)]['int8']['p50_ms']
+        latency[str(batch_size)]['speedup'] = round(fp32_ms / int8_ms, 2) if int8_ms else None
+
+    per_class = {}
+    for emotion in EMOTION_CLASSES:
+        before, after = fp32_per_class[emotion], int8_per_class[emotion]
+        per_class[emotion] = {
+            'support': support[emotion],
+            'fp32': before,
+            'int8': after,
+            'delta': round(after - before, 2) if before is not None else None,
+        }
+
+    fp32_mb, int8_mb = serialized_mb(fp32_scripted), serialized_mb(int8_scripted)
+    report = {
+        'model': args.model,
+        'quantized_model': output_path,
+        'engine': args.engine,
+        'threads': torch.get_num_threads(),
+        'calibration_samples': len(calibration),
+        'eval_samples': len(evaluation),
+        'size_mb': {'fp32': fp32_mb, 'int8': int8_mb, 'ratio': round(fp32_mb / int8_mb, 2)},
+        'latency': latency,
+        'accuracy': {'fp32': fp32_acc, 'int8': int8_acc, 'delta': round(int8_acc - fp32_acc, 2)},
+        'per_class_accuracy': per_class,
+    }
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\nSize: {fp32_mb} MB -> {int8_mb} MB")
+    for batch_size, row in latency.items():
+        print(f"Latency batch {batch_size}: {row['fp32']['p50_ms']} ms -> {row['int8']['p50_ms']} ms "
+              f"({row['speedup']}x)")
+    print(f"Accuracy: {fp32_acc}% -> {int8_acc}% ({report['accuracy']['delta']:+.2f})")
+    for emotion, row in per_class.items():
+        if row['delta'] is not None:
+            print(f"  {emotion}: {row['fp32']}% -> {row['int8']}% ({row['delta']:+.2f})")
+    print(f"✓ Report saved to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+# serve_prefork.py
+# Production launcher: load the models once in a gunicorn master, then fork workers that share them copy-on-write
+#
+# Usage:
+#   python serve_prefork.py                                   # api_server_hybrid, one worker per CPU
+#   PREFORK_APP=api_server PREFORK_WORKERS=4 python serve_prefork.py
+#
+# Settings (env):
+#   PORT                    listen port (8000)
+#   PREFORK_APP             module exposing `app` and `warmup` (api_server_hybrid)
+#   PREFORK_WORKERS         worker processes (one per available CPU)
+#   PREFORK_WORKER_THREADS  request threads per worker, so the micro-batcher has company (4)
+#   PREFORK_TORCH_THREADS   torch intra-op threads per worker after the fork (1)
+#   PREFORK_PRELOAD         1: load in the master, warm in each worker (default); 0: every worker loads its own copy
+#   PREFORK_TIMEOUT         gunicorn worker timeout in seconds (120)
+#   STUDENT_STATE_BACKEND   smoothing state; defaults to shared (one table for all workers) when preloading
+#   METRICS_MULTIPROC_DIR   where each process keeps its metrics so /metrics sums all workers
+#                           ($TMPDIR/emotion-metrics-$PORT, emptied at start)
+
+import gc
+import glob
+import importlib
+import os
+import sys
+import tempfile
+import time
+
+# A runtime that ran multi-threaded in the master keeps thread-pool state
+# whose threads do not exist in the forked workers, and the first inference
+# there can block forever (observed with torch/OpenMP). The master therefore
+# loads single-threaded and runs no inference at all (see load_app_module);
+# these must be set before the runtimes load.
+SINGLE_THREAD_ENV = {
+    'OMP_NUM_THREADS': '1',
+    'MKL_NUM_THREADS': '1',
+    'TF_NUM_INTRAOP_THREADS': '1',
+    'TF_NUM_INTEROP_THREADS': '1',
+    'ORT_INTRA_OP_THREADS': '1',
+}
+for _key, _value in SINGLE_THREAD_ENV.items():
+    os.environ.setdefault(_key, _value)
+
+from gunicorn.app.base import BaseApplication
+
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+PORT = int(os.environ.get('PORT', 8000))
+APP_MODULE = os.environ.get('PREFORK_APP', 'api_server_hybrid')
+WORKERS = int(os.environ.get('PREFORK_WORKERS', 0)) or available_cpus()
+WORKER_THREADS = int(os.environ.get('PREFORK_WORKER_THREADS', 4))
+TORCH_THREADS = int(os.environ.get('PREFORK_TORCH_THREADS', 1))
+PRELOAD = os.environ.get('PREFORK_PRELOAD', '1') != '0'
+TIMEOUT = int(os.environ.get('PREFORK_TIMEOUT', 120))
+
+# Each worker paces its clients by its own backlog, and a worker runs about one
+# inference at a time (PREFORK_TORCH_THREADS)
+os.environ.setdefault('SNAPSHOT_PARALLELISM', str(TORCH_THREADS))
+
+# A scrape of the shared port reaches one worker; with every process's metrics
+# in this directory, that worker reports the sum over all of them. Must be set
+# before metrics.py is imported.
+METRICS_DIR = os.environ.setdefault(
+    'METRICS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), f'emotion-metrics-{PORT}'))
+
+# Per-student smoothing must not depend on which worker got the frame. The
+# shared table's locks are inherited, so it only works when the master
+# creates it, i.e. with preload.
+if PRELOAD:
+    os.environ.setdefault('STUDENT_STATE_BACKEND', 'shared')
+elif os.environ.get('STUDENT_STATE_BACKEND') == 'shared':
+    print("⚠ STUDENT_STATE_BACKEND=shared needs PREFORK_PRELOAD=1; each worker will get its own table")
+
+
+def load_app_module(module_name, preload):
+    """
+    Import the server module. With preload, build every model but run none of
+    them: the warm-up inferences happen in each worker (post_fork), where the
+    runtimes start their thread pools after the fork. The heap is frozen so
+    the workers' garbage collector never writes to (and so never un-shares)
+    the pages holding the weights.
+    """
+    t0 = time.perf_counter()
+    module = importlib.import_module(module_name)
+    if not preload:
+        # Each worker warms its own copy in the background; /ready says when
+        module.warmup.start()
+        return module
+
+    if not module.warmup.load():
+        print(f"⚠ Loading failed in master: {module.warmup.error}")
+    gc.collect()
+    gc.freeze()
+    print(f"✓ {module_name} loaded in master in {time.perf_counter() - t0:.1f}s "
+          f"({gc.get_freeze_count()} objects frozen)")
+    return module
+
+
+def clear_metrics_dir(directory):
+    """Drop the files of a previous run's processes, whose counters would otherwise be summed in"""
+    for path in glob.glob(os.path.join(directory, '*.db')):
+        os.remove(path)
+
+
+def post_fork(server, worker):
+    torch = sys.modules.get('torch')
+    if torch is not None and TORCH_THREADS > 1:
+        # Safe here: the master never started a torch thread pool
+        torch.set_num_threads(TORCH_THREADS)
+    module = worker.app.module
+    if module is not None:
+        # Preloaded: warm this worker's copy before it accepts a request, so
+        # no request meets a cold model (must finish within PREFORK_TIMEOUT)
+        t0 = time.perf_counter()
+        if not module.warmup.run():
+            server.log.warning(f"Worker {worker.pid} warm-up failed: {module.warmup.error}")
+        server.log.info(f"Worker {worker.pid} forked, warmed in {time.perf_counter() - t0:.1f}s")
+    else:
+        server.log.info(f"Worker {worker.pid} forked")
+
+
+class PreforkApplication(BaseApplication):
+    """gunicorn application that serves one of the Flask modules in this directory"""
+
+    def __init__(self, module_name, options):
+        self.module_name = module_name
+        self.options = options
+        self.module = None
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        # Runs in the master with preload_app, otherwise once per worker
+        if self.module is None:
+            self.module = load_app_module(self.module_name, self.cfg.preload_app)
+        return self.module.app
+
+
+def main():
+    options = {
+        'bind': f'0.0.0.0:{PORT}',
+        'workers': WORKERS,
+        'worker_class': 'gthread',
+        'threads': WORKER_THREADS,
+        'preload_app': PRELOAD,
+        'timeout': TIMEOUT,
+        'post_fork': post_fork,
+    }
+    clear_metrics_dir(METRICS_DIR)
+    print(f"Pre-fork server for {APP_MODULE}: {WORKERS} workers x {WORKER_THREADS} threads "
+          f"on http://0.0.0.0:{PORT} (preload={'on' if PRELOAD else 'off'})")
+    PreforkApplication(APP_MODULE, options).run()
+
+
+if __name__ == '__main__':
+    main()
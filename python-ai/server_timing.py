@@ -0,0 +1,88 @@
+# server_timing.py
+# Per-request stage durations for the Server-Timing response header, and X-Request-ID echo
+
+import contextvars
+import re
+import time
+import uuid
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Echoed back verbatim, so only accept ids that are safe in a header
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._:@/+=-]{1,128}$')
+
+_current = contextvars.ContextVar('request_timing', default=None)
+
+
+def request_id(incoming):
+    """The caller's X-Request-ID when it is usable, else a new one"""
+    if incoming and _REQUEST_ID.match(incoming):
+        return incoming
+    return uuid.uuid4().hex
+
+
+class RequestTiming:
+    """
+    Stage durations of one request, filled in by metrics.stage() while the
+    request's timing is active on the current thread (see activate()).
+
+    A stage that runs more than once (e.g. two resizes) is summed. The
+    header lists stages in the order they first ran, then 'total'.
+    """
+
+    __slots__ = ('request_id', 'started', 'stages')
+
+    def __init__(self, request_id, started=None):
+        self.request_id = request_id
+        self.started = time.perf_counter() if started is None else started
+        self.stages = {}
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def since(self, name, t0):
+        self.add(name, time.perf_counter() - t0)
+
+    def header(self):
+        """Server-Timing value, e.g. 'imdecode;dur=1.92, resize;dur=0.41, total;dur=37.5' (ms)"""
+        parts = [f'{name};dur={seconds * 1000.0:.2f}' for name, seconds in list(self.stages.items())]
+        parts.append(f'total;dur={(time.perf_counter() - self.started) * 1000.0:.2f}')
+        return ', '.join(parts)
+
+
+def current():
+    """The RequestTiming active on this thread/task, or None"""
+    return _current.get()
+
+
+def activate(timing):
+    """Make `timing` current; returns a token for deactivate(). Call on the thread doing the work."""
+    return _current.set(timing)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def instrument_flask(app, endpoints=('analyze',)):
+    """Server-Timing and X-Request-ID on the responses of the given Flask endpoints"""
+    from flask import g, request
+
+    @app.before_request
+    def _timing_start():
+        if request.endpoint in endpoints:
+            g.request_timing = RequestTiming(request_id(request.headers.get(REQUEST_ID_HEADER)))
+            g.request_timing_token = activate(g.request_timing)
+
+    @app.after_request
+    def _timing_headers(response):
+        timing = g.get('request_timing')
+        if timing is not None:
+            response.headers['Server-Timing'] = timing.header()
+            response.headers[REQUEST_ID_HEADER] = timing.request_id
+        return response
+
+    @app.teardown_request
+    def _timing_done(exc):
+        token = g.pop('request_timing_token', None)
+        if token is not None:
+            deactivate(token)
@@ -0,0 +1,78 @@
+# snapshot_pacing.py
+# next_snapshot_ms hints: sample stable students less often, and everyone less often when the server is backed up
+
+import os
+import threading
+import time
+
+
+class SnapshotPacer:
+    """
+    Suggests how long a student's client should wait before its next snapshot.
+
+    Two inputs, and the larger interval wins:
+        stability  how long the student's smoothed emotion has held: min_ms
+                   right after a change, rising linearly to max_ms once it has
+                   been stable for `stable_s` seconds
+        load       the time this process needs to work through its current
+                   backlog (requests in flight x measured pipeline cost /
+                   parallelism), so clients slow down before requests queue
+
+    The result is clamped to [min_ms, max_ms].
+    """
+
+    def __init__(self, min_ms=500, max_ms=5000, stable_s=60.0, parallelism=None, alpha=0.2):
+        self.min_ms = float(min_ms)
+        self.max_ms = max(self.min_ms, float(max_ms))
+        self.stable_s = max(1e-3, float(stable_s))
+        self.parallelism = max(1, int(parallelism or os.cpu_count() or 1))
+        self.alpha = float(alpha)
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.cost_ms = None  # EWMA of observed pipeline time
+        self.hints = 0
+        self.hint_ms_total = 0.0
+
+    def begin(self):
+        """Count a request as in flight; returns its start time for end()."""
+        with self._lock:
+            self.in_flight += 1
+        return time.perf_counter()
+
+    def end(self, started, ran_pipeline=True):
+        """Finish a request from begin(); only requests that ran the models update the cost estimate."""
+        ms = (time.perf_counter() - started) * 1000.0
+        with self._lock:
+            self.in_flight -= 1
+            if ran_pipeline:
+                self.cost_ms = ms if self.cost_ms is None else self.cost_ms + self.alpha * (ms - self.cost_ms)
+
+    def backlog_ms(self, backlog=None, cost_ms=None, parallelism=None):
+        backlog = self.in_flight if backlog is None else backlog
+        cost_ms = self.cost_ms if cost_ms is None else cost_ms
+        return backlog * (cost_ms or 0.0) / (parallelism or self.parallelism)
+
+    def hint(self, stable_for_s, backlog=None, cost_ms=None, parallelism=None):
+        """Milliseconds until the next snapshot, as an int within [min_ms, max_ms]."""
+        stability = min(1.0, max(0.0, stable_for_s) / self.stable_s)
+        interval = self.min_ms + (self.max_ms - self.min_ms) * stability
+        interval = max(interval, self.backlog_ms(backlog, cost_ms, parallelism))
+        interval = int(min(self.max_ms, max(self.min_ms, interval)))
+        with self._lock:
+            self.hints += 1
+            self.hint_ms_total += interval
+        return interval
+
+    def stats(self):
+        return {
+            'min_ms': self.min_ms,
+            'max_ms': self.max_ms,
+            'stable_s': self.stable_s,
+            'parallelism': self.parallelism,
+            'in_flight': self.in_flight,
+            'cost_ms': round(self.cost_ms, 1) if self.cost_ms is not None else None,
+            'backlog_ms': round(self.backlog_ms(), 1),
+            'hints': self.hints,
+            'mean_hint_ms': round(self.hint_ms_total / self.hints, 1) if self.hints else None,
+        }
@@ -0,0 +1,559 @@
+# student_state.py
+# Bounded per-student emotion smoothing: fixed-size label codes and vote counts in NumPy arrays, LRU + TTL eviction
+
+import atexit
+import hashlib
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing import shared_memory
+import numpy as np
+
+
+class StudentStateStore:
+    """
+    Majority vote over each student's last `window` emotions.
+
+    Every student owns one row of preallocated arrays: the window as int8
+    label codes (a ring buffer), one uint8 vote count per label kept up to
+    date incrementally, a last-seen timestamp, and when the smoothed label
+    last changed (stable_for). Rows are recycled:
+    a student unseen for `ttl_s` is expired, and when all `max_students`
+    rows are taken the least recently seen student is evicted. Memory is
+    therefore fixed at construction time.
+
+    Ties go to the label that appears earliest in the window, the same as
+    the dict-of-deques buffer this replaces.
+    """
+
+    def __init__(self, window=3, labels=(), max_students=10000, ttl_s=1800.0, max_labels=16):
+        if window > 255:
+            raise ValueError('window must fit in uint8 counts')
+        self.window = int(window)
+        self.max_students = max(1, int(max_students))
+        self.ttl_s = float(ttl_s)
+        self.max_labels = int(max_labels)
+
+        self.labels = []
+        self._codes = {}
+        for label in labels:
+            self._label_code(label)
+
+        self.history = np.full((self.max_students, self.window), -1, dtype=np.int8)
+        self.votes = np.zeros((self.max_students, self.max_labels), dtype=np.uint8)
+        self.cursor = np.zeros(self.max_students, dtype=np.uint8)  # next ring position
+        self.filled = np.zeros(self.max_students, dtype=np.uint8)
+        self.last_seen = np.zeros(self.max_students, dtype=np.float64)
+        self.last_confidence = np.full(self.max_students, np.nan, dtype=np.float32)
+        self.smoothed = np.full(self.max_students, -1, dtype=np.int8)
+        self.changed_at = np.zeros(self.max_students, dtype=np.float64)
+
+        # Flat memoryviews for scalar access: an order of magnitude cheaper than NumPy indexing
+        self._history = memoryview(self.history.reshape(-1))
+        self._votes = memoryview(self.votes.reshape(-1))
+        self._cursor = memoryview(self.cursor)
+        self._filled = memoryview(self.filled)
+        self._last_seen = memoryview(self.last_seen)
+        self._last_confidence = memoryview(self.last_confidence)
+        self._smoothed = memoryview(self.smoothed)
+        self._changed_at = memoryview(self.changed_at)
+
+        self._slots = OrderedDict()  # studentId -> row, least recently seen first
+        self._free = list(range(self.max_students - 1, -1, -1))
+        self._lock = threading.Lock()
+
+        self.evictions = 0
+        self.expirations = 0
+
+    def _label_code(self, label):
+        code = self._codes.get(label)
+        if code is None:
+            if len(self.labels) >= self.max_labels:
+                raise ValueError(f"more than {self.max_labels} distinct labels")
+            code = len(self.labels)
+            self._codes[label] = code
+            self.labels.append(label)
+        return code
+
+    def _reset(self, row):
+        self.history[row] = -1
+        self.votes[row] = 0
+        self.cursor[row] = 0
+        self.filled[row] = 0
+        self.smoothed[row] = -1
+
+    def _expire(self, now):
+        # _slots is in last-seen order, so expired students sit at the front
+        while self._slots:
+            key, row = next(iter(self._slots.items()))
+            if now - self._last_seen[row] <= self.ttl_s:
+                break
+            del self._slots[key]
+            self._free.append(row)
+            self.expirations += 1
+
+    def _row(self, key, now):
+        row = self._slots.get(key)
+        if row is not None:
+            self._slots.move_to_end(key)
+            if now - self._last_seen[row] > self.ttl_s:
+                # Stale window: start over rather than vote with old frames
+                self._reset(row)
+                self.expirations += 1
+            return row
+        self._expire(now)
+        if self._free:
+            row = self._free.pop()
+        else:
+            _, row = self._slots.popitem(last=False)
+            self.evictions += 1
+        self._reset(row)
+        self._slots[key] = row
+        return row
+
+    def push(self, key, label, confidence=None):
+        """Record `label` (and its confidence, if known) for student `key` and return the smoothed label."""
+        now = time.time()
+        window = self.window
+        with self._lock:
+            code = self._label_code(label)
+            row = self._row(key, now)
+            self._last_seen[row] = now
+            self._last_confidence[row] = float('nan') if confidence is None else confidence
+
+            history, votes = self._history, self._votes
+            base, vbase = row * window, row * self.max_labels
+            position = self._cursor[row]
+            old = history[base + position]
+            if old >= 0:
+                votes[vbase + old] -= 1
+            history[base + position] = code
+            votes[vbase + code] += 1
+            self._cursor[row] = (position + 1) % window
+            filled = min(self._filled[row] + 1, window)
+            self._filled[row] = filled
+
+            # Scan oldest first and keep the first label with the most votes
+            start = (position + 1) % window if filled == window else 0
+            best, best_votes = code, 0
+            for i in range(filled):
+                candidate = history[base + (start + i) % window]
+                count = votes[vbase + candidate]
+                if count > best_votes:
+                    best, best_votes = candidate, count
+            if best != self._smoothed[row]:
+                self._smoothed[row] = best
+                self._changed_at[row] = now
+            return self.labels[best]
+
+    def stable_for(self, key):
+        """Seconds the student's smoothed emotion has been unchanged (0.0 when unknown or expired)."""
+        with self._lock:
+            row = self._slots.get(key)
+            if row is None or self._smoothed[row] < 0:
+                return 0.0
+            now = time.time()
+            if now - self._last_seen[row] > self.ttl_s:
+                return 0.0
+            return now - self._changed_at[row]
+
+    def get(self, key):
+        """The student's current window as labels, oldest first ([] when unknown or expired)."""
+        with self._lock:
+            row = self._slots.get(key)
+            if row is None or time.time() - self.last_seen[row] > self.ttl_s:
+                return []
+            filled = int(self.filled[row])
+            start = int(self.cursor[row]) if filled == self.window else 0
+            return [self.labels[int(self.history[row, (start + i) % self.window])] for i in range(filled)]
+
+    def last_result(self, key):
+        """{'emotion', 'confidence', 'age_s'} of the student's latest raw result, or None."""
+        with self._lock:
+            row = self._slots.get(key)
+            if row is None or not self.filled[row]:
+                return None
+            age = time.time() - self._last_seen[row]
+            if age > self.ttl_s:
+                return None
+            newest = (int(self.cursor[row]) - 1) % self.window
+            confidence = float(self.last_confidence[row])
+            return {
+                'emotion': self.labels[int(self.history[row, newest])],
+                'confidence': None if np.isnan(confidence) else round(confidence, 4),
+                'age_s': round(age, 3),
+            }
+
+    def forget(self, key):
+        with self._lock:
+            row = self._slots.pop(key, None)
+            if row is not None:
+                self._free.append(row)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def memory_bytes(self):
+        """(array bytes, index bytes): the fixed arrays, and the studentId -> row map with its keys."""
+        arrays = (self.history.nbytes + self.votes.nbytes + self.cursor.nbytes
+                  + self.filled.nbytes + self.last_seen.nbytes + self.last_confidence.nbytes
+                  + self.smoothed.nbytes + self.changed_at.nbytes)
+        index = sys.getsizeof(self._slots) + sys.getsizeof(self._free) + 8 * len(self._free)
+        index += sum(sys.getsizeof(k) for k in list(self._slots))
+        return arrays, index
+
+    def stats(self):
+        arrays, index = self.memory_bytes()
+        return {
+            'backend': 'local',
+            'students': len(self._slots),
+            'max_students': self.max_students,
+            'window': self.window,
+            'ttl_s': self.ttl_s,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'array_bytes': arrays,
+            'index_bytes': index,
+            'total_bytes': arrays + index,
+        }
+
+
+def student_fingerprint(key):
+    """Non-zero 64-bit hash of a studentId, identical in every process (unlike hash())."""
+    digest = hashlib.blake2b(str(key).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') | 1
+
+
+class SharedStudentStateStore:
+    """
+    StudentStateStore shared by every worker process on a node, so a
+    student's smoothing no longer depends on which worker got the frame.
+
+    Everything lives in one multiprocessing.shared_memory segment. A
+    studentId hashes to a bucket of `ways` slots; a slot holds the key's
+    64-bit fingerprint, the vote window and counts, and the last raw result
+    (label, confidence, time) and when the smoothed label last changed. Each bucket is guarded by one of `stripes`
+    locks, so workers only wait for each other when their students land on
+    the same stripe. A new student takes an empty or expired slot in its
+    bucket, else evicts the bucket's least recently seen one.
+
+    The locks are inherited, not attached by name: create the store in the
+    parent before forking (serve_prefork.py imports the app in the master).
+    The creating process unlinks the segment when it exits.
+    """
+
+    LABEL_BYTES = 32
+    HEADER_FIELDS = 8  # magic, window, max_labels, buckets, ways, stripes, label count, reserved
+    MAGIC = 0x454D4F5354415445  # 'EMOSTATE'
+
+    def __init__(self, window=3, labels=(), buckets=2048, ways=8, ttl_s=1800.0, max_labels=16, stripes=64):
+        if window > 255:
+            raise ValueError('window must fit in uint8 counts')
+        self.window = int(window)
+        self.buckets = max(1, int(buckets))
+        self.ways = max(1, int(ways))
+        self.ttl_s = float(ttl_s)
+        self.max_labels = int(max_labels)
+        self.stripes = max(1, min(int(stripes), self.buckets))
+        self.capacity = self.buckets * self.ways
+
+        layout, size = self._layout()
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.name = self.shm.name
+        self._owner_pid = os.getpid()
+        self._arrays = {}
+        for field, (dtype, count, offset) in layout.items():
+            self._arrays[field] = np.ndarray((count,), dtype=dtype, buffer=self.shm.buf, offset=offset)
+        arrays = self._arrays
+
+        arrays['header'][:] = [self.MAGIC, self.window, self.max_labels, self.buckets, self.ways, self.stripes, 0, 0]
+        arrays['fingerprint'][:] = 0
+        arrays['confidence'][:] = np.nan
+        self.history = arrays['history'].reshape(self.capacity, self.window)
+        self.votes = arrays['votes'].reshape(self.capacity, self.max_labels)
+
+        # Flat memoryviews for scalar access, as in StudentStateStore
+        self._views = {field: memoryview(array) for field, array in arrays.items()}
+        self._fingerprint = self._views['fingerprint']
+        self._last_seen = self._views['last_seen']
+        self._confidence = self._views['confidence']
+        self._cursor = self._views['cursor']
+        self._filled = self._views['filled']
+        self._last_code = self._views['last_code']
+        self._smoothed = self._views['smoothed']
+        self._changed_at = self._views['changed_at']
+        self._history = self._views['history']
+        self._votes = self._views['votes']
+        self._counters = self._views['counters']  # per stripe: evictions, expirations
+
+        self._locks = [multiprocessing.Lock() for _ in range(self.stripes)]
+        self._label_lock = multiprocessing.Lock()
+        self.labels = []
+        self._codes = {}
+        for label in labels:
+            self._label_code(label)
+
+        atexit.register(self._cleanup)
+
+    def _layout(self):
+        fields = [
+            ('header', np.uint64, self.HEADER_FIELDS),
+            ('fingerprint', np.uint64, self.capacity),
+            ('last_seen', np.float64, self.capacity),
+            ('changed_at', np.float64, self.capacity),
+            ('counters', np.uint64, 2 * self.stripes),
+            ('confidence', np.float32, self.capacity),
+            ('cursor', np.uint8, self.capacity),
+            ('filled', np.uint8, self.capacity),
+            ('last_code', np.int8, self.capacity),
+            ('smoothed', np.int8, self.capacity),
+            ('history', np.int8, self.capacity * self.window),
+            ('votes', np.uint8, self.capacity * self.max_labels),
+            ('label_table', np.uint8, self.max_labels * self.LABEL_BYTES),
+        ]
+        layout, offset = {}, 0
+        for field, dtype, count in fields:
+            offset = (offset + 7) & ~7
+            layout[field] = (dtype, count, offset)
+            offset += np.dtype(dtype).itemsize * count
+        return layout, offset
+
+    # Labels: a small table in the segment so codes mean the same in every worker
+
+    def _load_labels(self):
+        table = self._arrays['label_table'].reshape(self.max_labels, self.LABEL_BYTES)
+        for code in range(len(self.labels), int(self._arrays['header'][6])):
+            label = bytes(table[code]).rstrip(b'\0').decode('utf-8')
+            self.labels.append(label)
+            self._codes[label] = code
+
+    def _label_code(self, label):
+        code = self._codes.get(label)
+        if code is not None:
+            return code
+        with self._label_lock:
+            self._load_labels()
+            code = self._codes.get(label)
+            if code is None:
+                encoded = label.encode('utf-8')
+                if len(encoded) >= self.LABEL_BYTES:
+                    raise ValueError(f"label longer than {self.LABEL_BYTES - 1} bytes: {label}")
+                count = int(self._arrays['header'][6])
+                if count >= self.max_labels:
+                    raise ValueError(f"more than {self.max_labels} distinct labels")
+                table = self._arrays['label_table'].reshape(self.max_labels, self.LABEL_BYTES)
+                table[count, :len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+                self._arrays['header'][6] = count + 1
+                self._load_labels()
+                code = self._codes[label]
+        return code
+
+    def _label(self, code):
+        if code >= len(self.labels):
+            with self._label_lock:
+                self._load_labels()
+        return self.labels[code]
+
+    # Slots
+
+    def _locate(self, key):
+        fingerprint = student_fingerprint(key)
+        bucket = (fingerprint >> 16) % self.buckets
+        return fingerprint, bucket, bucket % self.stripes
+
+    def _reset(self, slot):
+        self.history[slot] = -1
+        self.votes[slot] = 0
+        self._cursor[slot] = 0
+        self._filled[slot] = 0
+        self._last_code[slot] = -1
+        self._smoothed[slot] = -1
+        self._confidence[slot] = float('nan')
+
+    def _find(self, fingerprint, bucket, stripe, now, create):
+        """Slot of `fingerprint` in its bucket; with create, claim one. Caller holds the stripe lock."""
+        base = bucket * self.ways
+        fingerprints, last_seen = self._fingerprint, self._last_seen
+        free = oldest = None
+        for slot in range(base, base + self.ways):
+            current = fingerprints[slot]
+            if current == fingerprint:
+                if now - last_seen[slot] > self.ttl_s:
+                    if not create:
+                        return None
+                    self._reset(slot)
+                    self._counters[2 * stripe + 1] += 1
+                return slot
+            if free is None:
+                if current == 0:
+                    free = slot
+                elif now - last_seen[slot] > self.ttl_s:
+                    free = slot
+                elif oldest is None or last_seen[slot] < last_seen[oldest]:
+                    oldest = slot
+        if not create:
+            return None
+        if free is not None:
+            if fingerprints[free] != 0:
+                self._counters[2 * stripe + 1] += 1
+            slot = free
+        else:
+            slot = oldest
+            self._counters[2 * stripe] += 1
+        fingerprints[slot] = fingerprint
+        self._reset(slot)
+        return slot
+
+    def push(self, key, label, confidence=None):
+        """Record `label` (and its confidence, if known) for student `key` and return the smoothed label."""
+        code = self._label_code(label)
+        fingerprint, bucket, stripe = self._locate(key)
+        window = self.window
+        now = time.time()
+        with self._locks[stripe]:
+            slot = self._find(fingerprint, bucket, stripe, now, create=True)
+            self._last_seen[slot] = now
+            self._last_code[slot] = code
+            self._confidence[slot] = float('nan') if confidence is None else confidence
+
+            history, votes = self._history, self._votes
+            base, vbase = slot * window, slot * self.max_labels
+            position = self._cursor[slot]
+            old = history[base + position]
+            if old >= 0:
+                votes[vbase + old] -= 1
+            history[base + position] = code
+            votes[vbase + code] += 1
+            self._cursor[slot] = (position + 1) % window
+            filled = min(self._filled[slot] + 1, window)
+            self._filled[slot] = filled
+
+            # Scan oldest first and keep the first label with the most votes
+            start = (position + 1) % window if filled == window else 0
+            best, best_votes = code, 0
+            for i in range(filled):
+                candidate = history[base + (start + i) % window]
+                count = votes[vbase + candidate]
+                if count > best_votes:
+                    best, best_votes = candidate, count
+            if best != self._smoothed[slot]:
+                self._smoothed[slot] = best
+                self._changed_at[slot] = now
+        return self._label(best)
+
+    def stable_for(self, key):
+        """Seconds the student's smoothed emotion has been unchanged, as seen by any worker (0.0 when unknown)."""
+        fingerprint, bucket, stripe = self._locate(key)
+        now = time.time()
+        with self._locks[stripe]:
+            slot = self._find(fingerprint, bucket, stripe, now, create=False)
+            if slot is None or self._smoothed[slot] < 0:
+                return 0.0
+            return now - self._changed_at[slot]
+
+    def get(self, key):
+        """The student's current window as labels, oldest first ([] when unknown or expired)."""
+        fingerprint, bucket, stripe = self._locate(key)
+        with self._locks[stripe]:
+            slot = self._find(fingerprint, bucket, stripe, time.time(), create=False)
+            if slot is None:
+                return []
+            filled = self._filled[slot]
+            start = self._cursor[slot] if filled == self.window else 0
+            codes = [self._history[slot * self.window + (start + i) % self.window] for i in range(filled)]
+        return [self._label(code) for code in codes]
+
+    def last_result(self, key):
+        """{'emotion', 'confidence', 'age_s'} of the student's latest raw result, from any worker, or None."""
+        fingerprint, bucket, stripe = self._locate(key)
+        now = time.time()
+        with self._locks[stripe]:
+            slot = self._find(fingerprint, bucket, stripe, now, create=False)
+            if slot is None or self._last_code[slot] < 0:
+                return None
+            code, confidence = self._last_code[slot], self._confidence[slot]
+            age = now - self._last_seen[slot]
+        return {
+            'emotion': self._label(code),
+            'confidence': None if confidence != confidence else round(confidence, 4),
+            'age_s': round(age, 3),
+        }
+
+    def forget(self, key):
+        fingerprint, bucket, stripe = self._locate(key)
+        with self._locks[stripe]:
+            slot = self._find(fingerprint, bucket, stripe, time.time(), create=False)
+            if slot is not None:
+                self._fingerprint[slot] = 0
+
+    def __len__(self):
+        now = time.time()
+        fingerprints, last_seen = self._arrays['fingerprint'], self._arrays['last_seen']
+        return int(np.count_nonzero((fingerprints != 0) & (now - last_seen <= self.ttl_s)))
+
+    def stats(self):
+        counters = self._arrays['counters'].reshape(self.stripes, 2)
+        return {
+            'backend': 'shared',
+            'name': self.name,
+            'students': len(self),
+            'capacity': self.capacity,
+            'buckets': self.buckets,
+            'ways': self.ways,
+            'stripes': self.stripes,
+            'window': self.window,
+            'ttl_s': self.ttl_s,
+            'evictions': int(counters[:, 0].sum()),
+            'expirations': int(counters[:, 1].sum()),
+            'shared_bytes': self.shm.size,
+        }
+
+    def close(self):
+        for view in self._views.values():
+            view.release()
+        self._views = {}
+        self._arrays = {}
+        self.history = self.votes = None
+        self.shm.close()
+
+    def _cleanup(self):
+        # atexit also runs in forked workers that exit normally; only the creator unlinks
+        if os.getpid() != self._owner_pid or self.shm is None:
+            return
+        try:
+            self.close()
+            self.shm.unlink()
+        except (BufferError, FileNotFoundError):
+            pass
+        self.shm = None
+
+
+def create_student_state(window=3, labels=()):
+    """
+    Smoothing store selected by STUDENT_STATE_BACKEND.
+
+    Backends:
+        local   StudentStateStore, one per process (default); STUDENT_STATE_MAX rows
+        shared  SharedStudentStateStore for pre-forked workers; STUDENT_STATE_MAX
+                slots in STUDENT_STATE_WAYS-way buckets, STUDENT_STATE_STRIPES locks
+    Both expire students idle for STUDENT_STATE_TTL_S.
+    """
+    backend = os.environ.get('STUDENT_STATE_BACKEND', 'local').lower()
+    max_students = int(os.environ.get('STUDENT_STATE_MAX', 10000))
+    ttl_s = float(os.environ.get('STUDENT_STATE_TTL_S', 1800))
+    if backend == 'local':
+        return StudentStateStore(window=window, labels=labels, max_students=max_students, ttl_s=ttl_s)
+    if backend == 'shared':
+        ways = int(os.environ.get('STUDENT_STATE_WAYS', 8))
+        return SharedStudentStateStore(
+            window=window,
+            labels=labels,
+            buckets=max(1, -(-max_students // ways)),
+            ways=ways,
+            ttl_s=ttl_s,
+            stripes=int(os.environ.get('STUDENT_STATE_STRIPES', 64))
+        )
+    raise ValueError(f"Unknown STUDENT_STATE_BACKEND '{backend}' (expected local or shared)")
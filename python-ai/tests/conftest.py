@@ -0,0 +1,60 @@
+# conftest.py
+# The server modules are flat files in python-ai/; make them importable from the tests
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=4)
+    yield executor
+    executor.shutdown(wait=True)
+
+
+class Gate:
+    """A job that blocks until opened, so tests control exactly when slots free up"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.running = {}
+        self.overlaps = []
+        self._lock = threading.Lock()
+
+    def job(self, key='job'):
+        with self._lock:
+            self.running[key] = self.running.get(key, 0) + 1
+            if self.running[key] > 1:
+                self.overlaps.append(key)
+        self.event.wait(5)
+        with self._lock:
+            self.running[key] -= 1
+        return key
+
+    def open(self):
+        self.event.set()
+
+
+async def _until(predicate, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        assert time.perf_counter() < deadline, 'condition not reached'
+        await asyncio.sleep(0.001)
+
+
+@pytest.fixture
+def gate():
+    return Gate()
+
+
+@pytest.fixture
+def until():
+    """await until(predicate): poll on the event loop until predicate() holds"""
+    return _until
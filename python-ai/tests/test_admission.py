@@ -0,0 +1,111 @@
+# test_admission.py
+# AdmissionQueue rejections: 429 queue_full, 503 queue_timeout / deadline_expired, Retry-After; on_start / on_finish
+
+import asyncio
+import time
+import pytest
+from admission import AdmissionQueue, Overloaded
+
+
+def test_full_queue_is_rejected_with_429(executor, gate, until):
+    async def main():
+        queue = AdmissionQueue(executor, workers=1, max_queue=1)
+        running = asyncio.ensure_future(queue.run(gate.job, 'a'))
+        await until(lambda: queue.running == 1)
+        waiting = asyncio.ensure_future(queue.run(gate.job, 'b'))
+        await until(lambda: queue.waiting == 1)
+
+        with pytest.raises(Overloaded) as rejected:
+            await queue.run(gate.job, 'c')
+        assert (rejected.value.status, rejected.value.reason) == (429, 'queue_full')
+        assert rejected.value.retry_after_s >= 1
+
+        gate.open()
+        assert await asyncio.gather(running, waiting) == ['a', 'b']
+        stats = queue.stats()
+        assert stats['rejected']['queue_full'] == 1
+        assert (stats['accepted'], stats['completed'], stats['running']) == (2, 2, 0)
+
+    asyncio.run(main())
+
+
+def test_long_wait_is_rejected_with_503(executor, gate, until):
+    async def main():
+        queue = AdmissionQueue(executor, workers=1, max_queue=4, max_wait_ms=50)
+        running = asyncio.ensure_future(queue.run(gate.job))
+        await until(lambda: queue.running == 1)
+
+        with pytest.raises(Overloaded) as rejected:
+            await queue.run(gate.job)
+        assert (rejected.value.status, rejected.value.reason) == (503, 'queue_timeout')
+        assert queue.waiting == 0
+
+        gate.open()
+        await running
+        assert queue.stats()['rejected']['queue_timeout'] == 1
+
+    asyncio.run(main())
+
+
+def test_deadline_is_enforced_before_and_while_waiting(executor, gate, until):
+    async def main():
+        queue = AdmissionQueue(executor, workers=1, max_queue=4, max_wait_ms=5000)
+
+        with pytest.raises(Overloaded) as rejected:
+            await queue.run(gate.job, deadline=time.perf_counter() - 0.001)
+        assert (rejected.value.status, rejected.value.reason) == (503, 'deadline_expired')
+
+        running = asyncio.ensure_future(queue.run(gate.job))
+        await until(lambda: queue.running == 1)
+        t0 = time.perf_counter()
+        with pytest.raises(Overloaded) as rejected:
+            await queue.run(gate.job, deadline=t0 + 0.05)
+        # The deadline, not max_wait_ms, bounded the wait
+        assert time.perf_counter() - t0 < 1.0
+        assert rejected.value.reason == 'deadline_expired'
+
+        gate.open()
+        await running
+        assert queue.stats()['rejected'] == {'queue_full': 0, 'queue_timeout': 0, 'deadline_expired': 2}
+
+    asyncio.run(main())
+
+
+def test_retry_after_estimates_backlog_drain_time(executor):
+    queue = AdmissionQueue(executor, workers=2)
+    assert queue.retry_after_s() == 1
+    queue.service_ms = 1500.0
+    queue.running, queue.waiting = 2, 4
+    assert queue.retry_after_s() == 5   # 6 jobs x 1.5 s over 2 workers
+
+
+def test_on_start_veto_releases_the_slot(executor):
+    async def main():
+        queue = AdmissionQueue(executor, workers=1)
+
+        def veto():
+            raise asyncio.CancelledError()
+
+        with pytest.raises(asyncio.CancelledError):
+            await queue.run(lambda: 'vetoed', on_start=veto)
+        assert await queue.run(lambda: 'next') == 'next'
+        assert queue.stats()['accepted'] == 1
+
+    asyncio.run(main())
+
+
+def test_on_finish_waits_for_the_job_even_if_the_caller_is_cancelled(executor, gate, until):
+    async def main():
+        finished = []
+        queue = AdmissionQueue(executor, workers=1)
+        caller = asyncio.ensure_future(queue.run(gate.job, on_finish=lambda: finished.append(True)))
+        await until(lambda: queue.running == 1)
+        caller.cancel()
+        await asyncio.sleep(0.01)
+        assert finished == [] and queue.running == 1
+
+        gate.open()
+        await until(lambda: finished == [True])
+        assert queue.running == 0
+
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+# test_async_frame_io.py
+# api_server_async.read_frame_request: multipart streamed off the event loop, large JSON parsed on a helper thread
+
+import asyncio
+import base64
+import json
+import threading
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+import api_server_async
+
+JPEG = b'\xff\xd8\xff\xe0' + bytes(range(256)) * 8 + b'\xff\xd9'
+
+
+async def echo(request):
+    fields, image = await api_server_async.read_frame_request(request)
+    return web.json_response({'fields': fields, 'image': None if image is None else (
+        image if isinstance(image, str) else base64.b64encode(bytes(image)).decode())})
+
+
+def post(*args, **kwargs):
+    async def run():
+        app = web.Application(client_max_size=api_server_async.MAX_BODY_BYTES)
+        app.router.add_post('/analyze', echo)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post('/analyze', *args, **kwargs)
+            return response.status, await response.json()
+    return asyncio.run(run())
+
+
+def multipart(image=JPEG, **fields):
+    form = aiohttp.FormData(default_to_multipart=True)
+    for key, value in fields.items():
+        form.add_field(key, value)
+    if image is not None:
+        form.add_field('image', image, filename='frame.jpg', content_type='image/jpeg')
+    return form
+
+
+def test_multipart_fields_and_image():
+    status, body = post(params={'classId': 'c9'}, data=multipart(studentId='s2', name='Grace'))
+    assert status == 200
+    assert body['fields'] == {'classId': 'c9', 'studentId': 's2', 'name': 'Grace'}
+    assert base64.b64decode(body['image']) == JPEG
+
+
+def test_multipart_form_fields_override_query():
+    _, body = post(params={'studentId': 'from-query'}, data=multipart(studentId='from-form'))
+    assert body['fields']['studentId'] == 'from-form'
+
+
+def test_multipart_without_image():
+    _, body = post(data=multipart(image=None, studentId='s2'))
+    assert body == {'fields': {'studentId': 's2'}, 'image': None}
+
+
+def test_multipart_is_not_spooled_through_request_post(monkeypatch):
+    async def spooling_post(self):
+        raise AssertionError('request.post() writes file parts to disk on the event loop')
+    monkeypatch.setattr(web.BaseRequest, 'post', spooling_post)
+    status, body = post(data=multipart(studentId='s2'))
+    assert status == 200 and base64.b64decode(body['image']) == JPEG
+
+
+def test_multipart_over_the_body_limit(monkeypatch):
+    monkeypatch.setattr(api_server_async, 'MAX_BODY_BYTES', 1024)
+    with pytest.raises(web.HTTPRequestEntityTooLarge):
+        asyncio.run(_read_oversized())
+
+
+async def _read_oversized():
+    class Part:
+        def __init__(self):
+            self.chunks = [b'x' * 600, b'x' * 600, b'']
+
+        async def read_chunk(self):
+            return self.chunks.pop(0)
+
+    await api_server_async._read_part(Part(), 0)
+
+
+@pytest.mark.parametrize('image_size, offloaded', [(100, False), (200_000, True)])
+def test_json_parsed_off_the_loop_when_large(monkeypatch, image_size, offloaded):
+    threads = []
+    parse = api_server_async._parse_json
+
+    def recording_parse(body):
+        threads.append(threading.current_thread() is threading.main_thread())
+        return parse(body)
+
+    monkeypatch.setattr(api_server_async, '_parse_json', recording_parse)
+    image = 'data:image/jpeg;base64,' + 'A' * image_size
+    status, body = post(data=json.dumps({'studentId': 's1', 'image': image}),
+                        headers={'Content-Type': 'application/json'})
+    assert status == 200
+    assert body['fields']['studentId'] == 's1' and body['image'] == image
+    # The loop runs on the main thread here; an offloaded parse does not
+    assert threads == [not offloaded]
+
+
+@pytest.mark.parametrize('data', ['not json', '[1, 2]'])
+def test_json_that_is_not_an_object(data):
+    assert post(data=data, headers={'Content-Type': 'application/json'}) == (200, {'fields': {}, 'image': None})
+
+
+def test_raw_body_with_metadata_headers():
+    status, body = post(data=JPEG, params={'classId': 'c3'},
+                        headers={'Content-Type': 'image/jpeg', 'X-Student-Id': 's3', 'X-Student-Name': 'Alan'})
+    assert body['fields'] == {'classId': 'c3', 'studentId': 's3', 'name': 'Alan'}
+    assert base64.b64decode(body['image']) == JPEG
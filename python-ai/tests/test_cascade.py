@@ -0,0 +1,101 @@
+# test_cascade.py
+# Cascade accept / fallback / exhausted paths, budget skips and failing stages
+
+import pytest
+from cascade import Cascade, Stage, StageCostModel
+
+
+class Recorder:
+    """A stage body that returns a fixed result and remembers it was called"""
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    def __call__(self, ctx):
+        self.calls += 1
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def stages(*specs):
+    return [Stage(name, Recorder(result), accept, prior_ms=1) for name, result, accept in specs]
+
+
+def test_first_stage_accepts():
+    cascade = Cascade(stages(('fast', {'confidence': 0.6}, 0.25), ('fallback', {'confidence': 0.9}, 0.2)))
+    result, accepted, trace = cascade.run({})
+    assert accepted == 'fast' and result == {'confidence': 0.6}
+    assert cascade.stages[1].run.calls == 0
+    assert [entry['stage'] for entry in trace] == ['fast']
+    assert trace[0]['accepted'] is True
+
+
+def test_accept_threshold_is_inclusive():
+    cascade = Cascade(stages(('fast', {'confidence': 0.25}, 0.25)))
+    assert cascade.run({})[1] == 'fast'
+
+
+def test_unsure_first_stage_falls_back():
+    cascade = Cascade(stages(('fast', {'confidence': 0.2}, 0.25), ('fallback', {'confidence': 0.5}, 0.2)))
+    result, accepted, trace = cascade.run({})
+    assert accepted == 'fallback' and result == {'confidence': 0.5}
+    assert [entry['stage'] for entry in trace] == ['fast', 'fallback']
+    assert 'accepted' not in trace[0] and trace[0]['confidence'] == 0.2
+
+
+def test_exhausted_returns_best_result_unaccepted():
+    cascade = Cascade(stages(
+        ('fast', {'emotion': 'sad', 'confidence': 0.18}, 0.25),
+        ('fallback', {'emotion': 'happy', 'confidence': 0.16}, 0.2)))
+    result, accepted, trace = cascade.run({})
+    assert accepted is None
+    assert result == {'emotion': 'sad', 'confidence': 0.18, 'stage': 'fast'}
+    assert not any(entry.get('accepted') for entry in trace)
+
+
+def test_no_results_at_all():
+    cascade = Cascade(stages(('fast', None, 0.25), ('fallback', None, 0.2)))
+    assert cascade.run({}) == (None, None, [{'stage': 'fast', 'ms': pytest.approx(0, abs=5)},
+                                            {'stage': 'fallback', 'ms': pytest.approx(0, abs=5)}])
+
+
+def test_failing_stage_is_traced_and_skipped():
+    cascade = Cascade(stages(('fast', RuntimeError('boom'), 0.25), ('fallback', {'confidence': 0.3}, 0.2)))
+    result, accepted, trace = cascade.run({})
+    assert accepted == 'fallback'
+    assert trace[0]['error'] == 'boom'
+    assert cascade.costs.snapshot()['fast']['samples'] == 1
+
+
+def test_budget_skips_stages_that_cannot_fit():
+    costs = StageCostModel()
+    costs.observe('fallback', 500.0)
+    cascade = Cascade(stages(('fast', {'confidence': 0.2}, 0.25), ('fallback', {'confidence': 0.9}, 0.2)),
+                      cost_model=costs)
+    result, accepted, trace = cascade.run({}, budget_ms=200, spent_ms=10)
+    assert accepted is None and result['stage'] == 'fast'
+    assert trace[1] == {'stage': 'fallback', 'skipped': 'budget', 'estimate_ms': 500.0}
+    assert cascade.stages[1].run.calls == 0
+    # Without the budget the fallback runs
+    assert cascade.run({})[1] == 'fallback'
+
+
+def test_cost_model_is_an_ewma():
+    costs = StageCostModel(alpha=0.5)
+    assert costs.estimate('fast', 50.0) == 50.0
+    costs.observe('fast', 100.0)
+    costs.observe('fast', 200.0)
+    assert costs.estimate('fast', 50.0) == pytest.approx(150.0)
+    assert costs.snapshot() == {'fast': {'ms': 150.0, 'samples': 2}}
+
+
+def test_precomputed_stage_is_not_rerun_or_learned():
+    cascade = Cascade(stages(('fast', {'confidence': 0.9}, 0.25), ('fallback', {'confidence': 0.9}, 0.2)))
+    precomputed = {'fast': ({'confidence': 0.1}, 40.0)}
+    result, accepted, trace = cascade.run({}, precomputed=precomputed)
+    assert cascade.stages[0].run.calls == 0
+    assert trace[0] == {'stage': 'fast', 'ms': 40.0, 'precomputed': True, 'confidence': 0.1}
+    assert accepted == 'fallback'
+    assert 'fast' not in cascade.costs.snapshot()
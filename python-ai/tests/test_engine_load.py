@@ -0,0 +1,52 @@
+# test_engine_load.py
+# Emotion engines build their model once, however many request threads call load() at the same time
+
+import threading
+import time
+import pytest
+import emotion_engine
+
+
+class SlowBuild:
+    """A model constructor slow enough for concurrent load() calls to overlap"""
+
+    def __init__(self):
+        self.built = 0
+
+    def __call__(self, *args, **kwargs):
+        time.sleep(0.05)
+        self.built += 1
+        return object()
+
+
+def load_concurrently(engine, threads=8):
+    start = threading.Barrier(threads)
+    models = []
+
+    def load():
+        start.wait()
+        models.append(engine.load())
+
+    workers = [threading.Thread(target=load) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return models
+
+
+@pytest.mark.parametrize('engine_type', ['deepface', 'torch'])
+def test_concurrent_loads_build_once(monkeypatch, engine_type):
+    build = SlowBuild()
+    if engine_type == 'deepface':
+        monkeypatch.setattr(emotion_engine, '_build_emotion_model', build)
+        engine = emotion_engine.DeepFaceEmotionEngine()
+    else:
+        # Imports train_emotion_model, which needs torchvision (requirements_training.txt)
+        inference_custom_model = pytest.importorskip('inference_custom_model')
+        monkeypatch.setattr(inference_custom_model, 'CustomEmotionDetector', build)
+        engine = inference_custom_model.TorchEmotionEngine('model.pth')
+    models = load_concurrently(engine)
+    assert build.built == 1
+    assert len(models) == 8 and all(model is models[0] for model in models)
+    assert engine.load() is models[0] and build.built == 1
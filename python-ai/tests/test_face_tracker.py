@@ -0,0 +1,109 @@
+# test_face_tracker.py
+# FaceTracker: region search around the last box, the periodic full scan, and dropping/evicting tracks
+
+import numpy as np
+import pytest
+from face_tracker import FaceTracker
+
+
+class Detector:
+    """Finds the one bright rectangle in whatever it is given; records the shape of each call"""
+
+    def __init__(self):
+        self.shapes = []
+
+    def __call__(self, img):
+        self.shapes.append(img.shape[:2])
+        ys, xs = np.nonzero(img)
+        if not len(xs):
+            return []
+        return [(xs.min(), ys.min(), xs.max() - xs.min() + 1, ys.max() - ys.min() + 1)]
+
+
+def frame(x=100, y=80, w=40, h=50, shape=(240, 320)):
+    img = np.zeros(shape, dtype=np.uint8)
+    if w and h:
+        img[y:y + h, x:x + w] = 255
+    return img
+
+
+@pytest.fixture
+def detector():
+    return Detector()
+
+
+def test_first_frame_is_a_full_scan(detector):
+    tracker = FaceTracker()
+    assert tracker.detect('s1', frame(), detector) == [(100, 80, 40, 50)]
+    assert detector.shapes == [(240, 320)]
+    assert tracker.last_box('s1') == (100, 80, 40, 50)
+    assert tracker.stats()['full_scans'] == 1
+
+
+def test_next_frame_searches_only_around_the_last_box(detector):
+    tracker = FaceTracker(expand=0.5)
+    tracker.detect('s1', frame(), detector)
+    # The face moved a little; the box comes back in full-image coordinates
+    assert tracker.detect('s1', frame(x=110, y=85), detector) == [(110, 85, 40, 50)]
+    # 40x50 box grown by 20/25 px on each side
+    assert detector.shapes[1] == (100, 80)
+    assert tracker.last_box('s1') == (110, 85, 40, 50)
+    stats = tracker.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 0 and stats['hit_rate'] == 1.0
+
+
+def test_search_region_is_clipped_to_the_frame(detector):
+    tracker = FaceTracker(expand=0.5)
+    tracker.detect('s1', frame(x=0, y=0), detector)
+    assert tracker.detect('s1', frame(x=0, y=0), detector) == [(0, 0, 40, 50)]
+    assert detector.shapes[1] == (75, 60)
+
+
+def test_a_miss_in_the_region_falls_back_to_a_full_scan(detector):
+    tracker = FaceTracker(expand=0.5)
+    tracker.detect('s1', frame(x=10, y=10), detector)
+    # Jumped across the frame: outside the search region
+    assert tracker.detect('s1', frame(x=250, y=170), detector) == [(250, 170, 40, 50)]
+    assert len(detector.shapes) == 3 and detector.shapes[2] == (240, 320)
+    stats = tracker.stats()
+    assert stats['misses'] == 1 and stats['full_scans'] == 2
+    assert tracker.last_box('s1') == (250, 170, 40, 50)
+
+
+def test_full_scan_is_forced_every_refresh_every_frames(detector):
+    tracker = FaceTracker(refresh_every=3)
+    for _ in range(5):
+        tracker.detect('s1', frame(), detector)
+    full = [shape == (240, 320) for shape in detector.shapes]
+    # full scan, 3 tracked frames, then the forced full scan
+    assert full == [True, False, False, False, True]
+    assert tracker.stats()['hits'] == 3
+
+
+def test_track_is_dropped_when_no_face_is_found(detector):
+    tracker = FaceTracker()
+    tracker.detect('s1', frame(), detector)
+    assert tracker.detect('s1', frame(w=0), detector) == []
+    assert tracker.last_box('s1') is None
+    # The next frame starts from a full scan again
+    tracker.detect('s1', frame(), detector)
+    assert detector.shapes[-1] == (240, 320)
+
+
+def test_least_recently_seen_student_is_evicted(detector):
+    tracker = FaceTracker(max_tracks=2)
+    for key in ('s1', 's2', 's1', 's3'):
+        tracker.detect(key, frame(), detector)
+    assert tracker.last_box('s2') is None
+    assert tracker.last_box('s1') and tracker.last_box('s3')
+    assert tracker.stats()['tracks'] == 2
+
+
+def test_tracks_are_per_student(detector):
+    tracker = FaceTracker()
+    tracker.detect('s1', frame(x=10, y=10), detector)
+    tracker.detect('s2', frame(x=200, y=150), detector)
+    assert tracker.last_box('s1') == (10, 10, 40, 50)
+    assert tracker.last_box('s2') == (200, 150, 40, 50)
+    tracker.forget('s1')
+    assert tracker.last_box('s1') is None and tracker.stats()['tracks'] == 1
@@ -0,0 +1,99 @@
+# test_frame_cache.py
+# dHash and FrameCache: near-duplicate hits, misses on a changed face, TTL expiry and LRU eviction
+
+import cv2
+import numpy as np
+import pytest
+import frame_cache
+from frame_cache import FrameCache, dhash, hamming
+
+
+def scene(seed=0, shape=(240, 320, 3)):
+    rng = np.random.default_rng(seed)
+    # Smooth blobs rather than pixel noise, so small perturbations keep the gradients
+    small = rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    return cv2.resize(small, (shape[1], shape[0]), interpolation=cv2.INTER_CUBIC)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(frame_cache.time, 'time', lambda: now[0])
+    return now
+
+
+def test_dhash_is_64_bits_and_stable_under_noise_and_scale():
+    img = scene()
+    h = dhash(img)
+    assert 0 <= h < 2 ** 64
+    noisy = np.clip(img.astype(np.int16) + np.random.default_rng(1).integers(-3, 4, img.shape), 0, 255).astype(np.uint8)
+    assert hamming(h, dhash(noisy)) <= 4
+    # A BGR frame and its grayscale hash the same scene near-identically, at any resolution
+    assert hamming(h, dhash(cv2.resize(img, (640, 480)))) <= 4
+    assert hamming(h, dhash(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))) <= 4
+
+
+def test_dhash_differs_for_a_different_scene():
+    assert hamming(dhash(scene(0)), dhash(scene(1))) > 10
+
+
+def test_hamming():
+    assert hamming(0b1011, 0b0001) == 2
+    assert hamming(2 ** 64 - 1, 0) == 64
+
+
+def test_lookup_hits_on_the_same_frame_and_misses_on_a_new_one(clock):
+    cache = FrameCache(max_distance=4)
+    assert cache.lookup('s1', scene()) is None
+    cache.store('s1', scene(), {'emotion': 'happy'})
+    clock[0] += 1.5
+    assert cache.lookup('s1', scene()) == ({'emotion': 'happy'}, 1.5)
+    assert cache.lookup('s1', scene(7)) is None
+    # Another student's entry is not shared
+    assert cache.lookup('s2', scene()) is None
+    stats = cache.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 3 and stats['hit_rate'] == 0.25
+
+
+def test_lookup_hashes_the_stored_face_box_only(clock):
+    cache = FrameCache()
+    img = scene()
+    box = (100, 60, 80, 100)
+    cache.store('s1', img, 'result', box=box)
+    # The background changes, the face region does not
+    changed = scene(3)
+    changed[60:160, 100:180] = img[60:160, 100:180]
+    assert cache.lookup('s1', changed) == ('result', 0.0)
+    # The face region changes
+    moved = img.copy()
+    moved[60:160, 100:180] = scene(5)[60:160, 100:180]
+    assert cache.lookup('s1', moved) is None
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = FrameCache(ttl_s=5.0)
+    cache.store('s1', scene(), 'result')
+    clock[0] += 5.0
+    assert cache.lookup('s1', scene()) == ('result', 5.0)
+    clock[0] += 0.1
+    assert cache.lookup('s1', scene()) is None
+    stats = cache.stats()
+    assert stats['expired'] == 1 and stats['entries'] == 0
+
+
+def test_least_recently_used_student_is_evicted(clock):
+    cache = FrameCache(max_entries=2)
+    cache.store('s1', scene(), 'one')
+    cache.store('s2', scene(), 'two')
+    assert cache.lookup('s1', scene())        # s1 is now the most recent
+    cache.store('s3', scene(), 'three')
+    assert cache.lookup('s2', scene()) is None
+    assert cache.lookup('s1', scene())[0] == 'one'
+    assert cache.stats()['evictions'] == 1
+
+
+def test_forget(clock):
+    cache = FrameCache()
+    cache.store('s1', scene(), 'result')
+    cache.forget('s1')
+    assert cache.lookup('s1', scene()) is None
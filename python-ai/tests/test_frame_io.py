@@ -0,0 +1,94 @@
+# test_frame_io.py
+# read_frame_request body formats (JSON, multipart, raw) and decode_frame
+
+import base64
+import io
+import json
+import cv2
+import numpy as np
+import pytest
+from flask import Flask, request
+from frame_io import decode_frame, read_frame_request
+
+app = Flask(__name__)
+
+
+@pytest.fixture(scope='module')
+def jpeg():
+    img = np.zeros((48, 64, 3), dtype=np.uint8)
+    img[:, :32] = (30, 120, 210)
+    ok, encoded = cv2.imencode('.jpg', img)
+    assert ok
+    return encoded.tobytes()
+
+
+def read(**kwargs):
+    with app.test_request_context('/analyze', method='POST', **kwargs):
+        fields, image = read_frame_request(request)
+        # Binary paths hand back a view of the request buffer; copy it before the context closes
+        return fields, (bytes(image) if isinstance(image, memoryview) else image)
+
+
+def test_json_base64_data_url(jpeg):
+    image = 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode()
+    body = {'studentId': 's1', 'name': 'Ada', 'classId': 'c1', 'image': image}
+    fields, data = read(data=json.dumps(body), content_type='application/json')
+    assert fields['studentId'] == 's1' and fields['classId'] == 'c1'
+    assert data == image
+    assert decode_frame(data).shape == (48, 64, 3)
+
+
+def test_json_without_content_type_is_still_parsed(jpeg):
+    body = {'studentId': 's1', 'image': base64.b64encode(jpeg).decode()}
+    fields, data = read(data=json.dumps(body))
+    assert fields['studentId'] == 's1'
+    assert decode_frame(data) is not None
+
+
+def test_json_that_is_not_an_object():
+    assert read(data='[1, 2]', content_type='application/json') == ({}, None)
+
+
+def test_multipart_upload(jpeg):
+    fields, data = read(
+        query_string={'classId': 'c9'},
+        data={'studentId': 's2', 'name': 'Grace', 'image': (io.BytesIO(jpeg), 'frame.jpg')},
+        content_type='multipart/form-data')
+    assert fields == {'classId': 'c9', 'studentId': 's2', 'name': 'Grace'}
+    assert data == jpeg
+    assert decode_frame(data).shape == (48, 64, 3)
+
+
+def test_multipart_form_fields_override_query(jpeg):
+    fields, _ = read(
+        query_string={'studentId': 'from-query'},
+        data={'studentId': 'from-form', 'image': (io.BytesIO(jpeg), 'frame.jpg')},
+        content_type='multipart/form-data')
+    assert fields['studentId'] == 'from-form'
+
+
+def test_multipart_without_image():
+    fields, data = read(data={'studentId': 's2'}, content_type='multipart/form-data')
+    assert fields == {'studentId': 's2'} and data is None
+
+
+@pytest.mark.parametrize('content_type', ['image/jpeg', 'application/octet-stream'])
+def test_raw_body_with_metadata_headers(jpeg, content_type):
+    fields, data = read(
+        data=jpeg, content_type=content_type,
+        headers={'X-Student-Id': 's3', 'X-Student-Name': 'Alan', 'X-Class-Id': 'c3'})
+    assert fields == {'studentId': 's3', 'name': 'Alan', 'classId': 'c3'}
+    assert data == jpeg
+    assert decode_frame(data).shape == (48, 64, 3)
+
+
+def test_raw_body_query_string_wins_over_headers(jpeg):
+    fields, _ = read(
+        data=jpeg, content_type='image/jpeg',
+        query_string={'studentId': 'from-query'}, headers={'X-Student-Id': 'from-header'})
+    assert fields == {'studentId': 'from-query'}
+
+
+@pytest.mark.parametrize('data', [None, b'', '', b'not an image', 'bm90IGFuIGltYWdl', 'data:image/jpeg;base64,!!!'])
+def test_decode_frame_rejects_bad_input(data):
+    assert decode_frame(data) is None
@@ -0,0 +1,75 @@
+# test_frame_queue.py
+# LatestFrameQueue: newer frames supersede waiting ones (409), stale frames expire, one frame per student at a time
+
+import asyncio
+import pytest
+from admission import AdmissionQueue, Overloaded
+from frame_queue import LatestFrameQueue, Superseded
+
+
+def test_newer_frame_supersedes_the_waiting_one(executor, gate, until):
+    async def main():
+        frames = LatestFrameQueue(AdmissionQueue(executor, workers=1), deadline_ms=5000)
+        first = asyncio.ensure_future(frames.submit('s', gate.job, 'first'))
+        await until(lambda: frames.started == 1)
+        second = asyncio.ensure_future(frames.submit('s', gate.job, 'second'))
+        await asyncio.sleep(0.01)
+        third = asyncio.ensure_future(frames.submit('s', gate.job, 'third'))
+
+        with pytest.raises(Superseded):
+            await second
+        gate.open()
+        assert await first == 'first'
+        assert await third == 'third'
+        assert frames.stats() == {
+            'deadline_ms': 5000.0, 'pending': 0,
+            'submitted': 3, 'started': 2, 'superseded': 1, 'expired': 0,
+        }
+
+    asyncio.run(main())
+
+
+def test_other_students_are_not_superseded(executor, gate, until):
+    async def main():
+        frames = LatestFrameQueue(AdmissionQueue(executor, workers=2), deadline_ms=5000)
+        tasks = [asyncio.ensure_future(frames.submit(key, gate.job, key)) for key in ('a', 'b')]
+        await until(lambda: frames.started == 2)
+        gate.open()
+        assert await asyncio.gather(*tasks) == ['a', 'b']
+        assert frames.superseded == 0
+
+    asyncio.run(main())
+
+
+def test_frame_that_cannot_start_in_time_expires(executor, gate, until):
+    async def main():
+        frames = LatestFrameQueue(AdmissionQueue(executor, workers=1), deadline_ms=50)
+        busy = asyncio.ensure_future(frames.submit('a', gate.job, 'a'))
+        await until(lambda: frames.started == 1)
+        with pytest.raises(Overloaded) as rejected:
+            await frames.submit('b', gate.job, 'b')
+        assert (rejected.value.status, rejected.value.reason) == (503, 'deadline_expired')
+        gate.open()
+        await busy
+        assert frames.expired == 1
+
+    asyncio.run(main())
+
+
+def test_cancelled_frame_keeps_the_student_serialised(executor, gate, until):
+    async def main():
+        frames = LatestFrameQueue(AdmissionQueue(executor, workers=2), deadline_ms=5000)
+        gone = asyncio.ensure_future(frames.submit('s', gate.job, 's'))
+        await until(lambda: frames.started == 1)
+        gone.cancel()   # the client disconnects mid-inference
+        await asyncio.sleep(0)
+        following = asyncio.ensure_future(frames.submit('s', gate.job, 's'))
+        await asyncio.sleep(0.05)
+        # A worker is free, but the student's previous frame is still running
+        assert frames.started == 1
+        gate.open()
+        assert await following == 's'
+        assert gate.overlaps == []
+        await until(lambda: frames._locks == {})
+
+    asyncio.run(main())
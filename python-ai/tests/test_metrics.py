@@ -0,0 +1,136 @@
+# test_metrics.py
+# Prometheus text rendering, histogram buckets, and metrics summed across forked workers
+
+import multiprocessing
+import os
+import pytest
+from metrics import Registry
+
+
+def lines(registry):
+    return registry.render().splitlines()
+
+
+@pytest.fixture(params=['local', 'multiprocess'])
+def registry(request, tmp_path):
+    return Registry(str(tmp_path) if request.param == 'multiprocess' else None)
+
+
+def test_counter_and_gauge_text_format(registry):
+    requests = registry.counter('req_total', 'Requests answered', ('endpoint', 'status'))
+    in_flight = registry.gauge('in_flight', 'Requests in flight')
+    requests.labels('analyze', '200').inc()
+    requests.labels('analyze', '200').inc(2)
+    requests.labels('analyze', '500').inc()
+    in_flight.inc(3)
+    in_flight.dec()
+    assert lines(registry) == [
+        '# HELP req_total Requests answered',
+        '# TYPE req_total counter',
+        'req_total{endpoint="analyze",status="200"} 3.0',
+        'req_total{endpoint="analyze",status="500"} 1.0',
+        '# HELP in_flight Requests in flight',
+        '# TYPE in_flight gauge',
+        'in_flight 2.0',
+    ]
+
+
+def test_label_values_are_escaped(registry):
+    errors = registry.counter('errors_total', 'Errors', ('message',))
+    errors.labels('say "hi"\\\n').inc()
+    assert lines(registry)[-1] == 'errors_total{message="say \\"hi\\"\\\\\\n"} 1.0'
+
+
+def test_histogram_buckets_are_cumulative_with_le_inclusive(registry):
+    seconds = registry.histogram('stage_seconds', 'Stage time', ('stage',), buckets=(1.0, 0.1, 0.5))
+    for value in (0.05, 0.1, 0.3, 0.5, 2.0):
+        seconds.labels('resize').observe(value)
+    assert lines(registry)[2:] == [
+        'stage_seconds_bucket{stage="resize",le="0.1"} 2',    # 0.05 and 0.1 (le is <=)
+        'stage_seconds_bucket{stage="resize",le="0.5"} 4',
+        'stage_seconds_bucket{stage="resize",le="1.0"} 4',
+        'stage_seconds_bucket{stage="resize",le="+Inf"} 5',
+        'stage_seconds_sum{stage="resize"} 2.95',
+        'stage_seconds_count{stage="resize"} 5',
+    ]
+
+
+def test_series_are_listed_once_created(registry):
+    registry.counter('results_total', 'Results', ('outcome',)).labels('rejected')
+    assert lines(registry)[-1] == 'results_total{outcome="rejected"} 0.0'
+
+
+def test_labels_must_match_labelnames(registry):
+    with pytest.raises(ValueError):
+        registry.counter('results_total', 'Results', ('stage', 'outcome')).labels('fast')
+
+
+def test_reregistering_returns_the_same_metric():
+    registry = Registry()
+    assert registry.counter('a_total', 'A', ('x',)) is registry.counter('a_total', 'A', ('x',))
+    with pytest.raises(ValueError):
+        registry.gauge('a_total', 'A', ('x',))
+    with pytest.raises(ValueError):
+        registry.counter('a_total', 'A', ('y',))
+
+
+def run_in_worker(target):
+    process = multiprocessing.get_context('fork').Process(target=target)
+    process.start()
+    process.join(10)
+    assert process.exitcode == 0
+
+
+def test_multiprocess_sums_forked_workers(tmp_path):
+    registry = Registry(str(tmp_path))
+    requests = registry.counter('req_total', 'Requests', ('endpoint',))
+    seconds = registry.histogram('req_seconds', 'Latency', buckets=(0.1, 1.0))
+    # Recorded before the fork, like the master's warm-up: counted once, not once per worker
+    requests.labels('warmup').inc()
+    seconds.observe(0.05)
+
+    def worker():
+        requests.labels('analyze').inc()
+        seconds.observe(0.5)
+
+    for _ in range(3):
+        run_in_worker(worker)
+    assert len(os.listdir(tmp_path)) == 4
+    assert lines(registry) == [
+        '# HELP req_total Requests',
+        '# TYPE req_total counter',
+        'req_total{endpoint="analyze"} 3.0',
+        'req_total{endpoint="warmup"} 1.0',
+        '# HELP req_seconds Latency',
+        '# TYPE req_seconds histogram',
+        'req_seconds_bucket{le="0.1"} 1',
+        'req_seconds_bucket{le="1.0"} 4',
+        'req_seconds_bucket{le="+Inf"} 4',
+        'req_seconds_sum 1.55',
+        'req_seconds_count 4',
+    ]
+
+
+def test_multiprocess_drops_gauges_of_exited_workers(tmp_path):
+    registry = Registry(str(tmp_path))
+    in_flight = registry.gauge('in_flight', 'In flight')
+    handled = registry.counter('handled_total', 'Handled')
+    in_flight.inc()
+
+    def worker():
+        in_flight.inc(5)   # exits without decrementing
+        handled.inc()
+
+    run_in_worker(worker)
+    assert 'in_flight 1.0' in lines(registry)
+    assert 'handled_total 1.0' in lines(registry)
+
+
+def test_multiprocess_store_grows_past_its_first_mapping(tmp_path):
+    registry = Registry(str(tmp_path))
+    counter = registry.counter('many_total', 'Many series', ('key',))
+    for i in range(3000):
+        counter.labels('k' * 20 + str(i)).inc(i)
+    rendered = lines(registry)
+    assert len(rendered) == 3002
+    assert f'many_total{{key="{"k" * 20}2999"}} 2999.0' in rendered
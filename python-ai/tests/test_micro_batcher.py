@@ -0,0 +1,179 @@
+# test_micro_batcher.py
+# MicroBatcher: coalescing concurrent submits, error propagation and when a batch is dispatched
+
+import threading
+import time
+import pytest
+from micro_batcher import MicroBatcher
+
+
+class BatchFn:
+    """Records every batch it is called with; squares the items"""
+
+    def __init__(self, error=None, hold=None):
+        self.batches = []
+        self.error = error
+        self.hold = hold
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        if self.hold is not None:
+            self.hold.wait(5)
+        if self.error is not None:
+            raise self.error
+        return [item * item for item in items]
+
+
+def submit_all(batcher, items):
+    results = [None] * len(items)
+
+    def run(i):
+        try:
+            results[i] = batcher.submit(items[i], timeout=5)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(items))]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def join(threads):
+    for thread in threads:
+        thread.join(5)
+        assert not thread.is_alive()
+
+
+def test_concurrent_submits_share_a_batch():
+    hold = threading.Event()
+    fn = BatchFn(hold=hold)
+    batcher = MicroBatcher(fn, max_batch_size=8, max_wait_ms=0)
+    # The first item occupies the worker; everything queued behind it goes out together
+    first, _ = submit_all(batcher, [1])
+    while not fn.batches:
+        time.sleep(0.001)
+    threads, results = submit_all(batcher, list(range(2, 7)))
+    while batcher.stats()['queued'] < 5:
+        time.sleep(0.001)
+    hold.set()
+    join(first + threads)
+    assert fn.batches[0] == [1]
+    assert sorted(fn.batches[1]) == [2, 3, 4, 5, 6]
+    for item, (result, info) in zip(range(2, 7), results):
+        assert result == item * item
+        assert info['size'] == 5 and info['max_size'] == 8
+    assert batcher.stats()['largest_batch'] == 5
+
+
+def test_batches_are_capped_at_max_batch_size():
+    hold = threading.Event()
+    fn = BatchFn(hold=hold)
+    batcher = MicroBatcher(fn, max_batch_size=3, max_wait_ms=0)
+    first, _ = submit_all(batcher, [0])
+    while not fn.batches:
+        time.sleep(0.001)
+    threads, results = submit_all(batcher, list(range(1, 8)))
+    while batcher.stats()['queued'] < 7:
+        time.sleep(0.001)
+    hold.set()
+    join(first + threads)
+    assert [len(batch) for batch in fn.batches] == [1, 3, 3, 1]
+    assert [result for result, _ in results] == [i * i for i in range(1, 8)]
+
+
+def test_batch_errors_reach_every_caller():
+    hold = threading.Event()
+    fn = BatchFn(error=ValueError('bad batch'), hold=hold)
+    batcher = MicroBatcher(fn, max_batch_size=8, max_wait_ms=0)
+    threads, results = submit_all(batcher, [1, 2, 3])
+    while batcher.stats()['queued'] + sum(map(len, fn.batches)) < 3:
+        time.sleep(0.001)
+    hold.set()
+    join(threads)
+    assert all(isinstance(r, ValueError) and str(r) == 'bad batch' for r in results)
+    assert batcher.stats()['errors'] == len(fn.batches)
+    # The worker survives a failing batch
+    fn.error = None
+    assert batcher.submit(4, timeout=5)[0] == 16
+
+
+def test_wrong_result_count_is_an_error():
+    batcher = MicroBatcher(lambda items: [], max_batch_size=4, max_wait_ms=0)
+    with pytest.raises(RuntimeError, match='returned 0 results for 1 items'):
+        batcher.submit(1, timeout=5)
+
+
+def test_lone_submit_is_not_held_for_max_wait():
+    batcher = MicroBatcher(BatchFn(), max_batch_size=8, max_wait_ms=2000)
+    t0 = time.perf_counter()
+    result, info = batcher.submit(3, timeout=5)
+    assert result == 9 and info['size'] == 1
+    assert time.perf_counter() - t0 < 0.5
+
+
+def test_waits_for_expected_callers():
+    fn = BatchFn()
+    batcher = MicroBatcher(fn, max_batch_size=8, max_wait_ms=2000)
+    submitted = threading.Event()
+    results = {}
+
+    def late():
+        with batcher.expect():
+            submitted.wait(5)
+            time.sleep(0.05)   # e.g. still detecting its face
+            results['late'] = batcher.submit(2, timeout=5)
+
+    thread = threading.Thread(target=late)
+    thread.start()
+    while batcher.stats()['expected'] < 1:
+        time.sleep(0.001)
+    with batcher.expect():
+        submitted.set()
+        results['early'] = batcher.submit(1, timeout=5)
+    join([thread])
+    assert fn.batches == [[1, 2]]
+    assert results['early'][1]['queue_ms'] >= 40
+
+
+def test_expected_caller_that_never_submits_releases_the_batch():
+    fn = BatchFn()
+    batcher = MicroBatcher(fn, max_batch_size=8, max_wait_ms=2000)
+    leave = threading.Event()
+
+    def cache_hit():
+        with batcher.expect():
+            leave.wait(5)
+
+    thread = threading.Thread(target=cache_hit)
+    thread.start()
+    while batcher.stats()['expected'] < 1:
+        time.sleep(0.001)
+    timer = threading.Timer(0.05, leave.set)
+    timer.start()
+    t0 = time.perf_counter()
+    assert batcher.submit(5, timeout=5)[0] == 25
+    elapsed = time.perf_counter() - t0
+    join([thread])
+    assert 0.04 <= elapsed < 1.0
+    assert batcher.stats()['expected'] == 0
+
+
+def test_max_wait_bounds_the_wait_for_expected_callers():
+    batcher = MicroBatcher(BatchFn(), max_batch_size=8, max_wait_ms=50)
+    leave = threading.Event()
+
+    def stuck():
+        with batcher.expect():
+            leave.wait(5)
+
+    thread = threading.Thread(target=stuck)
+    thread.start()
+    while batcher.stats()['expected'] < 1:
+        time.sleep(0.001)
+    t0 = time.perf_counter()
+    result, info = batcher.submit(1, timeout=5)
+    assert 0.04 <= time.perf_counter() - t0 < 1.0
+    assert info['size'] == 1
+    leave.set()
+    join([thread])
@@ -0,0 +1,87 @@
+# test_preprocessing.py
+# FacePreprocessor parity with the validation transform: PIL bilinear Resize + ToTensor + Normalize
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+import preprocessing
+from preprocessing import MEAN, STD, FacePreprocessor
+
+SIZE = 112
+# One grey level after Normalize, on the channel with the smallest std
+ONE_LEVEL = 1.0 / (255.0 * STD.min())
+
+SHAPES = [
+    (100, 100, 3),   # downscale by a non-integer factor
+    (320, 240, 3),   # non-square, different factor per axis
+    (48, 48, 3),     # upscale
+    (97, 131, 3),
+    (SIZE, SIZE, 3),  # no resize
+]
+
+
+def reference(img_bgr, size=SIZE):
+    """EmotionAugmentation(is_training=False): torchvision Resize on a PIL image is PIL's bilinear resize"""
+    rgb = Image.fromarray(cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)).resize((size, size), Image.BILINEAR)
+    tensor = np.asarray(rgb, dtype=np.float32).transpose(2, 0, 1) / 255.0
+    return (tensor - MEAN[:, None, None]) / STD[:, None, None]
+
+
+def frame(shape, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, shape, dtype=np.uint8)
+
+
+@pytest.fixture(params=['torch', 'numpy'])
+def backend(request, monkeypatch):
+    if request.param == 'torch' and preprocessing.torch is None:
+        pytest.skip('PyTorch is not installed')
+    if request.param == 'numpy':
+        monkeypatch.setattr(preprocessing, 'torch', None)
+    return request.param
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+def test_within_one_grey_level_of_pil(backend, shape):
+    for seed in range(3):
+        img = frame(shape, seed)
+        diff = np.abs(FacePreprocessor(SIZE)([img])[0] - reference(img))
+        assert diff.max() <= ONE_LEVEL + 1e-5
+        assert diff.mean() < 0.25 * ONE_LEVEL
+
+
+def test_without_resize_matches_exactly(backend):
+    img = frame((SIZE, SIZE, 3))
+    np.testing.assert_allclose(FacePreprocessor(SIZE)([img])[0], reference(img), atol=1e-5)
+
+
+def test_channel_order_and_batch(backend):
+    images = [frame((90, 90, 3), seed) for seed in range(3)]
+    preprocessor = FacePreprocessor(SIZE)
+    bgr = preprocessor(images).copy()
+    assert bgr.shape == (3, 3, SIZE, SIZE) and bgr.dtype == np.float32
+    rgb = preprocessor([cv2.cvtColor(img, cv2.COLOR_BGR2RGB) for img in images], bgr=False)
+    np.testing.assert_allclose(rgb, bgr, atol=1e-6)
+
+
+def test_grayscale_and_bgra_inputs(backend):
+    img = frame((90, 90, 3))
+    preprocessor = FacePreprocessor(SIZE)
+    expected = preprocessor([img]).copy()
+    np.testing.assert_allclose(preprocessor([cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)]), expected, atol=1e-6)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    out = preprocessor([gray])[0]
+    assert np.abs(out - reference(cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR))).max() <= ONE_LEVEL + 1e-5
+
+
+def test_matches_the_torchvision_transform():
+    transforms = pytest.importorskip('torchvision.transforms')
+    transform = transforms.Compose([
+        transforms.Resize((SIZE, SIZE)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=MEAN.tolist(), std=STD.tolist()),
+    ])
+    for shape in SHAPES:
+        img = frame(shape)
+        expected = transform(Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))).numpy()
+        assert np.abs(FacePreprocessor(SIZE)([img])[0] - expected).max() <= ONE_LEVEL + 1e-5
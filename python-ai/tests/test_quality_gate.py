@@ -0,0 +1,90 @@
+# test_quality_gate.py
+# QualityGate: each rejection reason on a synthetic 640x480 frame, the check order, and the counters
+
+import cv2
+import numpy as np
+import pytest
+from quality_gate import REASONS, QualityGate
+
+
+def textured(seed=0):
+    """Bright, sharp-edged blocks: passes every check"""
+    blocks = np.random.default_rng(seed).integers(0, 256, (60, 80, 3), dtype=np.uint8)
+    return cv2.resize(blocks, (640, 480), interpolation=cv2.INTER_NEAREST)
+
+
+def blank(level=128):
+    return np.full((480, 640, 3), level, dtype=np.uint8)
+
+
+def covered():
+    """A dim, edgeless gradient, like a finger over the lens"""
+    ramp = np.tile(np.linspace(20, 60, 640, dtype=np.float32), (480, 1)).astype(np.uint8)
+    return cv2.cvtColor(ramp, cv2.COLOR_GRAY2BGR)
+
+
+def dark():
+    """The textured scene with the lights off: edges remain, brightness does not"""
+    return textured() // 8
+
+
+def blurred():
+    return cv2.GaussianBlur(textured(), (0, 0), 15)
+
+
+@pytest.fixture
+def gate():
+    return QualityGate()
+
+
+def test_sharp_bright_frame_passes(gate):
+    result = gate.check(textured())
+    assert result['ok'] and result['reason'] is None
+    assert set(result) == {'ok', 'reason', 'brightness', 'contrast', 'sharpness', 'us'}
+
+
+@pytest.mark.parametrize('frame, reason', [
+    (blank(), 'empty'),
+    (blank(0), 'empty'),
+    (covered(), 'covered'),
+    (dark(), 'dark'),
+    (blurred(), 'blurred'),
+])
+def test_rejection_reasons(gate, frame, reason):
+    result = gate.check(frame)
+    assert not result['ok'] and result['reason'] == reason
+
+
+def test_grayscale_frames_are_accepted(gate):
+    assert gate.check(cv2.cvtColor(textured(), cv2.COLOR_BGR2GRAY))['ok']
+    assert gate.check(blank()[:, :, 0])['reason'] == 'empty'
+
+
+def test_small_face_only_when_a_box_is_known(gate):
+    assert gate.check(textured(), face_box=(100, 100, 40, 60))['reason'] == 'small_face'
+    assert gate.check(textured(), face_box=(100, 100, 120, 140))['ok']
+    assert gate.check(textured())['ok']
+
+
+def test_frame_checks_come_before_the_face_size(gate):
+    # A blurred frame is reported as blurred even with a tiny face box
+    assert gate.check(blurred(), face_box=(0, 0, 10, 10))['reason'] == 'blurred'
+
+
+def test_reason_order():
+    gate = QualityGate()
+    # Edgeless and dim reads as covered before dark; edgeless and bright as blurred
+    assert gate.reason({'brightness': 20.0, 'contrast': 5.0, 'sharpness': 50.0}) == 'covered'
+    assert gate.reason({'brightness': 20.0, 'contrast': 5.0, 'sharpness': 5000.0}) == 'dark'
+    assert gate.reason({'brightness': 150.0, 'contrast': 5.0, 'sharpness': 50.0}) == 'blurred'
+    assert gate.reason({'brightness': 150.0, 'contrast': 1.0, 'sharpness': 0.0}) == 'empty'
+
+
+def test_stats_count_each_reason(gate):
+    for frame in (textured(), textured(1), blank(), dark(), blurred(), blurred()):
+        gate.check(frame)
+    stats = gate.stats()
+    assert stats['checked'] == 6 and stats['passed'] == 2
+    assert stats['rejected'] == {'empty': 1, 'covered': 0, 'dark': 1, 'blurred': 2, 'small_face': 0}
+    assert stats['rejected_total'] == 4 and stats['reject_rate'] == pytest.approx(0.667)
+    assert set(stats['rejected']) == set(REASONS)
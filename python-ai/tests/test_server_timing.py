@@ -0,0 +1,193 @@
+# test_server_timing.py
+# Server-Timing header format, X-Request-ID handling, and the on-demand sampling profiler
+
+import re
+import threading
+import time
+import pytest
+from flask import Flask
+import metrics
+import profiler
+import server_timing
+from server_timing import RequestTiming
+
+# RFC 8673 server-timing-metric: token;dur=<ms>, comma separated
+METRIC = re.compile(r'^[A-Za-z0-9_]+;dur=\d+\.\d{2}$')
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [50.0]
+    monkeypatch.setattr(server_timing.time, 'perf_counter', lambda: now[0])
+    return now
+
+
+def test_header_lists_stages_in_run_order_then_total(clock):
+    timing = RequestTiming('r1')
+    timing.add('imdecode', 0.00192)
+    timing.add('resize', 0.0004)
+    timing.add('resize', 0.00001)        # a second resize is summed
+    timing.since('emotion', clock[0] - 0.0123)
+    clock[0] += 0.0375
+    assert timing.header() == 'imdecode;dur=1.92, resize;dur=0.41, emotion;dur=12.30, total;dur=37.50'
+    assert all(METRIC.match(part) for part in timing.header().split(', '))
+
+
+def test_header_of_a_request_with_no_stages(clock):
+    timing = RequestTiming('r1', started=clock[0] - 0.002)
+    assert timing.header() == 'total;dur=2.00'
+
+
+@pytest.mark.parametrize('incoming, kept', [
+    ('abc-123', True),
+    ('trace:7f/span.1@edge+x=y', True),
+    ('x' * 128, True),
+    ('x' * 129, False),
+    ('bad id', False),
+    ('evil\r\nSet-Cookie: a=b', False),
+    ('', False),
+    (None, False),
+])
+def test_request_id_is_echoed_only_when_header_safe(incoming, kept):
+    rid = server_timing.request_id(incoming)
+    if kept:
+        assert rid == incoming
+    else:
+        assert re.match(r'^[0-9a-f]{32}$', rid)
+
+
+def test_metrics_stages_feed_the_active_timing():
+    timing = RequestTiming('r1')
+    token = server_timing.activate(timing)
+    try:
+        assert server_timing.current() is timing
+        metrics.stage('resize').observe(0.003)
+        metrics.cascade_stage('onnx').observe(0.02)
+    finally:
+        server_timing.deactivate(token)
+    assert server_timing.current() is None
+    assert timing.stages == {'resize': 0.003, 'cascade_onnx': 0.02}
+    # With no active timing the histogram is still observed, and nothing else happens
+    metrics.stage('resize').observe(0.001)
+
+
+def test_activation_is_per_thread():
+    timing = RequestTiming('r1')
+    token = server_timing.activate(timing)
+    seen = []
+    try:
+        worker = threading.Thread(target=lambda: seen.append(server_timing.current()))
+        worker.start()
+        worker.join()
+    finally:
+        server_timing.deactivate(token)
+    assert seen == [None]
+
+
+def flask_app():
+    app = Flask(__name__)
+
+    @app.route('/analyze', methods=['POST'])
+    def analyze():
+        metrics.stage('resize').observe(0.001)
+        return {'success': True}
+
+    @app.route('/health')
+    def health():
+        return {'status': 'ok'}
+
+    server_timing.instrument_flask(app)
+    return app
+
+
+def test_flask_headers_on_instrumented_endpoints_only():
+    client = flask_app().test_client()
+    response = client.post('/analyze', headers={'X-Request-ID': 'req-42'})
+    assert response.headers['X-Request-ID'] == 'req-42'
+    parts = response.headers['Server-Timing'].split(', ')
+    assert parts[0] == 'resize;dur=1.00' and parts[-1].startswith('total;dur=')
+    assert all(METRIC.match(part) for part in parts)
+    assert server_timing.current() is None
+
+    response = client.get('/health')
+    assert 'Server-Timing' not in response.headers and 'X-Request-ID' not in response.headers
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(200))
+
+
+def test_profiler_collapses_named_thread_stacks():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop, args=(stop,), name='inference-0')
+    worker.start()
+    try:
+        profile = profiler.SamplingProfiler(interval_ms=2, thread_prefixes=['inference']).run(0.2)
+    finally:
+        stop.set()
+        worker.join()
+    lines = profile.collapsed().splitlines()
+    assert lines and profile.summary()['samples'] > 0
+    for line in lines:
+        stack, count = line.rsplit(' ', 1)
+        frames = stack.split(';')
+        # Root first: thread name, then file:function down to the leaf
+        assert frames[0] == 'inference-0' and int(count) > 0
+    assert any('test_server_timing.py:busy_loop' in line for line in lines)
+
+
+def test_profiler_skips_idle_threads():
+    stop = threading.Event()
+    waiter = threading.Thread(target=stop.wait, name='inference-idle')
+    waiter.start()
+    try:
+        time.sleep(0.01)
+        idle = profiler.SamplingProfiler(thread_prefixes=['inference-idle'])
+        idle.sample()
+        with_idle = profiler.SamplingProfiler(thread_prefixes=['inference-idle'], include_idle=True)
+        with_idle.sample()
+    finally:
+        stop.set()
+        waiter.join()
+    assert idle.samples == 0 and idle.ticks == 1
+    assert with_idle.samples == 1
+
+
+def test_only_one_profile_at_a_time():
+    started = threading.Event()
+
+    def long_profile():
+        started.set()
+        profiler.SamplingProfiler(interval_ms=5).run(0.3)
+
+    first = threading.Thread(target=long_profile)
+    first.start()
+    started.wait()
+    time.sleep(0.05)
+    try:
+        with pytest.raises(profiler.ProfilerBusy):
+            profiler.SamplingProfiler().run(0.01)
+    finally:
+        first.join()
+
+
+def test_profile_options():
+    seconds, options = profiler.profile_options({'seconds': '5', 'interval_ms': '2', 'threads': 'a,b', 'idle': '1'})
+    assert seconds == 5.0
+    assert options == {'interval_ms': 2.0, 'thread_prefixes': ['a', 'b'], 'include_idle': True}
+    _, options = profiler.profile_options({'seconds': '1'}, thread_prefixes=['inference'])
+    assert options['thread_prefixes'] == ['inference'] and not options['include_idle']
+    for bad in ({}, {'seconds': '0'}, {'seconds': str(profiler.PROFILE_MAX_S + 1)},
+                {'seconds': '1', 'interval_ms': '0.5'}):
+        with pytest.raises(ValueError):
+            profiler.profile_options(bad)
+
+
+def test_admin_token_checks():
+    assert profiler.bearer_token({'Authorization': 'Bearer s3cret '}) == 's3cret'
+    assert profiler.bearer_token({'X-Admin-Token': 'other'}) == 'other'
+    assert profiler.authorized('s3cret', 's3cret')
+    assert not profiler.authorized('wrong', 's3cret')
+    # No configured token never authorizes, not even an empty one
+    assert not profiler.authorized('', '') and not profiler.authorized(None, '')
@@ -0,0 +1,76 @@
+# test_snapshot_pacing.py
+# SnapshotPacer: the stability ramp, the backlog override and the [min_ms, max_ms] clamp
+
+import pytest
+from snapshot_pacing import SnapshotPacer
+
+
+@pytest.fixture
+def pacer():
+    return SnapshotPacer(min_ms=500, max_ms=5000, stable_s=60, parallelism=2)
+
+
+@pytest.mark.parametrize('stable_for_s, expected', [
+    (0, 500),        # emotion just changed
+    (15, 1625),      # a quarter of the way up the ramp
+    (30, 2750),
+    (60, 5000),      # stable for stable_s: max_ms
+    (600, 5000),     # and no further
+    (-5, 500),       # clock skew never goes below min_ms
+])
+def test_stability_ramp(pacer, stable_for_s, expected):
+    assert pacer.hint(stable_for_s, backlog=0) == expected
+
+
+def test_backlog_overrides_a_shorter_stability_interval(pacer):
+    # 8 requests x 400 ms over 2 workers: 1.6 s before a new frame would be looked at
+    assert pacer.backlog_ms(backlog=8, cost_ms=400) == pytest.approx(1600)
+    assert pacer.hint(0, backlog=8, cost_ms=400) == 1600
+    # A stable student already waits longer than the backlog
+    assert pacer.hint(60, backlog=8, cost_ms=400) == 5000
+
+
+def test_backlog_is_clamped_to_max_ms(pacer):
+    assert pacer.hint(0, backlog=1000, cost_ms=400) == 5000
+
+
+def test_no_cost_estimate_means_no_backlog(pacer):
+    assert pacer.backlog_ms(backlog=50) == 0.0
+    assert pacer.hint(0) == 500
+
+
+def test_max_ms_below_min_ms_is_raised_to_it():
+    pacer = SnapshotPacer(min_ms=800, max_ms=100, stable_s=10)
+    assert pacer.max_ms == 800
+    assert pacer.hint(0) == pacer.hint(100) == 800
+
+
+def test_begin_end_track_in_flight_and_learn_cost(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('snapshot_pacing.time.perf_counter', lambda: now[0])
+    pacer = SnapshotPacer(min_ms=100, max_ms=10000, stable_s=60, parallelism=1, alpha=0.5)
+    first = pacer.begin()
+    second = pacer.begin()
+    assert pacer.in_flight == 2
+    now[0] += 0.2
+    pacer.end(first)                      # 200 ms
+    assert pacer.cost_ms == pytest.approx(200)
+    now[0] += 0.2
+    pacer.end(second, ran_pipeline=False)  # a cache hit: does not count as a pipeline run
+    assert pacer.in_flight == 0 and pacer.cost_ms == pytest.approx(200)
+    third = pacer.begin()
+    now[0] += 0.4
+    pacer.end(third)                      # EWMA: 200 + 0.5 x (400 - 200)
+    assert pacer.cost_ms == pytest.approx(300)
+    # The live backlog: 5 in flight x 300 ms on one worker
+    for _ in range(5):
+        pacer.begin()
+    assert pacer.hint(0) == 1500
+
+
+def test_stats_report_mean_hint(pacer):
+    pacer.hint(0, backlog=0)
+    pacer.hint(60, backlog=0)
+    stats = pacer.stats()
+    assert stats['hints'] == 2 and stats['mean_hint_ms'] == 2750.0
+    assert stats['parallelism'] == 2
@@ -0,0 +1,132 @@
+# test_stream.py
+# WebSocket /stream sessions of api_server_async: handshake, frame round-trips and bad messages (no models run)
+
+import asyncio
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+import api_server_async
+import api_server_hybrid as hybrid
+
+FRAME = b'\xff\xd8 not decoded by the fake pipeline \xff\xd9'
+
+
+class FakePipeline:
+    """Stands in for api_server_async._analyze; records what each frame was analysed with"""
+
+    def __init__(self):
+        self.calls = []
+        self.status = 200
+
+    def __call__(self, fields, image, started, timing=None, queued=None):
+        self.calls.append((dict(fields), bytes(image)))
+        if self.status != 200:
+            return self.status, {'success': False, 'error': 'invalid image'}
+        return 200, {'success': True, 'studentId': fields['studentId'], 'emotion': 'happy', 'confidence': 91.0}
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    pipeline = FakePipeline()
+    monkeypatch.setattr(api_server_async, '_analyze', pipeline)
+    monkeypatch.setattr(hybrid.warmup, 'state', 'ready')
+    return pipeline
+
+
+def session(script, query=''):
+    """Run `await script(ws)` against a /stream socket of a fresh app"""
+    async def run():
+        async with TestClient(TestServer(api_server_async.create_app())) as client:
+            ws = await client.ws_connect('/stream' + query)
+            try:
+                return await asyncio.wait_for(script(ws), 10)
+            finally:
+                await ws.close()
+    return asyncio.run(run())
+
+
+def test_hello_then_ping(pipeline):
+    async def script(ws):
+        await ws.send_json({'type': 'hello', 'studentId': 's1', 'name': 'Ada', 'classId': 'c1'})
+        ready = await ws.receive_json()
+        await ws.send_json({'type': 'ping'})
+        return ready, await ws.receive_json()
+
+    ready, pong = session(script)
+    assert ready['type'] == 'ready' and ready['studentId'] == 's1' and isinstance(ready['session'], int)
+    assert pong == {'type': 'pong'}
+
+
+def test_query_string_hello_is_answered_on_connect(pipeline):
+    async def script(ws):
+        return await ws.receive_json()
+
+    assert session(script, '?studentId=s2&classId=c2')['studentId'] == 's2'
+
+
+def test_frame_round_trip_and_config(pipeline):
+    async def script(ws):
+        await ws.send_json({'type': 'hello', 'studentId': 's1', 'classId': 'c1'})
+        await ws.receive_json()
+        await ws.send_json({'type': 'config', 'budget_ms': 250})   # no reply
+        await ws.send_bytes(FRAME)
+        first = await ws.receive_json()
+        await ws.send_bytes(FRAME)
+        return first, await ws.receive_json()
+
+    first, repeat = session(script)
+    assert first['type'] == 'result' and first['seq'] == 1
+    assert first['emotion'] == 'happy' and first['studentId'] == 's1'
+    assert isinstance(first['next_snapshot_ms'], int)
+    # The same bytes again reuse the last result without running the pipeline
+    assert repeat['type'] == 'result' and repeat['seq'] == 2 and repeat['repeated'] is True
+    assert pipeline.calls == [({'studentId': 's1', 'classId': 'c1', 'budget_ms': 250}, FRAME)]
+
+
+def test_failed_frame_is_an_error_reply(pipeline):
+    pipeline.status = 400
+
+    async def script(ws):
+        await ws.receive_json()
+        await ws.send_bytes(FRAME)
+        return await ws.receive_json()
+
+    assert session(script, '?studentId=s1') == {'type': 'error', 'seq': 1, 'error': 'invalid image'}
+
+
+@pytest.mark.parametrize('message, error', [
+    ('not json', 'invalid message'),
+    ('[1, 2]', 'invalid message'),
+    ('{"type": "subscribe"}', 'unknown message type subscribe'),
+    ('{"type": "hello", "name": "Ada"}', 'missing studentId'),
+])
+def test_bad_text_messages(pipeline, message, error):
+    async def script(ws):
+        await ws.send_str(message)
+        reply = await ws.receive_json()
+        # The session survives a bad message
+        await ws.send_json({'type': 'ping'})
+        return reply, await ws.receive_json()
+
+    assert session(script) == ({'type': 'error', 'error': error}, {'type': 'pong'})
+
+
+def test_frame_before_hello(pipeline):
+    async def script(ws):
+        await ws.send_bytes(FRAME)
+        return await ws.receive_json()
+
+    assert session(script) == {'type': 'error', 'error': 'send hello with studentId first'}
+    assert pipeline.calls == []
+
+
+def test_frames_while_warming_up_are_turned_away(pipeline, monkeypatch):
+    monkeypatch.setattr(hybrid.warmup, 'state', 'warming')
+
+    async def script(ws):
+        await ws.receive_json()
+        await ws.send_bytes(FRAME)
+        return await ws.receive_json()
+
+    reply = session(script, '?studentId=s1')
+    assert reply['type'] == 'busy' and reply['reason'] == 'warming_up'
+    assert pipeline.calls == []
@@ -0,0 +1,194 @@
+# test_student_state.py
+# Smoothing stores against the dict-of-deques push_buffer they replace, and their eviction rules
+
+import multiprocessing
+import random
+from collections import deque
+import pytest
+import student_state
+from student_state import StudentStateStore
+
+LABELS = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+
+
+class PushBuffer:
+    """The smoothing api_server_hybrid used before StudentStateStore"""
+
+    def __init__(self, window):
+        self.window = window
+        self.buffers = {}
+
+    def push(self, key, label):
+        if key not in self.buffers:
+            self.buffers[key] = deque(maxlen=self.window)
+        self.buffers[key].append(label)
+        counts = {}
+        for e in self.buffers[key]:
+            counts[e] = counts.get(e, 0) + 1
+        return max(counts, key=counts.get)
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(student_state.time, 'time', clock)
+    return clock
+
+
+def assert_matches_push_buffer(store, window, pushes=3000, students=20, seed=0):
+    rng = random.Random(seed)
+    reference = PushBuffer(window)
+    for _ in range(pushes):
+        key = f's{rng.randrange(students)}'
+        # Few labels per run, so ties (earliest in the window wins) come up often
+        label = rng.choice(LABELS[:3])
+        assert store.push(key, label) == reference.push(key, label)
+        assert store.get(key) == list(reference.buffers[key])
+
+
+@pytest.mark.parametrize('window', [1, 2, 3, 5, 8])
+def test_local_store_matches_push_buffer(window):
+    assert_matches_push_buffer(StudentStateStore(window=window, labels=LABELS), window)
+
+
+def test_local_store_learns_new_labels():
+    store = StudentStateStore(window=3, labels=LABELS, max_labels=len(LABELS) + 1)
+    assert store.push('s', 'contempt') == 'contempt'
+    with pytest.raises(ValueError):
+        store.push('s', 'bored')
+
+
+def test_local_store_evicts_least_recently_seen(clock):
+    store = StudentStateStore(window=3, labels=LABELS, max_students=2)
+    store.push('a', 'happy')
+    clock.now += 1
+    store.push('b', 'sad')
+    clock.now += 1
+    store.push('a', 'happy')   # a is now the most recently seen
+    clock.now += 1
+    store.push('c', 'fear')    # table full: b goes
+    assert store.get('b') == []
+    assert store.get('a') == ['happy', 'happy']
+    assert store.get('c') == ['fear']
+    assert len(store) == 2 and store.evictions == 1
+
+
+def test_local_store_expires_idle_students(clock):
+    store = StudentStateStore(window=3, labels=LABELS, ttl_s=60)
+    store.push('a', 'happy', 0.9)
+    store.push('a', 'happy', 0.8)
+    assert store.last_result('a') == {'emotion': 'happy', 'confidence': 0.8, 'age_s': 0.0}
+    clock.now += 61
+    assert store.get('a') == [] and store.last_result('a') is None and store.stable_for('a') == 0.0
+    # A stale window is not voted with: the next frame starts a new one
+    assert store.push('a', 'sad') == 'sad'
+    assert store.get('a') == ['sad']
+    assert store.expirations == 1
+
+
+def test_local_store_reuses_expired_rows_before_evicting(clock):
+    store = StudentStateStore(window=3, labels=LABELS, max_students=2, ttl_s=60)
+    store.push('a', 'happy')
+    store.push('b', 'happy')
+    clock.now += 61
+    store.push('c', 'sad')
+    assert store.evictions == 0 and store.expirations >= 1
+    assert store.get('c') == ['sad']
+
+
+def test_local_store_stable_for_and_forget(clock):
+    store = StudentStateStore(window=3, labels=LABELS)
+    store.push('a', 'happy')
+    clock.now += 5
+    store.push('a', 'happy')
+    assert store.stable_for('a') == pytest.approx(5.0)
+    store.push('a', 'sad')
+    store.push('a', 'sad')     # smoothed label flips to sad here
+    clock.now += 2
+    assert store.stable_for('a') == pytest.approx(2.0)
+    store.forget('a')
+    assert store.get('a') == [] and len(store) == 0
+
+
+@pytest.fixture
+def shared():
+    stores = []
+
+    def create(**kwargs):
+        kwargs.setdefault('labels', LABELS)
+        store = student_state.SharedStudentStateStore(**kwargs)
+        stores.append(store)
+        return store
+
+    yield create
+    for store in stores:
+        store._cleanup()
+
+
+@pytest.mark.parametrize('window', [1, 2, 3, 5, 8])
+def test_shared_store_matches_push_buffer(shared, window):
+    assert_matches_push_buffer(shared(window=window, buckets=64, ways=8), window)
+
+
+def test_shared_store_is_shared_across_forked_workers(shared):
+    store = shared(window=3, buckets=64, ways=8)
+    store.push('a', 'happy', 0.9)
+
+    def worker():
+        store.push('a', 'sad', 0.7)
+        store.push('a', 'sad', 0.6)
+        store.push('b', 'contempt')    # a label the parent has not seen yet
+
+    process = multiprocessing.get_context('fork').Process(target=worker)
+    process.start()
+    process.join(10)
+    assert process.exitcode == 0
+    assert store.get('a') == ['happy', 'sad', 'sad']
+    assert store.last_result('a')['emotion'] == 'sad'
+    assert store.last_result('a')['confidence'] == pytest.approx(0.6)
+    assert store.push('b', 'contempt') == 'contempt'
+    assert len(store) == 2
+
+
+def test_shared_store_evicts_least_recently_seen_in_bucket(shared, clock):
+    store = shared(window=3, buckets=1, ways=2, stripes=1)
+    store.push('a', 'happy')
+    clock.now += 1
+    store.push('b', 'sad')
+    clock.now += 1
+    store.push('a', 'happy')
+    clock.now += 1
+    store.push('c', 'fear')
+    assert store.get('b') == []
+    assert store.get('a') == ['happy', 'happy']
+    assert store.get('c') == ['fear']
+    assert len(store) == 2 and store.stats()['evictions'] == 1
+
+
+def test_shared_store_expires_idle_students(shared, clock):
+    store = shared(window=3, buckets=1, ways=2, stripes=1, ttl_s=60)
+    store.push('a', 'happy', 0.9)
+    store.push('b', 'happy')
+    clock.now += 61
+    assert store.get('a') == [] and store.last_result('a') is None and store.stable_for('a') == 0.0
+    assert len(store) == 0
+    assert store.push('a', 'sad') == 'sad'
+    assert store.get('a') == ['sad']
+    store.push('c', 'fear')    # takes b's expired slot instead of evicting
+    stats = store.stats()
+    assert stats['evictions'] == 0 and stats['expirations'] == 2
+
+
+def test_shared_store_forget(shared):
+    store = shared(window=3, buckets=4, ways=2)
+    store.push('a', 'happy')
+    store.forget('a')
+    assert store.get('a') == [] and len(store) == 0
@@ -0,0 +1,59 @@
+# test_warmup.py
+# ModelWarmup: load() builds without inference (pre-fork master), run() then only infers
+
+from warmup import ModelWarmup
+
+
+class Calls:
+    def __init__(self):
+        self.log = []
+
+    def __call__(self, what, fail=False):
+        def call():
+            self.log.append(what)
+            if fail:
+                raise RuntimeError(f'{what} failed')
+        return call
+
+
+def test_load_runs_no_inference_and_run_does_not_reload():
+    calls = Calls()
+    warmup = ModelWarmup(runs=2).add('emotion', calls('infer'), load=calls('load')).add('detector', calls('detect'))
+    assert warmup.load()
+    assert calls.log == ['load']
+    assert warmup.state == 'loaded' and not warmup.is_ready()
+
+    assert warmup.run()
+    assert calls.log == ['load'] + ['infer'] * 3 + ['detect'] * 3
+    status = warmup.status()
+    assert status['ready'] and set(status['models']['emotion']) == {'load_ms', 'first_ms', 'warm_ms'}
+
+
+def test_run_without_load_loads_first():
+    calls = Calls()
+    warmup = ModelWarmup(runs=1).add('emotion', calls('infer'), load=calls('load'))
+    assert warmup.run()
+    assert calls.log == ['load', 'infer', 'infer']
+
+
+def test_failed_load_is_retried_by_run():
+    calls = Calls()
+    attempts = []
+
+    def load():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError('weights missing')
+
+    warmup = ModelWarmup(runs=1).add('emotion', calls('infer'), load=load)
+    assert not warmup.load()
+    assert warmup.error == 'emotion: weights missing'
+    assert warmup.run() and len(attempts) == 2
+    assert 'error' not in warmup.status() and 'error' not in warmup.status()['models']['emotion']
+
+
+def test_failed_inference_marks_warmup_failed():
+    calls = Calls()
+    warmup = ModelWarmup(runs=1).add('emotion', calls('infer', fail=True))
+    assert not warmup.run()
+    assert warmup.state == 'failed' and warmup.status()['error'] == 'emotion: infer failed'
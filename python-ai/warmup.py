@@ -0,0 +1,140 @@
+# warmup.py
+# Startup model preloading, warm-up inference and readiness tracking
+
+import threading
+import time
+import traceback
+import numpy as np
+import cv2
+
+
+def synthetic_frame(width=640, height=480):
+    """
+    A webcam-sized BGR frame with a face-like pattern, so detectors and the
+    emotion models go through the same code paths as a real snapshot.
+    """
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[:] = np.linspace(60, 190, width, dtype=np.uint8)[None, :, None]
+    cx, cy = width // 2, height // 2
+    fw, fh = width // 6, height // 4
+    cv2.ellipse(frame, (cx, cy), (fw, fh), 0, 0, 360, (150, 170, 210), -1)
+    for dx in (-fw // 2, fw // 2):
+        cv2.circle(frame, (cx + dx, cy - fh // 4), max(2, fw // 8), (40, 40, 40), -1)
+    cv2.ellipse(frame, (cx, cy + fh // 2), (fw // 2, fh // 8), 0, 0, 180, (60, 60, 120), 3)
+    return frame
+
+
+class ModelWarmup:
+    """
+    Loads every registered model once and runs a few inferences on synthetic
+    frames before the server reports ready.
+
+    Each step is (name, load, infer): `load()` builds the model, `infer()`
+    runs one representative inference. The first inference after loading is
+    recorded separately because it includes lazy graph/kernel setup.
+
+    load() builds the models without running them, for a process that will
+    fork before serving; run() in each child then only does the inferences.
+    """
+
+    def __init__(self, runs=3):
+        self.runs = max(1, int(runs))
+        self.steps = []
+        self.state = 'cold'  # cold -> [loaded ->] warming -> ready | failed
+        self.models = {}
+        self._loaded = set()
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def add(self, name, infer, load=None):
+        self.steps.append((name, load, infer))
+        return self
+
+    def load(self):
+        """Build every model without any inference; returns True when all loaded."""
+        ok = True
+        for name, load, infer in self.steps:
+            info = self.models.setdefault(name, {})
+            if load is None or name in self._loaded:
+                continue
+            try:
+                t0 = time.perf_counter()
+                load()
+                info['load_ms'] = round((time.perf_counter() - t0) * 1000.0, 1)
+                self._loaded.add(name)
+                print(f"✓ Loaded {name} in {info['load_ms']} ms")
+            except Exception as e:
+                ok = False
+                info['error'] = str(e)
+                self.error = f"{name}: {e}"
+                print(f"⚠ Loading failed for {name}: {e}")
+                traceback.print_exc()
+        with self._lock:
+            if self.state == 'cold':
+                self.state = 'loaded'
+        return ok
+
+    def run(self):
+        """Warm every step in the calling thread; returns True when all succeeded."""
+        with self._lock:
+            if self.state in ('warming', 'ready'):
+                return self.state == 'ready'
+            self.state = 'warming'
+        self.started_at = time.time()
+        self.error = None
+        ok = True
+        for name, load, infer in self.steps:
+            info = {k: v for k, v in self.models.get(name, {}).items() if k != 'error'}
+            try:
+                if load is not None and name not in self._loaded:
+                    t0 = time.perf_counter()
+                    load()
+                    info['load_ms'] = round((time.perf_counter() - t0) * 1000.0, 1)
+
+                t0 = time.perf_counter()
+                infer()
+                info['first_ms'] = round((time.perf_counter() - t0) * 1000.0, 1)
+
+                timings = []
+                for _ in range(self.runs):
+                    t0 = time.perf_counter()
+                    infer()
+                    timings.append((time.perf_counter() - t0) * 1000.0)
+                info['warm_ms'] = round(float(np.median(timings)), 2)
+                print(f"✓ Warmed {name}: {info}")
+            except Exception as e:
+                ok = False
+                info['error'] = str(e)
+                self.error = f"{name}: {e}"
+                print(f"⚠ Warm-up failed for {name}: {e}")
+                traceback.print_exc()
+            self.models[name] = info
+
+        self.finished_at = time.time()
+        self.state = 'ready' if ok else 'failed'
+        return ok
+
+    def start(self):
+        """Warm up in a background thread so /health answers while models load."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name='model-warmup', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def is_ready(self):
+        return self.state == 'ready'
+
+    def status(self):
+        status = {
+            'ready': self.is_ready(),
+            'state': self.state,
+            'models': self.models,
+        }
+        if self.error:
+            status['error'] = self.error
+        if self.started_at and self.finished_at:
+            status['warmup_s'] = round(self.finished_at - self.started_at, 2)
+        return status